@@ -15,6 +15,7 @@ a = Analysis(
     ],
     hiddenimports=[
         'PyQt5.QtMultimedia',
+        'app',  # gui.py 在后台线程中延迟导入
         'edge_tts',
         'openai.whisper',
         'deep_translator',
@@ -1,13 +1,34 @@
-import whisper
 import os
-from deep_translator import GoogleTranslator
-from edge_tts import Communicate
 import asyncio
+import contextlib
+import functools
 import logging
 import tempfile
+import time
 import torch
-from moviepy.editor import VideoFileClip, AudioFileClip, CompositeVideoClip, concatenate_audioclips, CompositeAudioClip
-from multiprocessing import Pool
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+import presets
+from presets import (CHINESE_VOICES, DECODING_MODES, DEFAULT_PROFILE, MODEL_SIZES, SUBTITLE_MODES,
+                     get_base_filename)
+from tts_engine import SpeechSynthesizer, build_rate_string
+from translation import BatchTranslator, GoogleBackend, TranslationMemory
+from clip_cache import ClipCache
+from audio_cache import AudioCache
+from encoder_probe import DEFAULT_MIN_QUALITY, EncoderProbe
+from segmented_encode import default_workers as default_encode_workers, encode_segmented, plan_segments
+from model_registry import ModelRegistry, inference_lock
+from ffmpeg_utils import mux_audio, render_video, subtitles_filter
+from audio_mixer import SAMPLE_RATE, AudioMixer, audio_duration, remix_ranges
+from transcribe_stream import transcribe_spans, transcribe_windowed
+from dub_manifest import DubManifest, cue_hash, file_digest, manifest_path_for, mix_path_for, prune_mixes
+from srt_model import (Cue, SubtitleTrack, format_timestamp, iter_cues, load_subtitle_style, save_subtitle_style,
+                       subtitle_sibling, write_srt)
+from time_fit import TimeFitter, slot_lengths
+from vad import detect_speech
+from batch_transcribe import BatchTranscriber
+from progress import ProgressReporter, whisper_progress
+from cancellation import Cancelled, CancelToken, removing_on_cancel, run_cancellable
+from tracing import Trace, activate, record_output, report_path_for, span, traced
 
 class LoggerCallback:
     def __init__(self, callback=None):
@@ -38,68 +59,87 @@ else:
 CACHE_DIR = "model_cache"
 os.makedirs(CACHE_DIR, exist_ok=True)
 
-# 创建必要的文件夹
-os.makedirs("uploads", exist_ok=True)
-os.makedirs("subtitles", exist_ok=True)
-os.makedirs("audio", exist_ok=True)
-os.makedirs("output", exist_ok=True)
-
-# Edge TTS 支持的中文语音列表
-CHINESE_VOICES = {
-    # 中国大陆
-    "zh-CN-XiaoyiNeural": "晓伊 - 女声 (大陆标准普通话)",
-    "zh-CN-YunxiNeural": "云希 - 男声 (大陆标准普通话)",
-    "zh-CN-YunjianNeural": "云健 - 男声 (大陆标准普通话)",
-    "zh-CN-YunyangNeural": "云扬 - 男声 (大陆新闻播报)",
-    "zh-CN-XiaochenNeural": "晓辰 - 女声 (大陆标准普通话)",
-    "zh-CN-XiaohanNeural": "晓涵 - 女声 (大陆标准普通话)",
-    "zh-CN-XiaomengNeural": "晓梦 - 女声 (大陆标准普通话)",
-    "zh-CN-XiaomoNeural": "晓墨 - 女声 (大陆标准普通话)",
-    "zh-CN-XiaoxuanNeural": "晓萱 - 女声 (大陆标准普通话)",
-    "zh-CN-XiaoyanNeural": "晓颜 - 女声 (大陆标准普通话)",
-    "zh-CN-XiaoyouNeural": "晓悠 - 女声 (大陆标准普通话)",
-    
-    # 中国香港
-    "zh-HK-HiuGaaiNeural": "晓薇 - 女声 (香港粤语)",
-    "zh-HK-HiuMaanNeural": "晓曼 - 女声 (香港粤语)",
-    "zh-HK-WanLungNeural": "云龙 - 男声 (香港粤语)",
-    
-    # 中国台湾
-    "zh-TW-HsiaoChenNeural": "晓臻 - 女声 (台湾国语)",
-    "zh-TW-YunJheNeural": "云哲 - 男声 (台湾国语)",
-    "zh-TW-HsiaoYuNeural": "晓雨 - 女声 (台湾国语)",
-}
-
-# 延迟加载模型
-model = None
-def get_model(callback=None):
-    global model
+def make_profile(model_size="base", decoding="beam", quantize=False):
+    """
+    生成转录档位（见 presets.make_profile）
+    :param quantize: 是否使用int8动态量化模型，仅在CPU上生效
+    """
+    return presets.make_profile(model_size, decoding, bool(quantize) and DEVICE == "cpu")
+
+# 延迟加载模型：按 (大小, 设备, 精度) 缓存，GUI 启动时可在后台预热
+model_registry = ModelRegistry(CACHE_DIR)
+model_registry.remove_legacy_cache()
+
+def model_dtype(profile=None):
+    profile = profile or DEFAULT_PROFILE
+    if profile["quantize"] and DEVICE == "cpu":
+        return "int8"
+    return "float16" if DEVICE == "cuda" else "float32"
+
+@traced("get_model")
+def get_model(callback=None, profile=None):
     logger = LoggerCallback(callback)
-    if model is None:
-        # 添加模型缓存
-        cache_file = os.path.join(CACHE_DIR, "whisper_model.pt")
-        if os.path.exists(cache_file):
-            model = torch.load(cache_file)
-        else:
-            model = whisper.load_model("base", download_root=CACHE_DIR)
-            torch.save(model, cache_file)
-        logger.info("正在加载Whisper模型...")
-        try:
-            # 尝试加载到GPU
-            if DEVICE == "cuda":
-                model = model.to(DEVICE)
-                logger.info(f"模型已加载到GPU，当前显存使用: {torch.cuda.memory_allocated()/1024**2:.1f}MB")
-        except Exception as e:
-            logger.error(f"GPU加载失败，回退到CPU: {str(e)}")
-            model = whisper.load_model("base", download_root=CACHE_DIR)
-        logger.info("Whisper模型加载完成")
-    return model
+    profile = profile or DEFAULT_PROFILE
+    return model_registry.get(profile["model_size"], DEVICE, model_dtype(profile), logger)
+
+def warmup_model(callback=None, profile=None):
+    """在后台线程中调用，提前加载模型，避免第一次生成字幕时等待"""
+    logger = LoggerCallback(callback)
+    profile = profile or DEFAULT_PROFILE
+    if model_registry.is_loaded(profile["model_size"], DEVICE, model_dtype(profile)):
+        return
+    logger.info("正在后台预加载Whisper模型...")
+    get_model(callback, profile)
+
+# 批量翻译 + 持久化翻译记忆，重复的字幕行和重复处理不再请求网络
+translation_memory = TranslationMemory(os.path.join(CACHE_DIR, "translation_memory.db"))
+translator = BatchTranslator(GoogleBackend(source='en', target='zh-CN'), translation_memory)
 
-translator = GoogleTranslator(source='en', target='zh-CN')
+# TTS 语音片段缓存，按 (文本, 声音, 语速) 内容寻址，修改少量字幕后只需重新合成改动的部分
+clip_cache = ClipCache(os.path.join(CACHE_DIR, "tts_clips"))
 
-def get_base_filename(video_path):
-    """获取不带扩展名的基础文件名"""
-    return os.path.splitext(os.path.basename(video_path))[0]
+# 视频编码器探测结果，按实测速度选择编码器，不再根据 torch 的设备猜测
+encoder_probe = EncoderProbe(os.path.join(CACHE_DIR, "encoder_probe.json"))
+
+# 解码后的视频音轨缓存，语音检测、转录和混音共用同一次解码
+audio_cache = AudioCache(os.path.join(CACHE_DIR, "audio_pcm"))
+
+# 上次的混音，供修改字幕后增量混音；总大小超过上限时淘汰最久未使用的混音
+MIX_DIR = os.path.join(CACHE_DIR, "mixes")
+MIX_CACHE_BYTES = 4 * 1024 * 1024 * 1024
+
+def load_audio(video_path, logger, on_progress=None, cancel_token=None):
+    """
+    取得视频的解码音轨（AudioArtifact），未缓存时解码一次写入缓存
+    视频没有音轨或解码失败时返回 None，调用方改为直接读取视频文件
+    返回的音轨在调用方 close() 之前不会被缓存淘汰
+    :param on_progress: 接收 ProgressEvent 的回调（按已解码的秒数）
+    :param cancel_token: CancelToken，取消时终止解码
+    """
+    artifact = audio_cache.get(video_path)
+    if artifact:
+        return artifact
+    infos = ffmpeg_parse_infos(video_path)
+    if not infos.get("audio_found"):
+        return None
+    logger.info("正在解码音轨...")
+    duration = infos["duration"]
+    reporter = ProgressReporter(on_progress, "extract", duration, "秒")
+    with span("extract_audio") as extract_span:
+        try:
+            artifact = audio_cache.extract(
+                video_path, lambda seconds: reporter.update(min(seconds, duration)), cancel_token
+            )
+        except Cancelled:
+            raise
+        except Exception as e:
+            logger.error(f"音轨解码失败，改为直接读取视频: {str(e)}")
+            extract_span.set(failed=True)
+            return None
+        reporter.finish()
+        for path in artifact.files:
+            extract_span.add_output(path)
+    return artifact
 
 def process_audio(audio_clip, effects=None):
     if effects:
@@ -110,241 +150,536 @@ def process_audio(audio_clip, effects=None):
             audio_clip = audio_clip.audio_fadeout(effects['fade']['out'])
     return audio_clip
 
-def generate_subtitles(video_path, callback=None, subtitle_style=None):
-    logger = LoggerCallback(callback)
-    model = get_model(callback)
+STREAMING_MIN_DURATION = 20 * 60  # 超过该时长（秒）的视频自动使用分窗口转录
+
+def write_segments(srt_path, segments):
+    """逐条写入字幕，segments 可以是生成器，每条写完立即刷新到磁盘"""
+    cues = (Cue.from_seconds(seg["start"], seg["end"], seg["text"].strip()) for seg in segments)
+    write_srt(srt_path, cues, flush=True)
+    record_output(srt_path)
+
+def transcribe_options(profile=None):
+    """Whisper 转录选项"""
+    profile = profile or DEFAULT_PROFILE
+    options = {
+        "language": "en",
+        "fp16": model_dtype(profile) == "float16"  # 在GPU上启用FP16
+    }
+    options.update(DECODING_MODES[profile["decoding"]])
+    return options
+
+VAD_MAX_SPEECH_RATIO = 0.9  # 语音占比高于该值时跳过静音没有收益，直接转录整段音频
+
+def speech_spans(video_path, logger):
+    """
+    语音活动检测预处理，返回语音区间；没有明显可跳过的部分时返回 None
+    :param video_path: 视频文件路径，或解码缓存中 16kHz 的 PcmTrack
+    """
+    started = time.perf_counter()
+    spans, duration = detect_speech(video_path)
+    speech = sum(end - start for start, end in spans)
+    ratio = speech / duration if duration else 1.0
+    logger.info(
+        f"语音检测: {len(spans)} 段语音，占总时长 {ratio * 100:.0f}%，"
+        f"耗时 {time.perf_counter() - started:.1f}秒"
+    )
+    if ratio > VAD_MAX_SPEECH_RATIO:
+        return None
+    return spans
+
+def cancellable_segments(segments, cancel_token):
+    """流式转录时同样在 Whisper 的每个 30 秒解码窗口处检查暂停和取消"""
+    with whisper_progress(None, cancel_token):
+        yield from segments
+
+def transcribe_segments(model, source, options, logger, streaming, window_seconds=300, vad=True,
+                        reporter=None, cancel_token=None):
+    """
+    返回转录片段的可迭代对象；streaming 时分窗口转录并逐条产出
+    vad 时只转录检测到的语音区间（按组拼接，同样逐条产出），时间戳映射回原视频时间轴
+    :param source: 视频文件路径，或解码缓存中 16kHz 的 PcmTrack（不再启动 ffmpeg）
+    :param reporter: ProgressReporter，按已转录的音频秒数报告进度
+    :param cancel_token: CancelToken，在每个解码窗口处检查暂停和取消
+    """
+    reporter = reporter or ProgressReporter(None, "transcribe", 0)
+    cancel_token = cancel_token or CancelToken()
+    from_file = isinstance(source, str)
+    spans = speech_spans(source, logger) if vad else None
+    cancel_token.check()
+    if not streaming and spans is None:
+        with whisper_progress(reporter, cancel_token), inference_lock(model):
+            return model.transcribe(source if from_file else source.mono(), **options)["segments"]
     
-    try:
-        # 设置转录选项
-        options = {
-            "language": "en",
-            "beam_size": 5,
-            "best_of": 5,
-            "fp16": DEVICE == "cuda"  # 在GPU上启用FP16
-        }
-        
-        # 如果是GPU，先清理显存
-        if DEVICE == "cuda":
-            torch.cuda.empty_cache()
-            logger.info(f"开始转录前显存使用: {torch.cuda.memory_allocated()/1024**2:.1f}MB")
-        
-        # 确保音频数据在正确的设备上
-        result = model.transcribe(video_path, **options)
-        
-        # 再次清理显存
-        if DEVICE == "cuda":
-            torch.cuda.empty_cache()
-            logger.info(f"转录完成后显存使用: {torch.cuda.memory_allocated()/1024**2:.1f}MB")
-        
-        # 使用源文件名生成字幕文件名
-        base_name = get_base_filename(video_path)
-        srt_path = os.path.join("subtitles", f"{base_name}_en.srt")
+    duration = ffmpeg_parse_infos(source)["duration"] if from_file else source.duration
+    def on_window(position):
+        percent = min(100.0, position / duration * 100) if duration else 100.0
+        logger.info(f"转录进度: {percent:.1f}% ({format_timestamp(position)})")
+        reporter.update(min(position, duration))
+    if spans is not None:
+        logger.info("跳过静音部分，只转录语音区间...")
+        segments = transcribe_spans(model, source, options, spans, window_seconds, on_group=on_window)
+    else:
+        logger.info(f"使用分窗口转录，每个窗口 {window_seconds} 秒...")
+        segments = transcribe_windowed(model, source, options, window_seconds, on_window=on_window)
+    return cancellable_segments(segments, cancel_token)
+
+@traced("generate_subtitles")
+def generate_subtitles(video_path, callback=None, subtitle_style=None, streaming=None, window_seconds=300,
+                       profile=None, vad=True, batched=False, on_progress=None, cancel_token=None):
+    """
+    生成英文字幕
+    :param streaming: 是否分窗口流式转录（内存占用与视频时长无关，字幕边转录边写入）；
+                      None 表示超过 STREAMING_MIN_DURATION 的视频自动启用
+    :param window_seconds: 分窗口转录时每个窗口的长度（秒）
+    :param profile: 转录档位（模型大小、解码方式、是否int8量化），见 make_profile
+    :param vad: 先做语音活动检测，跳过静音、片头片尾等非语音部分
+    :param batched: 使用批量解码引擎（见 generate_subtitles_many）
+    :param on_progress: 接收 ProgressEvent 的回调
+    :param cancel_token: CancelToken，取消时删除未写完的字幕文件并抛出 Cancelled
+    :param subtitle_style: 字幕样式（见 presets.DEFAULT_SUBTITLE_STYLE），保存在字幕旁，合并视频烧录字幕时使用
+    """
+    if subtitle_style:
         os.makedirs("subtitles", exist_ok=True)
+        save_subtitle_style(os.path.join("subtitles", f"{get_base_filename(video_path)}_en.srt"), subtitle_style)
+    if batched:
+        return generate_subtitles_many([video_path], callback, profile, vad,
+                                       on_progress=on_progress, cancel_token=cancel_token)[0]
+    logger = LoggerCallback(callback)
+    model = get_model(callback, profile)
+    options = transcribe_options(profile)
+    # 音轨只解码一次，语音检测、转录和之后的混音都读取同一份缓存
+    audio = load_audio(video_path, logger, on_progress, cancel_token)
+    source = audio.speech if audio else video_path
+    duration = audio.duration if audio else ffmpeg_parse_infos(video_path)["duration"]
+    if streaming is None:
+        streaming = duration > STREAMING_MIN_DURATION
+    reporter = ProgressReporter(on_progress, "transcribe", duration, "秒音频")
+    
+    # 使用源文件名生成字幕文件名
+    base_name = get_base_filename(video_path)
+    srt_path = os.path.join("subtitles", f"{base_name}_en.srt")
+    os.makedirs("subtitles", exist_ok=True)
+    
+    with removing_on_cancel(srt_path):
+        try:
+            # 如果是GPU，先清理显存
+            if DEVICE == "cuda":
+                torch.cuda.empty_cache()
+                logger.info(f"开始转录前显存使用: {torch.cuda.memory_allocated()/1024**2:.1f}MB")
         
-        def format_timestamp(seconds):
-            hours = int(seconds // 3600)
-            minutes = int((seconds % 3600) // 60)
-            secs = int(seconds % 60)
-            millis = int((seconds - int(seconds)) * 1000)
-            return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
+            write_segments(srt_path, transcribe_segments(
+                model, source, options, logger, streaming, window_seconds, vad, reporter, cancel_token
+            ))
+            reporter.finish()
         
-        with open(srt_path, "w", encoding="utf-8") as f:
-            for i, seg in enumerate(result["segments"], 1):
-                start = format_timestamp(seg["start"])
-                end = format_timestamp(seg["end"])
-                text = seg["text"].strip()
-                f.write(f"{i}\n{start} --> {end}\n{text}\n\n")
-        return srt_path
-
-    except Exception as e:
-        logger.error(f"字幕生成失败: {str(e)}")
-        if DEVICE == "cuda":
-            # 如果GPU失败，尝试使用CPU
-            logger.info("尝试使用CPU重新生成...")
-            # 将模型移回CPU
-            model = model.to("cpu")
-            result = model.transcribe(video_path, **options)
-            base_name = get_base_filename(video_path)
-            srt_path = os.path.join("subtitles", f"{base_name}_en.srt")
-            os.makedirs("subtitles", exist_ok=True)
-            with open(srt_path, "w", encoding="utf-8") as f:
-                for i, seg in enumerate(result["segments"], 1):
-                    start = format_timestamp(seg["start"])
-                    end = format_timestamp(seg["end"])
-                    text = seg["text"].strip()
-                    f.write(f"{i}\n{start} --> {end}\n{text}\n\n")
+            # 再次清理显存
+            if DEVICE == "cuda":
+                torch.cuda.empty_cache()
+                logger.info(f"转录完成后显存使用: {torch.cuda.memory_allocated()/1024**2:.1f}MB")
             return srt_path
-        else:
+
+        except Cancelled:
             raise
+        except Exception as e:
+            logger.error(f"字幕生成失败: {str(e)}")
+            if DEVICE == "cuda":
+                # 如果GPU失败，尝试使用CPU
+                logger.info("尝试使用CPU重新生成...")
+                # 从注册表取单独的CPU模型，不能就地移动注册表中缓存的GPU模型（其他任务仍按GPU/FP16使用它）
+                model = model_registry.get((profile or DEFAULT_PROFILE)["model_size"], "cpu", "float32", logger)
+                options["fp16"] = False
+                write_segments(srt_path, transcribe_segments(
+                    model, source, options, logger, streaming, window_seconds, vad, reporter, cancel_token
+                ))
+                reporter.finish()
+                return srt_path
+            else:
+                raise
+        finally:
+            # 释放音轨的内存映射，解码缓存才能淘汰它；之后的混音会重新从缓存取得
+            if audio:
+                audio.close()
+
+@traced("generate_subtitles")
+def generate_subtitles_many(video_paths, callback=None, profile=None, vad=True, batch_size=None,
+                            on_progress=None, cancel_token=None):
+    """
+    批量生成多个视频的英文字幕：所有视频的语音窗口叠成批次一起解码，充分利用 GPU/多核 CPU
+    :param batch_size: 每批窗口数，None 表示按显存或线程数自适应
+    :param on_progress: 接收 ProgressEvent 的回调，按所有视频累计已解码的音频秒数报告
+    :param cancel_token: CancelToken，在解码音轨时和每批解码之前检查暂停和取消
+    :return: 与 video_paths 顺序一致的字幕文件路径
+    """
+    logger = LoggerCallback(callback)
+    cancel_token = cancel_token or CancelToken()
+    model = get_model(callback, profile)
+    sources, artifacts = [], []
+    try:
+        for index, video_path in enumerate(video_paths):
+            audio = load_audio(video_path, logger, on_progress, cancel_token)
+            if audio:
+                artifacts.append(audio)
+            source = audio.speech if audio else video_path
+            spans = speech_spans(source, logger) if vad else None
+            if spans is None:
+                spans = [(0.0, audio.duration if audio else ffmpeg_parse_infos(video_path)["duration"])]
+            sources.append((index, source, spans))
+            cancel_token.check()
+        
+        total = sum(end - start for _, _, spans in sources for start, end in spans)
+        reporter = ProgressReporter(on_progress, "transcribe", total, "秒音频")
+        transcriber = BatchTranscriber(model, transcribe_options(profile), DEVICE, batch_size, logger, cancel_token)
+        logger.info(f"批量转录 {len(video_paths)} 个视频，批大小 {transcriber.batch_size}...")
+        # 批次中插入的静音也计入已解码秒数，进度不超过总语音时长
+        results = transcriber.transcribe_many(sources, on_batch=lambda seconds: reporter.update(min(seconds, total)))
+        reporter.finish()
+        logger.info(f"批量转录完成，平均吞吐 {transcriber.throughput:.1f} 秒音频/秒")
+    finally:
+        for audio in artifacts:
+            audio.close()
+    
+    os.makedirs("subtitles", exist_ok=True)
+    srt_paths = []
+    for index, video_path in enumerate(video_paths):
+        srt_path = os.path.join("subtitles", f"{get_base_filename(video_path)}_en.srt")
+        write_segments(srt_path, results[index])
+        srt_paths.append(srt_path)
+    return srt_paths
 
-def translate_subtitles(en_srt, callback=None):
+@traced("translate_subtitles")
+def translate_subtitles(en_srt, callback=None, batch_translator=None, on_progress=None, cancel_token=None):
+    """
+    翻译英文字幕
+    :param batch_translator: BatchTranslator，默认使用模块级的 Google 翻译 + 翻译记忆
+    :param on_progress: 接收 ProgressEvent 的回调
+    :param cancel_token: CancelToken，每批翻译请求之前检查暂停和取消
+    """
     logger = LoggerCallback(callback)
+    batch_translator = batch_translator or translator
     # 从英文字幕文件名获取基础文件名
     base_name = get_base_filename(en_srt.replace("_en.srt", ""))
     cn_srt = os.path.join("subtitles", f"{base_name}_cn.srt")
+    os.makedirs("subtitles", exist_ok=True)
     
-    with open(en_srt, "r", encoding="utf-8") as f:
-        lines = f.readlines()
+    track = SubtitleTrack.read(en_srt)
+    reporter = ProgressReporter(on_progress, "translate", len(track), "条")
+    reporter.update(0, force=True)
     
-    with open(cn_srt, "w", encoding="utf-8") as f:
-        i = 0
-        while i < len(lines):
-            if lines[i].strip().isdigit():
-                f.write(lines[i])  # 序号
-                f.write(lines[i+1])  # 时间轴
-                text = lines[i+2].strip()
-                translated = translator.translate(text)
-                f.write(f"{translated}\n\n")
-                i += 4
-            else:
-                i += 1
+    stats_before = batch_translator.stats()
+    translated = batch_translator.translate_many([cue.plain_text for cue in track], cancel_token)
+    stats = batch_translator.stats()
+    logger.info(
+        f"翻译完成: 记忆库命中 {stats['hits'] - stats_before['hits']} 条, "
+        f"未命中 {stats['misses'] - stats_before['misses']} 条, "
+        f"网络请求 {stats['requests'] - stats_before['requests']} 次"
+    )
+    
+    track.with_texts(translated).write(cn_srt)
+    record_output(cn_srt)
+    reporter.finish()
     return cn_srt
 
-async def generate_speech(cn_srt, voice_id, callback=None, speed_rate=1.5):
+@traced("generate_speech")
+async def generate_speech(cn_srt, voice_id, callback=None, speed_rate=1.5,
+                          concurrency=4, rate_limit=None, max_retries=3,
+                          communicate_factory=None, use_cache=True, fit_mode="rate", on_progress=None,
+                          cancel_token=None):
+    """
+    根据中文字幕并发生成语音片段
+    :param concurrency: 同时进行的 TTS 请求数
+    :param rate_limit: 每秒最多发起的 TTS 请求数，None 表示不限速
+    :param max_retries: 每条字幕的最大尝试次数（失败后指数退避重试）
+    :param use_cache: 是否使用语音片段缓存，命中的字幕不再重新合成
+    :param fit_mode: 把每条语音适配到字幕时长内的方式（见 time_fit.FIT_MODES），None 表示不适配
+    :param on_progress: 接收 ProgressEvent 的回调
+    :param cancel_token: CancelToken，取消时中止正在进行的请求并删除本次生成的语音片段
+    :return: [(audio_file, cue), ...]，顺序与字幕一致
+    """
+    cancel_token = cancel_token or CancelToken()
     logger = LoggerCallback(callback)
-    audio_files = []
     # 从中文字幕文件名获取基础文件名
     base_name = get_base_filename(cn_srt.replace("_cn.srt", ""))
     os.makedirs("audio", exist_ok=True)
     
-    with open(cn_srt, "r", encoding="utf-8") as f:
-        lines = f.readlines()
+    # 收集需要合成的字幕
+    cues = []
+    for cue in iter_cues(cn_srt):
+        text = cue.plain_text
+        if text:
+            audio_file = os.path.join("audio", f"{base_name}_speech_{len(cues)}.mp3")
+            cues.append((text, cue, audio_file))
     
-    i = 0
-    total_lines = len(lines)
-    max_retries = 3  # 最大重试次数
-    retry_delay = 2  # 重试延迟（秒）
+    rate_str = build_rate_string(speed_rate)
+    logger.info(f"共 {len(cues)} 条字幕，并发数: {concurrency}")
+    synthesizer = SpeechSynthesizer(
+        voice_id,
+        rate_str,
+        concurrency=concurrency,
+        rate_limit=rate_limit,
+        max_retries=max_retries,
+        communicate_factory=communicate_factory,
+        logger=logger,
+        cache=clip_cache if use_cache else None,
+        cancel_token=cancel_token
+    )
+    # 取消时删除本次写出的片段（缓存中的片段不在 audio 目录下，不受影响）
+    partial_files = []
+    for _, _, audio_file in cues:
+        stem = os.path.splitext(audio_file)[0]
+        partial_files += [audio_file, stem + "_fit.mp3", stem + "_fit.wav"]
+    cache_stats = clip_cache.stats()
+    with removing_on_cancel(*partial_files):
+        try:
+            reporter = ProgressReporter(on_progress, "tts", len(cues), "条")
+            results = await run_cancellable(synthesizer.synthesize(
+                [(text, audio_file) for text, _, audio_file in cues],
+                on_progress=lambda done, total: reporter.update(done)
+            ), cancel_token)
+        except Cancelled:
+            raise
+        except Exception:
+            logger.error(f"语速设置: {speed_rate}")
+            raise
+        
+        if use_cache:
+            hits = clip_cache.stats()["hits"] - cache_stats["hits"]
+            logger.info(f"语音缓存命中 {hits} 条，新合成 {len(cues) - hits} 条")
+        
+        if fit_mode:
+            # 长句不再与下一条字幕重叠，短句不再被统一的倍速压得过快
+            fitter = TimeFitter(synthesizer, speed_rate, fit_mode, logger=logger)
+            slots = slot_lengths([cue for _, cue, _ in cues])
+            results = await run_cancellable(fitter.fit([
+                (text, clip, slot, audio_file) for (text, _, audio_file), clip, slot in zip(cues, results, slots)
+            ]), cancel_token)
     
-    while i < total_lines:
-        if lines[i].strip().isdigit():
-            text = lines[i+2].strip()
-            if text:
-                for retry in range(max_retries):
-                    try:
-                        # 修改语速设置逻辑
-                        rate_str = ""
-                        if speed_rate != 1.0:  # 只有当速率不是1.0时才设置rate参数
-                            percentage = int((speed_rate - 1.0) * 100)
-                            rate_str = f"+{percentage}%" if percentage > 0 else f"{percentage}%"
-                        
-                        # 根据是否有速率参数来创建communicate对象
-                        if rate_str:
-                            communicate = Communicate(text, voice_id, rate=rate_str)
-                        else:
-                            communicate = Communicate(text, voice_id)
-                            
-                        audio_file = os.path.join("audio", f"{base_name}_speech_{len(audio_files)}.mp3")
-                        await communicate.save(audio_file)
-                        audio_files.append((audio_file, lines[i+1].strip()))
-                        logger.info(f"已生成 {len(audio_files)} 个语音片段...")
-                        break  # 成功生成，跳出重试循环
-                    except Exception as e:
-                        if retry < max_retries - 1:  # 如果还有重试机会
-                            logger.info(f"语音生成失败，{retry + 1}/{max_retries} 次重试...")
-                            await asyncio.sleep(retry_delay)  # 等待一段时间后重试
-                        else:  # 最后一次重试也失败
-                            logger.error(f"语音生成失败: {str(e)}")
-                            logger.error(f"语速设置: {speed_rate}")
-                            logger.error(f"Rate字符串: {rate_str if 'rate_str' in locals() else 'None'}")
-                            logger.error(f"Voice ID: {voice_id}")
-                            logger.error(f"文本内容: {text}")
-                            raise  # 重新抛出异常
-            i += 4
-        else:
-            i += 1
-    return audio_files
+    return [(audio_file, cue) for audio_file, (_, cue, _) in zip(results, cues)]
+
+def encode_video(video_path, mix_path, output_path, logger, on_progress=None, cancel_token=None,
+                 min_quality=DEFAULT_MIN_QUALITY, workers=None, video_filters=(), subtitle_tracks=()):
+    """
+    重新编码视频（较慢，仅在需要时使用）
+    由 ffmpeg 直接完成解码、编码和封装（见 ffmpeg_utils.render_video），视频帧不经过 Python；
+    足够长的视频按关键帧分段，由多个 ffmpeg 进程并行编码后无损拼接（见 segmented_encode）
+    编码器按 encoder_probe 的实测结果选择；编码失败时先用合成视频重新测试该编码器，
+    确认是编码器的问题才换用下一个已验证可用的编码器，否则直接报错，不盲目重跑整个编码
+    :param on_progress: 接收 ProgressEvent 的回调（按已编码的秒数）
+    :param cancel_token: CancelToken，取消时终止 ffmpeg 并删除写了一半的输出文件
+    :param min_quality: 编码器的最低质量等级（1-3），见 encoder_probe.CANDIDATES
+    :param workers: 分段并行编码的进程数，None 表示 segmented_encode.default_workers()，1 表示不分段
+    :param video_filters: 编码时附加的视频滤镜（如烧录字幕），见 ffmpeg_utils.render_video
+    :param subtitle_tracks: 同时封装的软字幕轨道，见 ffmpeg_utils.subtitle_track_args
+    """
+    encoder = encoder_probe.choose(min_quality, logger=logger)
+    duration = ffmpeg_parse_infos(video_path)["duration"]
+    workers = default_encode_workers() if workers is None else workers
+    reporter = ProgressReporter(on_progress, "encode", duration, "秒")
+    report = lambda seconds: reporter.update(min(seconds, duration))
+    
+    with removing_on_cancel(output_path):
+        failed = set()
+        while True:
+            logger.info(f"使用编码器 {encoder} 进行视频编码（实测 {encoder_probe.fps(encoder):.0f} 帧/秒）...")
+            try:
+                if plan_segments(duration, workers, encoder)[1] > 1:
+                    encode_segmented(video_path, mix_path, output_path, encoder, duration, workers,
+                                     on_progress=report, cancel_token=cancel_token, logger=logger,
+                                     video_filters=video_filters, subtitle_tracks=subtitle_tracks)
+                else:
+                    render_video(video_path, mix_path, output_path, encoder, video_filters,
+                                 on_progress=report, cancel_token=cancel_token, subtitle_tracks=subtitle_tracks)
+                reporter.finish()
+                break
+            except Cancelled:
+                raise
+            except Exception as e:
+                logger.error(f"视频编码失败: {str(e)}")
+                if encoder_probe.recheck(encoder):
+                    # 编码器本身正常，失败原因在输入或磁盘等，换编码器重跑也无济于事
+                    raise
+                failed.add(encoder.key)
+                fallback = encoder_probe.choose(min_quality, exclude=failed)
+                if fallback.key in failed:
+                    raise
+                logger.info(f"编码器 {encoder} 已不可用，改用 {fallback} 重新编码...")
+                encoder = fallback
+
+def manifest_settings(video_path, original_volume, reencode):
+    """工程清单中的全局设置，任意一项变化都需要完整重新混音"""
+    return {
+        "video": os.path.abspath(video_path),
+        "video_size": os.path.getsize(video_path),
+        "video_mtime": os.path.getmtime(video_path),
+        "original_volume": original_volume,
+        "mix_fps": SAMPLE_RATE,
+        "reencode": reencode
+    }
 
-def merge_video_audio(video_path, audio_files, cn_srt, callback=None, original_volume=0.1):
+@contextlib.contextmanager
+def open_original_audio(video_path, audio_found, logger, on_progress=None, cancel_token=None):
+    """
+    混音时读取的原音轨：转录时已解码的缓存音轨（不再重新解码视频），用完后释放内存映射
+    视频没有音轨时为 None，缓存不可用时为视频文件路径
+    """
+    if not audio_found:
+        yield None
+        return
+    audio = load_audio(video_path, logger, on_progress, cancel_token)
+    try:
+        yield audio.mix if audio else video_path
+    finally:
+        if audio:
+            audio.close()
+
+@traced("merge_video_audio")
+def merge_video_audio(video_path, audio_files, cn_srt, callback=None, original_volume=0.1, incremental=True,
+                      reencode=False, on_progress=None, cancel_token=None, encode_workers=None, subtitles="none",
+                      subtitle_style=None):
+    """
+    合并视频和配音
+    :param incremental: 根据字幕旁的工程清单只重新混音改动过的时间区间，字幕未改动时直接复用上次的输出
+    :param reencode: 是否重新编码视频；默认只替换音轨、视频流直接复制，复制失败时自动改为重新编码
+    :param on_progress: 接收 ProgressEvent 的回调（混音按字幕条数，封装/编码按输出时长或帧数）
+    :param cancel_token: CancelToken，在每条字幕、每个音频块和每帧处检查；取消时终止 ffmpeg 并删除未完成的文件
+    :param encode_workers: 重新编码时并行编码的 ffmpeg 进程数，见 encode_video
+    :param subtitles: 输出视频中的字幕，见 presets.SUBTITLE_MODES：
+                      soft 把中英文 SRT 作为 mov_text 字幕轨道随封装写入（不重新编码），
+                      burn 在重新编码的同一次 ffmpeg 运行中烧录中文字幕
+    :param subtitle_style: 烧录字幕的样式，None 表示使用 generate_subtitles 保存在字幕旁的样式
+    """
+    if subtitles not in SUBTITLE_MODES:
+        raise ValueError(f"不支持的字幕方式: {subtitles}")
+    cancel_token = cancel_token or CancelToken()
     logger = LoggerCallback(callback)
-    def parse_timestamp(timestamp):
-        h, m, s = timestamp.split(':')
-        s, ms = s.split(',')
-        return int(h) * 3600 + int(m) * 60 + int(s) + int(ms) / 1000
     
-    video = VideoFileClip(video_path)
-    original_audio = video.audio
+    # 字幕与视频、音轨在同一次 ffmpeg 运行中写入，不额外解码或编码
+    subtitle_tracks, video_filters, subtitle_info = [], [], None
+    if subtitles == "soft":
+        subtitle_tracks = [(cn_srt, "chi", "中文")]
+        en_srt = subtitle_sibling(cn_srt, "en.srt")
+        if os.path.exists(en_srt):
+            subtitle_tracks.append((en_srt, "eng", "English"))
+        subtitle_info = {"mode": subtitles, "files": [file_digest(path) for path, _, _ in subtitle_tracks]}
+    elif subtitles == "burn":
+        style = subtitle_style or load_subtitle_style(cn_srt)
+        video_filters = [subtitles_filter(cn_srt, style)]
+        subtitle_info = {"mode": subtitles, "files": [file_digest(cn_srt)], "style": style}
+        if not reencode:
+            logger.info("烧录字幕需要重新编码视频")
+            reencode = True
+    
+    # 只读取视频信息，不打开任何解码进程
+    infos = ffmpeg_parse_infos(video_path)
+    duration = infos["duration"]
+    original_audio = functools.partial(
+        open_original_audio, video_path, infos.get("audio_found"), logger, on_progress, cancel_token
+    )
+    base_name = get_base_filename(video_path)
+    os.makedirs(MIX_DIR, exist_ok=True)
+    mix_path = mix_path_for(base_name, MIX_DIR)
+    
+    # 读取上次的工程清单
+    manifest_path = manifest_path_for(cn_srt)
+    previous = DubManifest.load(manifest_path) if incremental else None
+    known_durations = previous.durations() if previous else {}
+    settings = manifest_settings(video_path, original_volume, reencode)
     
-    audio_segments = []
-    for audio_file, timing in audio_files:
-        start, end = timing.split(' --> ')
-        start_time = parse_timestamp(start)
-        end_time = parse_timestamp(end)
-        audio_clip = AudioFileClip(audio_file)
-        audio_segments.append(audio_clip.set_start(start_time))
-
-    if audio_segments:
-        new_audio = CompositeAudioClip([original_audio.volumex(original_volume)] + audio_segments)
-        final_video = video.set_audio(new_audio)
+    # 计算每条字幕的哈希，未改动的字幕直接沿用记录的时长
+    cues = []
+    for audio_file, cue in audio_files:
+        start_time = cue.start
+        cue_id = cue_hash(start_time, file_digest(audio_file))
+        cues.append({
+            "hash": cue_id,
+            "clip": audio_file,
+            "start": start_time,
+            "duration": known_durations.get(cue_id)
+        })
+    
+    ranges = None
+    if previous and previous.can_reuse(settings):
+        # 改动过的字幕只读取语音片段的文件头得到时长，用于计算需要重新混音的区间
+        for cue in cues:
+            if cue["duration"] is None:
+                cue["duration"] = audio_duration(cue["clip"])
+        ranges = previous.changed_ranges(cues, duration)
+    
+    temp_mix = mix_path + ".tmp.wav"
+    if ranges is None:
+        logger.info("正在混合音频...")
+        with span("mix", cues=len(cues)) as mix_span, removing_on_cancel(temp_mix), \
+                original_audio() as original_path:
+            mixer = AudioMixer(duration)
+            reporter = ProgressReporter(on_progress, "mix", len(cues), "条")
+            try:
+                for done, cue in enumerate(cues, 1):
+                    cancel_token.check()
+                    cue["duration"] = mixer.place_file(cue["clip"], cue["start"])
+                    reporter.update(done)
+                mixer.write(temp_mix, original_path, original_volume, checkpoint=cancel_token.check)
+            finally:
+                mixer.close()
+            mix_span.add_output(temp_mix)
+    elif (not ranges and previous.output_path and os.path.exists(previous.output_path)
+          and previous.subtitles == subtitle_info):
+        logger.info("字幕未改动，直接复用上次的配音视频")
+        cleanup_speech_files(audio_files, logger)
+        return previous.output_path
     else:
-        final_video = video
-
+        changed = sum(end - start for start, end in ranges)
+        logger.info(f"检测到 {len(ranges)} 处改动，仅重新混音 {changed:.1f} 秒音频...")
+        with span("remix", ranges=len(ranges), seconds=round(changed, 3)) as mix_span, \
+                removing_on_cancel(temp_mix), original_audio() as original_path:
+            remix_ranges(
+                previous.mix_path, temp_mix, ranges,
+                [(cue["clip"], cue["start"]) for cue in cues],
+                original_path, original_volume, checkpoint=cancel_token.check
+            )
+            mix_span.add_output(temp_mix)
+    os.replace(temp_mix, mix_path)
+    prune_mixes(MIX_DIR, MIX_CACHE_BYTES, keep=mix_path)
+    
     # 使用源文件名生成输出文件名
-    base_name = get_base_filename(video_path)
     output_path = os.path.join("output", f"{base_name}_dubbed.mp4")
     os.makedirs("output", exist_ok=True)
     
     logger.info("正在生成最终视频文件...")
     
-    # 基本编码参数
-    write_options = {
-        'codec': 'libx264',
-        'audio_codec': 'aac',
-        'audio_bitrate': '192k',
-        'threads': 8,
-        'fps': video.fps,
-        'preset': 'medium',
-        'ffmpeg_params': [
-            '-movflags', '+faststart',
-            '-crf', '18'  # 较高质量的CRF值
-        ]
-    }
-    
-    if DEVICE == "cuda":
-        try:
-            # NVIDIA GPU 加速参数
-            write_options.update({
-                'codec': 'h264_nvenc',
-                'preset': 'hq',        # 使用高质量预设
-                'ffmpeg_params': [
-                    '-movflags', '+faststart',
-                    '-rc:v', 'vbr',    # 可变比特率
-                    '-profile:v', 'high',
-                    '-spatial-aq', '1',               # 空间自适应量化
-                    '-temporal-aq', '1',              # 时间自适应量化
-                    '-rc-lookahead', '32'            # 前向预测帧数
-                ]
-            })
-            logger.info("使用NVIDIA GPU加速进行视频编码...")
-        except Exception as e:
-            logger.error(f"GPU编码器初始化失败，回退到CPU: {str(e)}")
-    
-    try:
-        final_video.write_videofile(
-            output_path,
-            **write_options
-        )
-    except Exception as e:
-        logger.error(f"视频编码失败: {str(e)}")
-        # 如果失败，尝试使用最基本设置
-        logger.info("尝试使用基本设置重新编码...")
-        basic_options = {
-            'codec': 'libx264',
-            'audio_codec': 'aac',
-            'threads': 8,
-            'fps': video.fps
-        }
-        final_video.write_videofile(output_path, **basic_options)
+    with span("encode" if reencode else "mux") as encode_span:
+        if reencode:
+            encode_video(video_path, mix_path, output_path, logger, on_progress, cancel_token,
+                         workers=encode_workers, video_filters=video_filters, subtitle_tracks=subtitle_tracks)
+        else:
+            try:
+                # 只替换音轨，视频流直接复制
+                logger.info("正在封装视频（视频流直接复制，不重新编码）...")
+                reporter = ProgressReporter(on_progress, "mux", duration, "秒")
+                mux_audio(video_path, mix_path, output_path,
+                          on_progress=lambda seconds: reporter.update(min(seconds, duration)),
+                          cancel_token=cancel_token, subtitle_tracks=subtitle_tracks)
+                reporter.finish()
+            except Cancelled:
+                raise
+            except Exception as e:
+                logger.error(f"视频流复制失败，改为重新编码: {str(e)}")
+                encode_span.set(fallback="encode")
+                encode_video(video_path, mix_path, output_path, logger, on_progress, cancel_token,
+                             workers=encode_workers, subtitle_tracks=subtitle_tracks)
+        encode_span.add_output(output_path)
     
-    # 清理资源
-    final_video.close()
-    if original_audio:
-        original_audio.close()
-    for audio_clip, _ in zip(audio_segments, audio_files):
-        audio_clip.close()
+    # 记录本次的工程清单，供下次增量处理
+    DubManifest(manifest_path, settings, cues, mix_path, output_path, subtitle_info).save()
     
-    # 清理生成的语音片段
+    cleanup_speech_files(audio_files, logger)
+    return output_path
+
+def cleanup_speech_files(audio_files, logger):
+    """清理生成的语音片段"""
     logger.info("正在清理临时语音文件...")
     for audio_file, _ in audio_files:
+        # 缓存中的语音片段需要保留，供下次重新配音时复用
+        if clip_cache.contains(audio_file):
+            continue
         try:
             if os.path.exists(audio_file):
                 os.remove(audio_file)
@@ -358,30 +693,66 @@ def merge_video_audio(video_path, audio_files, cn_srt, callback=None, original_v
             logger.info("清理空的audio目录")
     except Exception as e:
         logger.error(f"清理audio目录失败: {str(e)}")
-        
-    return output_path
 
-async def process_video(video_path=None, voice_name="zh-CN-XiaoyiNeural", callback=None):
+def save_trace(trace, output_path, logger):
+    """把运行报告写到输出视频旁边，并在日志中输出各阶段的汇总表"""
+    report_path = trace.save(report_path_for(output_path))
+    logger.info("各阶段耗时统计:")
+    for line in trace.summary_table().splitlines():
+        logger.info(line)
+    logger.info(f"运行报告已保存: {report_path}")
+    return report_path
+
+async def process_video(video_path=None, voice_name="zh-CN-XiaoyiNeural", callback=None, pipelined=False,
+                        profile=None, on_progress=None, cancel_token=None, subtitles="none", subtitle_style=None):
+    """
+    完整处理一个视频
+    :param pipelined: 使用流水线模式，转录、翻译和语音合成同时进行
+    :param profile: 转录档位，见 make_profile
+    :param on_progress: 接收各阶段 ProgressEvent 的回调
+    :param cancel_token: CancelToken，用于暂停或取消
+    :param subtitles: 输出视频中的字幕，见 merge_video_audio
+    :param subtitle_style: 烧录字幕的样式，见 generate_subtitles
+    """
+    cancel_token = cancel_token or CancelToken()
     logger = LoggerCallback(callback)
     try:
         if not video_path or not os.path.exists(video_path):
             raise ValueError("无效的视频路径")
 
-        logger.info("正在生成英文字幕...")
-        en_srt = generate_subtitles(video_path, callback)
-        
-        logger.info("正在翻译字幕...")
-        cn_srt = translate_subtitles(en_srt, callback)
-        
-        logger.info("正在生成语音...")
-        audio_files = await generate_speech(cn_srt, voice_name, callback)
-        
-        logger.info("正在合并视频和音频...")
-        output_path = merge_video_audio(video_path, audio_files, cn_srt, callback)
+        trace = Trace(get_base_filename(video_path))
+        with activate(trace):
+            if pipelined:
+                from pipeline import DubbingPipeline
+                output_path = await DubbingPipeline(
+                    video_path, voice_name, callback, profile=profile, subtitles=subtitles,
+                    subtitle_style=subtitle_style, on_progress=on_progress, cancel_token=cancel_token
+                ).run()
+            else:
+                logger.info("正在生成英文字幕...")
+                en_srt = generate_subtitles(video_path, callback, subtitle_style=subtitle_style, profile=profile,
+                                            on_progress=on_progress, cancel_token=cancel_token)
+                
+                logger.info("正在翻译字幕...")
+                cancel_token.check()
+                cn_srt = translate_subtitles(en_srt, callback, on_progress=on_progress, cancel_token=cancel_token)
+                
+                logger.info("正在生成语音...")
+                cancel_token.check()
+                audio_files = await generate_speech(cn_srt, voice_name, callback, on_progress=on_progress,
+                                                    cancel_token=cancel_token)
+                
+                logger.info("正在合并视频和音频...")
+                output_path = merge_video_audio(video_path, audio_files, cn_srt, callback, on_progress=on_progress,
+                                                cancel_token=cancel_token, subtitles=subtitles)
         
+        save_trace(trace, output_path, logger)
         logger.info(f"处理完成！输出文件：{output_path}")
         return output_path
         
+    except Cancelled:
+        logger.info("处理已取消")
+        raise
     except Exception as e:
         logger.error(f"处理失败: {str(e)}")
         raise 
\ No newline at end of file
@@ -0,0 +1,255 @@
+"""
+视频音轨的解码缓存：每个视频只运行一次 ffmpeg，同时输出两份原始 PCM 文件
+（16kHz 单声道供语音检测和转录使用，44.1kHz 立体声供混音使用），旁边的 JSON 记录格式和来源
+各阶段通过只读内存映射读取其中的切片，不再各自启动 ffmpeg 重新解码
+"""
+import hashlib
+import json
+import os
+import threading
+import uuid
+import weakref
+
+import numpy as np
+
+from audio_mixer import CHANNELS, SAMPLE_RATE
+from ffmpeg_utils import run_ffmpeg
+
+FORMAT_VERSION = 1
+SPEECH_SAMPLE_RATE = 16000  # Whisper 和语音检测使用的采样率
+DIGEST_SAMPLE_BYTES = 1024 * 1024  # 计算源文件指纹时读取的头部、中部、尾部字节数
+
+
+def source_digest(path):
+    """
+    源文件指纹：大小、修改时间，以及头部、中部、尾部各 1MB 的哈希
+    数 GB 的视频不必整个读一遍，替换或重新导出后的文件都会得到不同的指纹
+    """
+    stat = os.stat(path)
+    sha = hashlib.sha256(f"{FORMAT_VERSION}|{stat.st_size}|{stat.st_mtime_ns}".encode("utf-8"))
+    with open(path, "rb") as f:
+        for offset in (0, stat.st_size // 2, max(0, stat.st_size - DIGEST_SAMPLE_BYTES)):
+            f.seek(offset)
+            sha.update(f.read(DIGEST_SAMPLE_BYTES))
+    return sha.hexdigest()
+
+
+class PcmTrack:
+    """
+    内存映射的 float32 PCM 音轨，形状为 (frames, channels)
+    以写时复制方式映射（mode="c"）：切片不复制数据，也可以直接交给要求可写数组的 torch.from_numpy
+    """
+
+    def __init__(self, path, sample_rate, channels):
+        self.path = path
+        self.sample_rate = sample_rate
+        self.channels = channels
+        frames = os.path.getsize(path) // (4 * channels)
+        if frames:
+            self.samples = np.memmap(path, dtype="<f4", mode="c", shape=(frames, channels))
+        else:
+            # 空文件不能被映射
+            self.samples = np.zeros((0, channels), dtype=np.float32)
+
+    @property
+    def frames(self):
+        return len(self.samples)
+
+    def close(self):
+        """
+        释放内存映射：np.memmap 没有可以安全调用的 close（仍有切片视图时会出错），
+        这里只丢弃自己持有的映射，最后一个切片视图被回收后文件即被解除映射
+        """
+        self.samples = np.zeros((0, self.channels), dtype=np.float32)
+
+    @property
+    def duration(self):
+        return self.frames / self.sample_rate
+
+    def _check_format(self, sample_rate, channels):
+        if sample_rate != self.sample_rate or channels != self.channels:
+            raise ValueError(
+                f"缓存音轨格式为 {self.sample_rate}Hz/{self.channels}声道，无法按 {sample_rate}Hz/{channels}声道读取"
+            )
+
+    def blocks(self, sample_rate, channels, block_frames):
+        """与 audio_mixer.iter_decode 相同的分块，产出的是内存映射的切片视图"""
+        self._check_format(sample_rate, channels)
+        for position in range(0, self.frames, block_frames):
+            yield self.samples[position:position + block_frames]
+
+    def read(self, sample_rate, channels, start=None, duration=None):
+        """与 audio_mixer.decode_audio 相同的返回形状：单声道为 (frames,)，多声道为 (frames, channels)"""
+        self._check_format(sample_rate, channels)
+        first = int(round((start or 0.0) * sample_rate))
+        last = self.frames if duration is None else first + int(round(duration * sample_rate))
+        samples = self.samples[first:last]
+        return samples[:, 0] if channels == 1 else samples
+
+    def mono(self):
+        """单声道音轨的一维视图（Whisper 的输入格式）"""
+        return self.samples[:, 0]
+
+
+class AudioArtifact:
+    """
+    一个视频解码后的两份音轨
+    由 AudioCache 取得的音轨在 close() 之前不会被淘汰；用完后调用 close()（或使用 with 语句）释放内存映射
+    """
+
+    def __init__(self, meta_path, meta, cache=None):
+        self.meta_path = meta_path
+        self.meta = meta
+        base = meta_path[:-len(".json")]
+        self.speech = PcmTrack(base + ".speech.f32", meta["speech"]["sample_rate"], meta["speech"]["channels"])
+        self.mix = PcmTrack(base + ".mix.f32", meta["mix"]["sample_rate"], meta["mix"]["channels"])
+        # 忘记调用 close 时，对象被回收后同样释放占用
+        self._release = weakref.finalize(self, cache.release, meta_path) if cache else None
+
+    def close(self):
+        self.speech.close()
+        self.mix.close()
+        if self._release:
+            self._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    @property
+    def duration(self):
+        return self.meta["duration"]
+
+    @property
+    def files(self):
+        return [self.meta_path, self.speech.path, self.mix.path]
+
+
+class AudioCache:
+    """
+    按源文件指纹寻址的解码音轨缓存，总大小超过 max_bytes 时淘汰最久未使用的视频
+    旁注 JSON 最后写入，存在即表示两份 PCM 文件已经完整写出
+    本进程中仍被任务使用（已取得但尚未 close）的音轨按引用计数记录，淘汰时跳过
+    """
+
+    def __init__(self, root, max_bytes=4 * 1024 * 1024 * 1024):
+        self.root = root
+        self.max_bytes = max_bytes
+        # 可重入：音轨对象被垃圾回收时的 release 可能发生在本线程持有锁期间
+        self.lock = threading.RLock()
+        self.in_use = {}  # 旁注 JSON 路径 -> 引用计数
+        self.hits = 0
+        self.misses = 0
+
+    def _acquire(self, meta_path, meta):
+        """调用方持有 self.lock"""
+        artifact = AudioArtifact(meta_path, meta, self)
+        self.in_use[meta_path] = self.in_use.get(meta_path, 0) + 1
+        return artifact
+
+    def release(self, meta_path):
+        with self.lock:
+            count = self.in_use.get(meta_path, 0) - 1
+            if count > 0:
+                self.in_use[meta_path] = count
+            else:
+                self.in_use.pop(meta_path, None)
+
+    def meta_path(self, key):
+        return os.path.join(self.root, key + ".json")
+
+    def get(self, video_path):
+        """命中时返回 AudioArtifact 并刷新访问时间，否则返回 None"""
+        meta_path = self.meta_path(source_digest(video_path))
+        with self.lock:
+            # 在锁内读取并登记，避免另一个任务的淘汰恰好删除这份音轨
+            try:
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    meta = json.load(f)
+                artifact = self._acquire(meta_path, meta)
+            except (OSError, ValueError, KeyError):
+                self.misses += 1
+                return None
+            self.hits += 1
+        try:
+            os.utime(meta_path, None)
+        except OSError:
+            pass
+        return artifact
+
+    def extract(self, video_path, on_progress=None, cancel_token=None):
+        """
+        解码视频音轨并写入缓存：一次 ffmpeg 解码，两路重采样输出
+        :param on_progress: 见 run_ffmpeg
+        :param cancel_token: 见 run_ffmpeg，取消时不会留下不完整的缓存
+        """
+        key = source_digest(video_path)
+        meta_path = self.meta_path(key)
+        base = meta_path[:-len(".json")]
+        suffix = f".{uuid.uuid4().hex}.part"
+        speech_path, mix_path = base + ".speech.f32", base + ".mix.f32"
+        os.makedirs(self.root, exist_ok=True)
+        try:
+            run_ffmpeg([
+                "-i", video_path,
+                "-map", "0:a:0", "-f", "f32le", "-ac", "1", "-ar", str(SPEECH_SAMPLE_RATE), speech_path + suffix,
+                "-map", "0:a:0", "-f", "f32le", "-ac", str(CHANNELS), "-ar", str(SAMPLE_RATE), mix_path + suffix
+            ], on_progress, cancel_token)
+            os.replace(speech_path + suffix, speech_path)
+            os.replace(mix_path + suffix, mix_path)
+        finally:
+            for path in (speech_path + suffix, mix_path + suffix):
+                if os.path.exists(path):
+                    os.remove(path)
+
+        frames = os.path.getsize(mix_path) // (4 * CHANNELS)
+        meta = {
+            "version": FORMAT_VERSION,
+            "source": os.path.abspath(video_path),
+            "duration": frames / SAMPLE_RATE,
+            "speech": {"sample_rate": SPEECH_SAMPLE_RATE, "channels": 1, "dtype": "<f4"},
+            "mix": {"sample_rate": SAMPLE_RATE, "channels": CHANNELS, "dtype": "<f4"}
+        }
+        with open(meta_path + suffix, "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        os.replace(meta_path + suffix, meta_path)
+        with self.lock:
+            artifact = self._acquire(meta_path, meta)
+            self._evict()
+        return artifact
+
+    def _evict(self):
+        """淘汰最久未使用的音轨，跳过仍在使用中的（调用方持有 self.lock）"""
+        entries = []
+        for name in os.listdir(self.root):
+            if not name.endswith(".json"):
+                continue
+            meta_path = os.path.join(self.root, name)
+            base = meta_path[:-len(".json")]
+            paths = [meta_path, base + ".speech.f32", base + ".mix.f32"]
+            try:
+                mtime = os.path.getmtime(meta_path)
+            except OSError:
+                continue
+            size = sum(os.path.getsize(path) for path in paths if os.path.exists(path))
+            entries.append((mtime, meta_path, paths, size))
+        entries.sort()
+        total = sum(size for _, _, _, size in entries)
+        for _, meta_path, paths, size in entries:
+            if total <= self.max_bytes:
+                break
+            if meta_path in self.in_use:
+                continue
+            for path in paths:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            total -= size
+
+    def stats(self):
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses}
@@ -0,0 +1,300 @@
+import math
+import os
+import subprocess
+import tempfile
+import wave
+
+import numpy as np
+
+from ffmpeg_utils import get_ffmpeg_binary
+
+SAMPLE_RATE = 44100  # 混音采样率
+CHANNELS = 2  # 输出声道数（配音片段按单声道放置到时间轴上）
+BLOCK_SECONDS = 10  # 流式读写的块长度（秒）
+MEMMAP_THRESHOLD = 256 * 1024 * 1024  # 时间轴超过该大小时放到磁盘映射文件中
+
+
+def _decode_command(path, sample_rate, channels, start=None, duration=None):
+    command = [get_ffmpeg_binary(), "-hide_banner", "-nostdin", "-loglevel", "error"]
+    if start is not None:
+        command += ["-ss", f"{start:.3f}"]
+    command += ["-i", path]
+    if duration is not None:
+        command += ["-t", f"{duration:.3f}"]
+    return command + ["-vn", "-f", "f32le", "-ac", str(channels), "-ar", str(sample_rate), "pipe:1"]
+
+
+def decode_audio(path, sample_rate=SAMPLE_RATE, channels=1, start=None, duration=None):
+    """
+    用 ffmpeg 一次性解码音频为 float32 数组，解码完成后立即关闭子进程
+    :return: 单声道时为 (frames,)，多声道时为 (frames, channels)
+    """
+    result = subprocess.run(
+        _decode_command(path, sample_rate, channels, start, duration),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0)
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"音频解码失败 ({path}): {result.stderr.decode('utf-8', errors='replace').strip()}")
+    samples = np.frombuffer(result.stdout, dtype="<f4")
+    if channels == 1:
+        return samples
+    return samples[:len(samples) - len(samples) % channels].reshape(-1, channels)
+
+
+def iter_decode(path, sample_rate=SAMPLE_RATE, channels=CHANNELS, block_frames=None):
+    """流式解码音频，每次产出 (frames, channels) 的 float32 块，内存占用与总时长无关"""
+    block_frames = block_frames or SAMPLE_RATE * BLOCK_SECONDS
+    block_bytes = block_frames * channels * 4
+    process = subprocess.Popen(
+        _decode_command(path, sample_rate, channels),
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0)
+    )
+    try:
+        while True:
+            data = process.stdout.read(block_bytes)
+            if not data:
+                break
+            samples = np.frombuffer(data, dtype="<f4")
+            yield samples[:len(samples) - len(samples) % channels].reshape(-1, channels)
+    finally:
+        process.stdout.close()
+        if process.poll() is None:
+            process.kill()
+        process.wait()
+
+
+def iter_source(source, sample_rate=SAMPLE_RATE, channels=CHANNELS, block_frames=None):
+    """
+    与 iter_decode 相同，但 source 也可以是 audio_cache.PcmTrack（已解码的缓存音轨），
+    此时直接产出内存映射的切片，不再启动 ffmpeg
+    """
+    if isinstance(source, (str, os.PathLike)):
+        return iter_decode(source, sample_rate, channels, block_frames)
+    return source.blocks(sample_rate, channels, block_frames or SAMPLE_RATE * BLOCK_SECONDS)
+
+
+def read_source(source, sample_rate=SAMPLE_RATE, channels=1, start=None, duration=None):
+    """与 decode_audio 相同，source 可以是文件路径或 audio_cache.PcmTrack"""
+    if isinstance(source, (str, os.PathLike)):
+        return decode_audio(source, sample_rate, channels, start, duration)
+    return source.read(sample_rate, channels, start, duration)
+
+
+MP3_BITRATES = {
+    1: [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],  # MPEG-1 Layer III
+    2: [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160]  # MPEG-2/2.5 Layer III
+}
+MP3_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+
+
+def _mp3_duration(data):
+    """逐帧读取 MP3 帧头累加采样数，不解码；不是 Layer III 或帧头不连续时返回 None"""
+    position = 0
+    if data[:3] == b"ID3" and len(data) >= 10:
+        # ID3v2 标签长度为 4 个 7 位字节
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        position = 10 + size + (10 if data[5] & 0x10 else 0)
+    seconds = 0.0
+    frames = 0
+    while position + 4 <= len(data):
+        header = int.from_bytes(data[position:position + 4], "big")
+        if header >> 21 != 0x7FF:
+            if data[position:position + 3] == b"TAG":
+                break  # 文件末尾的 ID3v1 标签
+            return None
+        version = (header >> 19) & 3
+        layer = (header >> 17) & 3
+        bitrate_index = (header >> 12) & 15
+        rate_index = (header >> 10) & 3
+        if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+            return None
+        mpeg1 = version == 3
+        bitrate = MP3_BITRATES[1 if mpeg1 else 2][bitrate_index] * 1000
+        sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+        padding = (header >> 9) & 1
+        length = (144 if mpeg1 else 72) * bitrate // sample_rate + padding
+        if frames == 0:
+            # 编码器写入的 Xing/Info 帧不含音频，其中的 LAME 标签记录了首尾的填充采样数
+            mono = (header >> 6) & 3 == 3
+            tag = position + 4 + (17 if mono else 32) if mpeg1 else position + 4 + (9 if mono else 17)
+            if data[tag:tag + 4] in (b"Xing", b"Info"):
+                lame = data[tag + 120:tag + 144]
+                if len(lame) == 24:  # 编码器名称可能是 LAME、Lavc 等
+                    seconds -= (((lame[21] << 4) | (lame[22] >> 4)) + (((lame[22] & 15) << 8) | lame[23])) \
+                        / sample_rate
+                position += length
+                frames += 1
+                continue
+        position += length
+        seconds += (1152 if mpeg1 else 576) / sample_rate
+        frames += 1
+    return max(0.0, seconds) if frames else None
+
+
+def audio_duration(path, sample_rate=SAMPLE_RATE):
+    """
+    配音片段的时长（秒），只读取文件头：WAV 读取采样数，MP3 逐帧累加并扣除 LAME 标签记录的填充，
+    与解码后的长度一致；其他格式或无法解析时解码一次
+    """
+    if path.lower().endswith(".wav"):
+        with wave.open(path, "rb") as wav:
+            return wav.getnframes() / wav.getframerate()
+    if path.lower().endswith(".mp3"):
+        with open(path, "rb") as f:
+            duration = _mp3_duration(f.read())
+        if duration is not None:
+            return duration
+    return len(decode_audio(path, sample_rate, 1)) / sample_rate
+
+
+def to_pcm16(samples):
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2")
+
+
+def write_wav(path, samples, sample_rate=SAMPLE_RATE):
+    """把 float32 采样写成 16 位 PCM WAV，samples 为 (frames,) 或 (frames, channels)"""
+    channels = 1 if samples.ndim == 1 else samples.shape[1]
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(to_pcm16(samples).tobytes())
+
+
+def wav_data(path):
+    """以只读内存映射的方式打开 16 位 PCM WAV，返回 (frames, channels) 的 int16 视图"""
+    with wave.open(path, "rb") as wav:
+        channels = wav.getnchannels()
+        frames = wav.getnframes()
+        if wav.getsampwidth() != 2:
+            raise ValueError(f"不支持的 WAV 位深: {path}")
+    # 本模块写出的 WAV 数据块位于文件末尾
+    offset = os.path.getsize(path) - frames * channels * 2
+    return np.memmap(path, dtype="<i2", mode="r", offset=offset, shape=(frames, channels))
+
+
+class AudioMixer:
+    """
+    基于 NumPy 的混音器
+    每个配音片段只解码一次，按字幕起始时间放入预分配的 float32 时间轴；
+    原音轨在输出时流式解码，按块做音量衰减并与时间轴相加，打开的文件句柄数与字幕条数无关
+    """
+
+    def __init__(self, duration, sample_rate=SAMPLE_RATE, channels=CHANNELS):
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.frames = max(1, int(math.ceil(duration * sample_rate)))
+        self.temp_file = None
+        if self.frames * 4 > MEMMAP_THRESHOLD:
+            # 超长视频的时间轴放到磁盘映射文件中，由操作系统按需换页
+            fd, self.temp_file = tempfile.mkstemp(suffix=".f32")
+            os.close(fd)
+            self.timeline = np.memmap(self.temp_file, dtype=np.float32, mode="w+", shape=(self.frames,))
+        else:
+            self.timeline = np.zeros(self.frames, dtype=np.float32)
+
+    def place(self, samples, start):
+        """把单声道片段叠加到时间轴的 start 秒处，返回片段时长（秒）"""
+        offset = int(round(start * self.sample_rate))
+        if offset < self.frames:
+            count = min(len(samples), self.frames - offset)
+            self.timeline[offset:offset + count] += samples[:count]
+        return len(samples) / self.sample_rate
+
+    def place_file(self, path, start):
+        return self.place(decode_audio(path, self.sample_rate, 1), start)
+
+    def write(self, output_path, original_path=None, original_volume=1.0, checkpoint=None):
+        """
+        输出 16 位 PCM WAV：原音轨 * original_volume + 配音时间轴
+        :param original_path: 原音轨所在文件（通常就是视频本身）或缓存的 PcmTrack，None 表示没有原音轨
+        :param checkpoint: 每写出一块调用一次（如 CancelToken.check），用于暂停或取消
+        """
+        block_frames = self.sample_rate * BLOCK_SECONDS
+        with wave.open(output_path, "wb") as wav:
+            wav.setnchannels(self.channels)
+            wav.setsampwidth(2)
+            wav.setframerate(self.sample_rate)
+            position = 0
+            if original_path:
+                for block in iter_source(original_path, self.sample_rate, self.channels, block_frames):
+                    count = min(len(block), self.frames - position)
+                    if count <= 0:
+                        break
+                    if checkpoint:
+                        checkpoint()
+                    mixed = block[:count] * np.float32(original_volume)
+                    mixed += self.timeline[position:position + count, None]
+                    wav.writeframes(to_pcm16(mixed).tobytes())
+                    position += count
+            # 原音轨比视频短或不存在时，剩余部分只有配音
+            while position < self.frames:
+                if checkpoint:
+                    checkpoint()
+                count = min(block_frames, self.frames - position)
+                mixed = np.repeat(self.timeline[position:position + count, None], self.channels, axis=1)
+                wav.writeframes(to_pcm16(mixed).tobytes())
+                position += count
+
+    def close(self):
+        if self.temp_file:
+            del self.timeline
+            try:
+                os.remove(self.temp_file)
+            except OSError:
+                pass
+            self.temp_file = None
+
+
+def remix_ranges(prev_mix_path, output_path, ranges, clips, original_path=None, original_volume=1.0,
+                 sample_rate=SAMPLE_RATE, checkpoint=None):
+    """
+    增量混音：只重新计算 ranges 内的音频，其余部分直接从上次的混音中复制
+    :param ranges: [(start, end), ...] 需要重新混音的时间区间（秒），互不重叠
+    :param clips: [(clip_path, start), ...] 起始时间落在这些区间内的配音片段
+    :param original_path: 见 AudioMixer.write
+    :param checkpoint: 见 AudioMixer.write
+    """
+    previous = wav_data(prev_mix_path)
+    frames, channels = previous.shape
+    replacements = []
+    for range_start, range_end in ranges:
+        first = int(round(range_start * sample_rate))
+        last = min(frames, int(round(range_end * sample_rate)))
+        if last <= first:
+            continue
+        if checkpoint:
+            checkpoint()
+        mixer = AudioMixer((last - first) / sample_rate, sample_rate, channels)
+        for clip_path, start in clips:
+            if range_start <= start < range_end:
+                mixer.place_file(clip_path, start - range_start)
+        mixed = np.repeat(mixer.timeline[:last - first, None], channels, axis=1)
+        if original_path:
+            original = read_source(original_path, sample_rate, channels, range_start, range_end - range_start)
+            count = min(len(original), last - first)
+            mixed[:count] += original[:count] * np.float32(original_volume)
+        replacements.append((first, last, to_pcm16(mixed)))
+
+    block_frames = sample_rate * BLOCK_SECONDS
+    with wave.open(output_path, "wb") as wav:
+        wav.setnchannels(channels)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        position = 0
+        for first, last, samples in replacements + [(frames, frames, None)]:
+            # 未改动的部分按块从上次的混音中复制
+            while position < first:
+                if checkpoint:
+                    checkpoint()
+                count = min(block_frames, first - position)
+                wav.writeframes(np.ascontiguousarray(previous[position:position + count]).tobytes())
+                position += count
+            if samples is not None:
+                wav.writeframes(samples.tobytes())
+                position = last
+    del previous
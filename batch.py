@@ -0,0 +1,386 @@
+"""
+无界面批量配音
+
+用法:
+    python -m batch videos/ "more/*.mp4" --voice zh-CN-XiaoyiNeural --encode-workers 4
+
+一个共享的 Whisper 工作线程负责转录（同时等待的多个视频合并成批次解码），翻译和 TTS 在 asyncio 前端并发执行，
+视频合并在进程池中进行；每个阶段都有独立的并发上限。
+处理进度写入任务日志 (output/batch_journal.jsonl)，中途崩溃后重新运行会从断点继续。
+"""
+import argparse
+import asyncio
+import concurrent.futures
+import functools
+import glob
+import json
+import logging
+import os
+import sys
+import time
+
+import app as dubbing_app
+from cancellation import Cancelled, CancelToken
+from tracing import Trace, activate, report_path_for, run_in_context
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("batch")
+
+VIDEO_EXTENSIONS = {'.mp4', '.avi', '.mkv', '.mov'}
+
+
+def collect_videos(inputs):
+    """展开目录和通配符，返回去重后的视频文件列表"""
+    videos = []
+    for pattern in inputs:
+        if os.path.isdir(pattern):
+            paths = [os.path.join(pattern, name) for name in sorted(os.listdir(pattern))]
+        else:
+            paths = sorted(glob.glob(pattern))
+        for path in paths:
+            if os.path.isfile(path) and os.path.splitext(path)[1].lower() in VIDEO_EXTENSIONS:
+                videos.append(os.path.abspath(path))
+    return list(dict.fromkeys(videos))
+
+
+def video_key(path):
+    """视频文件被替换或修改后需要重新处理"""
+    stat = os.stat(path)
+    return f"{path}|{stat.st_size}|{int(stat.st_mtime)}"
+
+
+class JobJournal:
+    """
+    追加写入的任务日志，每行记录一个视频的进度：stage 为已完成的最远阶段（translated/done），
+    status 为最近一次运行的结果（failed），失败不会覆盖已完成的阶段，重试时从该阶段继续
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.state = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # 崩溃时可能留下不完整的最后一行
+                        continue
+                    if record.get("stage") == "failed":
+                        # 旧版本把失败写在 stage 中，改为 status，保留之前完成的阶段
+                        record["status"] = record.pop("stage")
+                    self.state.setdefault(record["key"], {}).update(record)
+
+    def get(self, key):
+        return self.state.get(key, {})
+
+    def record(self, key, **fields):
+        entry = self.state.setdefault(key, {"key": key})
+        entry.update(fields, time=time.time())
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(dict(fields, key=key, time=entry["time"]), ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def merge_worker(video_path, audio_files, cn_srt, original_volume, reencode, encode_workers=None, subtitles="none"):
+    """
+    在进程池中运行的合并任务（必须是模块级函数才能被序列化）
+    :param encode_workers: 重新编码时该视频分段并行编码的 ffmpeg 进程数
+    :param subtitles: 输出视频中的字幕，见 presets.SUBTITLE_MODES
+    :return: (输出文件路径, 子进程中记录的计时区间)
+    """
+    trace = Trace(dubbing_app.get_base_filename(video_path))
+    with activate(trace):
+        output_path = dubbing_app.merge_video_audio(
+            video_path, audio_files, cn_srt, original_volume=original_volume, reencode=reencode,
+            encode_workers=encode_workers, subtitles=subtitles
+        )
+    return output_path, trace.spans
+
+
+class WhisperBatcher:
+    """
+    收集同时等待转录的视频，凑成一组交给共享的 Whisper 工作线程批量解码
+    :param max_files: 每组最多的视频数
+    :param batch_size: 每批的窗口数，None 表示自适应
+    :param cancel_token: CancelToken，每批解码之前检查暂停和取消，取消时组内所有视频都抛出 Cancelled
+    """
+
+    def __init__(self, executor, profile, max_files=4, batch_size=None, cancel_token=None):
+        self.executor = executor
+        self.profile = profile
+        self.max_files = max(1, max_files)
+        self.batch_size = batch_size
+        self.cancel_token = cancel_token
+        self.waiting = []
+        self.running = False
+
+    async def transcribe(self, video_path):
+        future = asyncio.get_event_loop().create_future()
+        self.waiting.append((video_path, future))
+        if not self.running:
+            self.running = True
+            asyncio.ensure_future(self._drain())
+        return await future
+
+    async def _drain(self):
+        loop = asyncio.get_event_loop()
+        try:
+            while self.waiting:
+                group = self.waiting[:self.max_files]
+                del self.waiting[:self.max_files]
+                try:
+                    srt_paths = await loop.run_in_executor(self.executor, functools.partial(
+                        dubbing_app.generate_subtitles_many, [video for video, _ in group], logger.info,
+                        profile=self.profile, batch_size=self.batch_size, cancel_token=self.cancel_token
+                    ))
+                except Exception as e:
+                    for _, future in group:
+                        future.set_exception(e)
+                else:
+                    for (_, future), srt_path in zip(group, srt_paths):
+                        future.set_result(srt_path)
+        finally:
+            self.running = False
+
+
+class BatchRunner:
+    """
+    :param encode_executor: 合并任务使用的执行器，默认为 --encode-workers 个进程的进程池
+    :param cancel_token: CancelToken，取消后各视频在下一个阶段开始前停止
+    """
+
+    def __init__(self, args, encode_executor=None, cancel_token=None):
+        self.args = args
+        self.cancel_token = cancel_token or CancelToken()
+        self.journal = JobJournal(args.journal)
+        self.profile = dubbing_app.make_profile(args.model, args.decoding, args.quantize)
+        # 只有一个 Whisper 工作线程，所有视频共享同一个模型
+        self.whisper_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        self.whisper_batcher = None
+        if args.whisper_files > 0:
+            self.whisper_batcher = WhisperBatcher(
+                self.whisper_executor, self.profile, args.whisper_files, args.whisper_batch or None,
+                self.cancel_token
+            )
+        self.encode_executor = encode_executor or concurrent.futures.ProcessPoolExecutor(
+            max_workers=args.encode_workers
+        )
+        self.translate_limit = asyncio.Semaphore(args.translate_concurrency)
+        self.tts_limit = asyncio.Semaphore(args.tts_videos)
+        self.failed = []
+
+    def callback_for(self, video_path):
+        name = os.path.basename(video_path)
+        return lambda message: logger.info(f"[{name}] {message}")
+
+    def default_settings(self):
+        """命令行给出的配音设置，所有视频共用"""
+        return {
+            "voice": self.args.voice,
+            "speed": self.args.speed,
+            "original_volume": self.args.original_volume,
+            "reencode": self.args.reencode,
+            "subtitles": self.args.subtitles
+        }
+
+    def notify(self, key, stage, **info):
+        """视频进入新阶段时调用（transcribe/translate/tts/merge/done/failed/cancelled），子类用来更新界面"""
+
+    async def process(self, video_path, settings=None, key=None):
+        """
+        :param settings: 该视频的配音设置（voice/speed/original_volume/reencode），None 表示使用命令行设置
+        :param key: 任务日志中的键，默认按文件路径、大小和修改时间生成
+        """
+        loop = asyncio.get_event_loop()
+        settings = settings or self.default_settings()
+        key = key or video_key(video_path)
+        state = self.journal.get(key)
+        callback = self.callback_for(video_path)
+        if state.get("stage") == "done" and os.path.exists(state.get("output", "")):
+            callback(f"已完成，跳过: {state['output']}")
+            self.notify(key, "done", output=state["output"])
+            return
+        trace = Trace(dubbing_app.get_base_filename(video_path))
+        try:
+            with activate(trace):
+                cn_srt = state.get("cn_srt")
+                if not (state.get("stage") == "translated" and cn_srt and os.path.exists(cn_srt)):
+                    self.cancel_token.check()
+                    self.notify(key, "transcribe")
+                    callback("正在生成英文字幕...")
+                    if self.whisper_batcher:
+                        en_srt = await self.whisper_batcher.transcribe(video_path)
+                    else:
+                        en_srt = await loop.run_in_executor(self.whisper_executor, run_in_context(
+                            dubbing_app.generate_subtitles, video_path, callback, profile=self.profile,
+                            cancel_token=self.cancel_token
+                        ))
+                    async with self.translate_limit:
+                        self.cancel_token.check()
+                        self.notify(key, "translate")
+                        callback("正在翻译字幕...")
+                        cn_srt = await loop.run_in_executor(None, run_in_context(
+                            dubbing_app.translate_subtitles, en_srt, callback, cancel_token=self.cancel_token
+                        ))
+                    self.journal.record(key, stage="translated", en_srt=en_srt, cn_srt=cn_srt)
+                else:
+                    callback("从任务日志恢复：字幕已翻译")
+
+                async with self.tts_limit:
+                    self.cancel_token.check()
+                    self.notify(key, "tts")
+                    callback("正在生成语音...")
+                    audio_files = await dubbing_app.generate_speech(
+                        cn_srt, settings["voice"], callback, settings["speed"],
+                        concurrency=self.args.tts_concurrency, cancel_token=self.cancel_token
+                    )
+
+                self.cancel_token.check()
+                self.notify(key, "merge")
+                callback("正在合并视频和音频...")
+                output_path, spans = await loop.run_in_executor(
+                    self.encode_executor, merge_worker,
+                    video_path, audio_files, cn_srt, settings["original_volume"], settings["reencode"],
+                    # 多个视频同时合并时平分 CPU，避免分段编码的 ffmpeg 进程数超过核数
+                    max(1, (os.cpu_count() or 1) // (2 * self.args.encode_workers)),
+                    settings.get("subtitles", "none")
+                )
+                trace.extend(spans)
+                trace.save(report_path_for(output_path))
+            self.journal.record(key, stage="done", status="done", output=output_path)
+            self.notify(key, "done", output=output_path)
+            callback(f"处理完成！输出文件：{output_path}")
+        except Cancelled:
+            # 已完成的阶段记录在任务日志中，下次从断点继续
+            callback("已停止")
+            self.notify(key, "cancelled")
+        except Exception as e:
+            logger.error(f"[{os.path.basename(video_path)}] 处理失败: {str(e)}")
+            self.journal.record(key, status="failed", error=str(e))
+            self.notify(key, "failed", error=str(e))
+            self.failed.append(video_path)
+
+    async def run(self, videos):
+        start = time.perf_counter()
+        try:
+            await asyncio.gather(*[self.process(video) for video in videos])
+        finally:
+            self.whisper_executor.shutdown()
+            self.encode_executor.shutdown()
+        elapsed = time.perf_counter() - start
+        finished = len(videos) - len(self.failed)
+        logger.info(
+            f"批量处理结束: 成功 {finished} 个, 失败 {len(self.failed)} 个, 耗时 {elapsed:.1f}秒, "
+            f"吞吐 {finished / elapsed * 3600 if elapsed else 0:.1f} 个视频/小时"
+        )
+        return not self.failed
+
+
+
+class QueueRunner(BatchRunner):
+    """
+    处理 JobQueue 中的任务（界面的任务队列）：每个任务使用自己的配音设置，运行期间新加入的任务也会被调度
+    各阶段的并发上限与批量模式相同，因此视频 N 合成语音或合并时，视频 N+1 已经在转录
+    :param on_change: 任务状态变化时调用 on_change(item_id)
+    :param on_log: 接收日志消息，默认写入 logging
+    """
+
+    def __init__(self, args, queue, on_change=None, on_log=None, encode_executor=None, cancel_token=None):
+        super().__init__(args, encode_executor, cancel_token)
+        self.queue = queue
+        self.on_change = on_change
+        self.on_log = on_log or logger.info
+        self.completed = 0
+
+    def callback_for(self, video_path):
+        name = os.path.basename(video_path)
+        return lambda message: self.on_log(f"[{name}] {message}")
+
+    def notify(self, key, stage, **info):
+        if stage == "done":
+            fields = dict(status="done", stage="", finished=time.time(), **info)
+            self.completed += 1
+        elif stage == "failed":
+            fields = dict(status="failed", stage="", finished=time.time(), **info)
+        elif stage == "cancelled":
+            # 停止的任务回到等待状态，下次开始时从任务日志记录的阶段继续
+            fields = dict(status="pending", stage="")
+        else:
+            fields = dict(status="running", stage=stage)
+        self.queue.update(key, **fields)
+        if self.on_change:
+            self.on_change(key)
+
+    async def run_queue(self, poll_interval=0.5):
+        """直到队列中没有等待的任务（或被停止）为止"""
+        tasks = {}
+        try:
+            while True:
+                if not self.cancel_token.cancelled:
+                    for item in self.queue.pending():
+                        if item.id not in tasks or tasks[item.id].done():
+                            tasks[item.id] = asyncio.ensure_future(
+                                self.process(item.video_path, item.settings(), item.id)
+                            )
+                running = [task for task in tasks.values() if not task.done()]
+                if not running:
+                    break
+                await asyncio.wait(running, timeout=poll_interval)
+        finally:
+            self.whisper_executor.shutdown()
+            self.encode_executor.shutdown()
+        return self.completed
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m batch", description="批量为视频生成中文配音")
+    parser.add_argument("inputs", nargs="*", help="视频目录或通配符")
+    parser.add_argument("--voice", default="zh-CN-XiaoyiNeural", choices=sorted(dubbing_app.CHINESE_VOICES))
+    parser.add_argument("--speed", type=float, default=1.5, help="语音速度倍数")
+    parser.add_argument("--original-volume", type=float, default=0.1, help="原音频音量 (0-1)")
+    parser.add_argument("--reencode", action="store_true", help="重新编码视频（默认直接复制视频流）")
+    parser.add_argument("--subtitles", default="none", choices=sorted(dubbing_app.SUBTITLE_MODES),
+                        help="输出视频中的字幕：soft 为中英文软字幕轨道，burn 为烧录中文字幕（需要重新编码）")
+    parser.add_argument("--model", default="base", choices=dubbing_app.MODEL_SIZES)
+    parser.add_argument("--decoding", default="beam", choices=sorted(dubbing_app.DECODING_MODES))
+    parser.add_argument("--quantize", action="store_true", help="CPU上使用int8量化模型")
+    parser.add_argument("--whisper-files", type=int, default=4,
+                        help="同时批量转录的视频数，0 表示逐个视频顺序转录")
+    parser.add_argument("--whisper-batch", type=int, default=0, help="每批解码的窗口数，0 表示自适应")
+    parser.add_argument("--encode-workers", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                        help="合并/编码进程数")
+    parser.add_argument("--translate-concurrency", type=int, default=2, help="同时翻译的视频数")
+    parser.add_argument("--tts-videos", type=int, default=2, help="同时生成语音的视频数")
+    parser.add_argument("--tts-concurrency", type=int, default=4, help="每个视频的TTS并发请求数")
+    parser.add_argument("--journal", default=os.path.join("output", "batch_journal.jsonl"), help="任务日志路径")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+
+    videos = collect_videos(args.inputs)
+    if not videos:
+        logger.error("没有找到视频文件")
+        return 1
+    logger.info(f"共 {len(videos)} 个视频，合并进程数 {args.encode_workers}")
+
+    if sys.platform.startswith('win'):
+        asyncio.set_event_loop_policy(asyncio.WindowsSelectorEventLoopPolicy())
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        ok = loop.run_until_complete(BatchRunner(args).run(videos))
+    finally:
+        loop.close()
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
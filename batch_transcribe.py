@@ -0,0 +1,188 @@
+import time
+
+import torch
+import whisper
+from whisper.audio import CHUNK_LENGTH, log_mel_spectrogram, pad_or_trim
+from whisper.tokenizer import get_tokenizer
+
+from model_registry import inference_lock
+from transcribe_stream import iter_span_groups, remap_time
+
+MAX_BATCH_SIZE = 32
+TIME_PRECISION = 0.02  # 每个时间戳 token 对应的秒数
+GPU_MEMORY_FRACTION = 0.6  # 批处理最多使用的空闲显存比例
+# 与 whisper.transcribe 相同的失败判断，命中时该窗口改用逐条转录（带温度回退）
+COMPRESSION_RATIO_THRESHOLD = 2.4
+LOGPROB_THRESHOLD = -1.0
+NO_SPEECH_THRESHOLD = 0.6
+
+
+class BatchTranscriber:
+    """
+    批量转录：把一个或多个文件的语音区间切成不超过 30 秒的窗口，
+    多个窗口的梅尔频谱叠成一个批次，一次前向传播完成解码
+    窗口之间相互独立（不以上一窗口的文本为提示），窗口优先在语音区间之间的静音处切分
+    :param batch_size: 每批窗口数，None 表示自适应（GPU 按空闲显存，CPU 按线程数）
+    :param cancel_token: CancelToken，每批解码之前检查暂停和取消
+    """
+
+    def __init__(self, model, options, device="cpu", batch_size=None, logger=None, cancel_token=None):
+        self.model = model
+        self.cancel_token = cancel_token
+        self.device = device
+        self.fp16 = bool(options.get("fp16")) and device == "cuda"
+        self.options = options
+        self.logger = logger
+        self.decode_options = whisper.DecodingOptions(
+            task="transcribe",
+            language=options.get("language", "en"),
+            beam_size=options.get("beam_size"),
+            fp16=self.fp16,
+            without_timestamps=False
+        )
+        self.tokenizer = get_tokenizer(model.is_multilingual, language=self.decode_options.language,
+                                       task="transcribe")
+        self.batch_size = batch_size or self.adaptive_batch_size()
+        self.audio_seconds = 0.0
+        self.busy = 0.0
+
+    def _info(self, message):
+        if self.logger:
+            self.logger.info(message)
+
+    def _mel(self, samples):
+        return log_mel_spectrogram(pad_or_trim(samples), self.model.dims.n_mels)
+
+    def adaptive_batch_size(self):
+        """GPU 上先用一个窗口试探显存占用，再按空闲显存估算；CPU 上按可用线程数"""
+        if self.device != "cuda":
+            return max(1, min(MAX_BATCH_SIZE, torch.get_num_threads() // 2))
+        torch.cuda.empty_cache()
+        baseline = torch.cuda.memory_allocated()
+        torch.cuda.reset_peak_memory_stats()
+        self._decode([torch.zeros(CHUNK_LENGTH * whisper.audio.SAMPLE_RATE)])
+        per_item = max(1, torch.cuda.max_memory_allocated() - baseline)
+        free, _ = torch.cuda.mem_get_info()
+        return max(1, min(MAX_BATCH_SIZE, int(free * GPU_MEMORY_FRACTION / per_item)))
+
+    def _decode(self, samples_list):
+        mel = torch.stack([self._mel(samples) for samples in samples_list]).to(self.model.device)
+        if self.fp16:
+            mel = mel.half()
+        with torch.no_grad(), inference_lock(self.model):
+            return whisper.decode(self.model, mel, self.decode_options)
+
+    def _segments(self, result, duration):
+        """
+        把带时间戳 token 的解码结果拆成片段：<|0.00|> 文本 <|2.40|><|2.40|> 文本 <|5.00|>
+        与 whisper.transcribe 相同，文本之后的时间戳闭合当前片段，紧随其后的时间戳是下一片段的起始；
+        文本前没有自己的起始时间戳时（<|0.00|> A <|2.40|> B <|5.00|>）以上一片段的结束时间作为起始
+        """
+        timestamp_begin = self.tokenizer.timestamp_begin
+        segments = []
+        start = None
+        last = 0.0  # 最近的时间戳
+        text_tokens = []
+        for token in result.tokens:
+            if token < timestamp_begin:
+                if start is None:
+                    start = last
+                text_tokens.append(token)
+                continue
+            position = (token - timestamp_begin) * TIME_PRECISION
+            if text_tokens:
+                segments.append((start, position, self.tokenizer.decode(text_tokens)))
+                text_tokens = []
+                start = None
+            else:
+                start = position
+            last = position
+        if text_tokens:
+            # 窗口结束时片段还没有闭合
+            segments.append((start, duration, self.tokenizer.decode(text_tokens)))
+        return segments
+
+    def _failed(self, result):
+        if result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob < LOGPROB_THRESHOLD:
+            return False  # 静音窗口，直接丢弃即可
+        return result.compression_ratio > COMPRESSION_RATIO_THRESHOLD or result.avg_logprob < LOGPROB_THRESHOLD
+
+    def _run(self, chunks, results):
+        """解码一批窗口；显存不足时把批次减半重试"""
+        started = time.perf_counter()
+        try:
+            decoded = self._decode([samples for _, samples, _ in chunks])
+        except RuntimeError as e:
+            if "out of memory" not in str(e) or len(chunks) == 1:
+                raise
+            torch.cuda.empty_cache()
+            self.batch_size = max(1, len(chunks) // 2)
+            self._info(f"显存不足，批大小降为 {self.batch_size}")
+            for i in range(0, len(chunks), self.batch_size):
+                self._run(chunks[i:i + self.batch_size], results)
+            return
+
+        for (key, samples, mapping), result in zip(chunks, decoded):
+            duration = len(samples) / whisper.audio.SAMPLE_RATE
+            if self._failed(result):
+                # 批量解码不支持温度回退，失败的窗口单独用 transcribe 重做
+                with inference_lock(self.model):
+                    retried = self.model.transcribe(samples, **self.options)
+                segments = [(seg["start"], seg["end"], seg["text"]) for seg in retried["segments"]]
+            elif result.no_speech_prob > NO_SPEECH_THRESHOLD and result.avg_logprob < LOGPROB_THRESHOLD:
+                segments = []
+            else:
+                segments = self._segments(result, duration)
+            for start, end, text in segments:
+                text = text.strip()
+                if text:
+                    results[key].append({
+                        "start": remap_time(start, mapping, True),
+                        "end": remap_time(end, mapping, False),
+                        "text": text
+                    })
+            self.audio_seconds += duration
+
+        elapsed = time.perf_counter() - started
+        self.busy += elapsed
+        seconds = sum(len(samples) for _, samples, _ in chunks) / whisper.audio.SAMPLE_RATE
+        self._info(f"批量转录 {len(chunks)} 个窗口（{seconds:.0f}秒音频）: {elapsed:.1f}秒, "
+                   f"{seconds / elapsed:.1f} 秒音频/秒")
+
+    def _run_checked(self, chunks, results, on_batch):
+        if self.cancel_token:
+            self.cancel_token.check()
+        self._run(chunks, results)
+        if on_batch:
+            on_batch(self.audio_seconds)
+
+    def transcribe_many(self, sources, on_batch=None):
+        """
+        :param sources: [(key, path, spans), ...]，spans 为该文件需要转录的区间（秒）
+        :param on_batch: 每解码完一批调用 on_batch(累计已解码的音频秒数)
+        :return: {key: [{"start", "end", "text"}, ...]}，时间为各自原文件时间轴上的秒数
+        """
+        results = {key: [] for key, _, _ in sources}
+        pending = []
+        for key, path, spans in sources:
+            for samples, mapping in iter_span_groups(path, spans, CHUNK_LENGTH):
+                pending.append((key, samples, mapping))
+                if len(pending) >= self.batch_size:
+                    self._run_checked(pending, results, on_batch)
+                    pending = []
+        if pending:
+            self._run_checked(pending, results, on_batch)
+
+        for segments in results.values():
+            segments.sort(key=lambda seg: seg["start"])
+            last_end = 0.0
+            for seg in segments:
+                seg["start"] = max(seg["start"], last_end)
+                seg["end"] = max(seg["end"], seg["start"])
+                last_end = seg["end"]
+        return results
+
+    @property
+    def throughput(self):
+        """累计吞吐量（秒音频/秒）"""
+        return self.audio_seconds / self.busy if self.busy else 0.0
@@ -0,0 +1,574 @@
+import argparse
+import asyncio
+import logging
+import os
+import shutil
+import tempfile
+import time
+
+# 设置日志
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+
+class FakeCommunicate:
+    """本地假 Communicate，用固定延迟模拟 Edge TTS 的网络往返"""
+    latency = 0.2
+
+    def __init__(self, text, voice, rate=None):
+        self.text = text
+        self.voice = voice
+        self.rate = rate
+
+    async def save(self, audio_fname):
+        await asyncio.sleep(self.latency)
+        with open(audio_fname, "wb") as f:
+            f.write(self.text.encode("utf-8"))
+
+
+def bench_tts(args):
+    from tts_engine import SpeechSynthesizer
+
+    logger.info("=== TTS 并发合成基准测试 ===")
+    FakeCommunicate.latency = args.latency
+    temp_dir = tempfile.mkdtemp(prefix="bench_tts_")
+    try:
+        jobs = [(f"第{i}条字幕", os.path.join(temp_dir, f"speech_{i}.mp3")) for i in range(args.cues)]
+        baseline = None
+        for concurrency in args.concurrency:
+            synthesizer = SpeechSynthesizer(
+                "zh-CN-XiaoyiNeural",
+                concurrency=concurrency,
+                communicate_factory=FakeCommunicate
+            )
+            start = time.perf_counter()
+            results = asyncio.run(synthesizer.synthesize(jobs))
+            elapsed = time.perf_counter() - start
+            assert results == [path for _, path in jobs], "输出顺序与字幕顺序不一致"
+            baseline = baseline or elapsed
+            logger.info(f"并发数 {concurrency:3d}: {elapsed:6.2f}秒, 加速比 {baseline / elapsed:5.2f}x")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+class StubBackend:
+    """本地翻译桩，统计请求次数并模拟网络延迟"""
+    name = "stub"
+    source = "en"
+    target = "zh-CN"
+    max_chars = 4500
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.calls = 0
+
+    def translate(self, text):
+        self.calls += 1
+        time.sleep(self.latency)
+        return "\n".join(f"[译]{line}" for line in text.split("\n"))
+
+
+def bench_translate(args):
+    from translation import BatchTranslator, TranslationMemory
+
+    logger.info("=== 批量翻译 + 翻译记忆基准测试 ===")
+    # 模拟真实字幕：带有大量重复行
+    texts = [f"Line number {i % args.unique}." for i in range(args.cues)]
+    temp_dir = tempfile.mkdtemp(prefix="bench_translate_")
+    try:
+        memory = TranslationMemory(os.path.join(temp_dir, "memory.db"))
+        for run in ("逐行翻译", "批量翻译(首次)", "批量翻译(重复处理)"):
+            backend = StubBackend(args.latency)
+            start = time.perf_counter()
+            if run == "逐行翻译":
+                translated = [backend.translate(text) for text in texts]
+            else:
+                translator = BatchTranslator(backend, memory)
+                translated = translator.translate_many(texts)
+            elapsed = time.perf_counter() - start
+            assert translated == [f"[译]{text}" for text in texts], "批量拆分结果与原文不对齐"
+            logger.info(f"{run}: {elapsed:6.2f}秒, 后端请求 {backend.calls} 次")
+        memory.close()
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def bench_merge(args):
+    import app
+    from moviepy.editor import VideoFileClip
+
+    logger.info("=== 视频合并基准测试：视频流复制 vs 重新编码 ===")
+    with VideoFileClip(args.video) as video:
+        minutes = video.duration / 60
+    temp_dir = tempfile.mkdtemp(prefix="bench_merge_")
+    try:
+        # 不需要真实配音，字幕清单只用于保存工程清单
+        cn_srt = os.path.join(temp_dir, "bench_cn.srt")
+        timings = {}
+        for name, reencode in (("视频流复制", False), ("重新编码", True)):
+            start = time.perf_counter()
+            app.merge_video_audio(args.video, [], cn_srt, incremental=False, reencode=reencode)
+            timings[name] = time.perf_counter() - start
+            logger.info(f"{name}: {timings[name]:7.2f}秒 ({timings[name] / minutes:6.2f}秒/每分钟视频)")
+        saved = (timings["重新编码"] - timings["视频流复制"]) / minutes
+        logger.info(f"每分钟源视频节省 {saved:.2f}秒")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def bench_mix(args):
+    from audio_mixer import AudioMixer
+    from ffmpeg_utils import run_ffmpeg
+
+    logger.info("=== NumPy 混音基准测试 ===")
+    temp_dir = tempfile.mkdtemp(prefix="bench_mix_")
+    try:
+        clip_path = os.path.join(temp_dir, "clip.mp3")
+        run_ffmpeg(["-f", "lavfi", "-i", "sine=frequency=660", "-t", "2", clip_path])
+        for cues in args.cues:
+            # 每条字幕占 4 秒时间轴
+            duration = cues * 4
+            original_path = os.path.join(temp_dir, f"original_{cues}.wav")
+            run_ffmpeg(["-f", "lavfi", "-i", "sine=frequency=440", "-t", str(duration), original_path])
+            start = time.perf_counter()
+            mixer = AudioMixer(duration)
+            for i in range(cues):
+                mixer.place_file(clip_path, i * 4)
+            mixer.write(os.path.join(temp_dir, "mix.wav"), original_path, 0.1)
+            mixer.close()
+            elapsed = time.perf_counter() - start
+            logger.info(f"{cues:5d} 条字幕 / {duration / 60:6.1f}分钟: {elapsed:6.2f}秒, "
+                        f"{elapsed / cues * 1000:6.2f}毫秒/条")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def read_srt_text(path):
+    """读取 SRT 中的全部字幕文本"""
+    from srt_model import iter_cues
+    return " ".join(cue.plain_text for cue in iter_cues(path))
+
+
+def bench_srt(args):
+    import tracemalloc
+    from srt_model import Cue, SubtitleTrack, iter_cues, write_srt
+
+    logger.info("=== SRT 解析/写出基准测试 ===")
+    temp_dir = tempfile.mkdtemp(prefix="bench_srt_")
+    try:
+        path = os.path.join(temp_dir, "bench.srt")
+        # 每 5 条字幕中有一条是两行文本
+        cues = [
+            Cue(i * 2000, i * 2000 + 1500, f"Subtitle number {i}" + ("\nsecond line" if i % 5 == 0 else ""))
+            for i in range(args.cues)
+        ]
+        start = time.perf_counter()
+        write_srt(path, cues)
+        write_time = time.perf_counter() - start
+        size_mb = os.path.getsize(path) / 1024 ** 2
+
+        start = time.perf_counter()
+        count = sum(1 for _ in iter_cues(path))
+        stream_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        track = SubtitleTrack.read(path)
+        read_time = time.perf_counter() - start
+        # tracemalloc 会明显拖慢解析，内存单独测量
+        tracemalloc.start()
+        SubtitleTrack.read(path)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        round_trip = list(track) == cues
+        logger.info(f"{args.cues} 条字幕, 文件 {size_mb:.1f}MB")
+        logger.info(f"写出: {write_time:6.2f}秒 ({args.cues / write_time:9.0f} 条/秒)")
+        logger.info(f"流式解析: {stream_time:6.2f}秒 ({count / stream_time:9.0f} 条/秒)")
+        logger.info(f"读入字幕轨: {read_time:6.2f}秒, 峰值内存 {peak / 1024 ** 2:.1f}MB")
+        logger.info(f"往返一致: {'是' if round_trip else '否'}")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def bench_vad(args):
+    from vad import detect_speech
+
+    logger.info("=== 语音活动检测基准测试 ===")
+    start = time.perf_counter()
+    spans, duration = detect_speech(args.video)
+    elapsed = time.perf_counter() - start
+    speech = sum(end - start for start, end in spans)
+    logger.info(f"音频 {duration:.1f}秒, 语音 {len(spans)} 段 / {speech:.1f}秒 ({speech / duration * 100:.0f}%)")
+    logger.info(f"预处理耗时 {elapsed:.2f}秒, 实时率 {elapsed / duration:.4f} ({duration / elapsed:.0f} 倍实时)")
+    if not args.transcribe:
+        return
+
+    import app
+    from transcribe_stream import transcribe_spans
+
+    profile = app.make_profile(args.model, "greedy", False)
+    model = app.get_model(profile=profile)
+    options = app.transcribe_options(profile)
+    start = time.perf_counter()
+    full = model.transcribe(args.video, **options)["segments"]
+    full_time = time.perf_counter() - start
+    start = time.perf_counter()
+    partial = list(transcribe_spans(model, args.video, options, spans))
+    vad_time = time.perf_counter() - start + elapsed
+    logger.info(f"整段转录: {full_time:6.1f}秒, {len(full)} 条字幕")
+    logger.info(f"仅语音区间: {vad_time:6.1f}秒 (含预处理), {len(partial)} 条字幕, "
+                f"节省 {(1 - vad_time / full_time) * 100:.0f}%")
+
+
+def word_error_rate(reference, hypothesis):
+    """按单词计算编辑距离得到 WER（忽略大小写和标点）"""
+    import re
+    normalize = lambda text: re.sub(r"[^\w\s']", " ", text.lower()).split()
+    ref, hyp = normalize(reference), normalize(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i] + [0] * len(hyp)
+        for j, hyp_word in enumerate(hyp, 1):
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (ref_word != hyp_word))
+        previous = current
+    return previous[-1] / len(ref)
+
+
+def bench_whisper(args):
+    import app
+    from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+    logger.info("=== Whisper 档位基准测试：实时率 (RTF) 与 WER ===")
+    # 样例目录中每个视频/音频文件需要一个同名的参考字幕 (.srt)
+    clips = []
+    for name in sorted(os.listdir(args.clips)):
+        path = os.path.join(args.clips, name)
+        reference = os.path.splitext(path)[0] + ".srt"
+        if not name.endswith(".srt") and os.path.exists(reference):
+            clips.append((path, reference, ffmpeg_parse_infos(path)["duration"]))
+    if not clips:
+        logger.error("样例目录中没有找到带参考字幕的视频")
+        return
+    total_audio = sum(duration for _, _, duration in clips)
+
+    quantize_options = [False, True] if app.DEVICE == "cpu" else [False]
+    for model_size in args.models:
+        for decoding in args.decoding:
+            for quantize in quantize_options:
+                profile = app.make_profile(model_size, decoding, quantize)
+                app.get_model(profile=profile)  # 预先加载，不计入转录耗时
+                options = app.transcribe_options(profile)
+                elapsed = 0.0
+                errors = []
+                for path, reference, _ in clips:
+                    start = time.perf_counter()
+                    result = app.get_model(profile=profile).transcribe(path, **options)
+                    elapsed += time.perf_counter() - start
+                    errors.append(word_error_rate(read_srt_text(reference), result["text"]))
+                logger.info(
+                    f"{model_size:6s} {decoding:6s} {'int8' if quantize else app.model_dtype(profile):8s}: "
+                    f"RTF {elapsed / total_audio:5.3f}, WER {sum(errors) / len(errors) * 100:5.1f}%"
+                )
+
+
+def bench_whisper_batch(args):
+    import app
+    from batch_transcribe import BatchTranscriber
+    from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+    logger.info("=== Whisper 批量解码吞吐量基准测试 ===")
+    paths = [os.path.join(args.clips, name) for name in sorted(os.listdir(args.clips))
+             if os.path.splitext(name)[1].lower() in (".mp4", ".mkv", ".mov", ".avi", ".wav", ".mp3")]
+    if not paths:
+        logger.error("样例目录中没有找到音视频文件")
+        return
+    sources = [(i, path, [(0.0, ffmpeg_parse_infos(path)["duration"])]) for i, path in enumerate(paths)]
+    total_audio = sum(spans[0][1] for _, _, spans in sources)
+    profile = app.make_profile(args.model, "greedy", False)
+    model = app.get_model(profile=profile)
+    options = app.transcribe_options(profile)
+
+    start = time.perf_counter()
+    for path in paths:
+        model.transcribe(path, **options)
+    elapsed = time.perf_counter() - start
+    logger.info(f"逐个文件 transcribe: {total_audio / elapsed:7.1f} 秒音频/秒")
+
+    auto = BatchTranscriber(model, options, app.DEVICE).batch_size
+    for batch_size in args.batch_sizes:
+        transcriber = BatchTranscriber(model, options, app.DEVICE, batch_size)
+        start = time.perf_counter()
+        transcriber.transcribe_many(sources)
+        elapsed = time.perf_counter() - start
+        marker = " (自适应选择)" if batch_size == auto else ""
+        logger.info(f"批大小 {batch_size:3d}: {total_audio / elapsed:7.1f} 秒音频/秒{marker}")
+    logger.info(f"自适应批大小: {auto}")
+
+
+HEAVY_MODULES = ["torch", "whisper", "moviepy", "edge_tts", "deep_translator"]
+
+
+def parse_importtime(stderr, module):
+    """
+    解析 python -X importtime 的输出
+    :return: (module 的累计导入耗时（微秒）, [(直接依赖, 累计耗时), ...], 导入过的顶层包集合)
+    """
+    total = None
+    children = []
+    packages = set()
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|", 2)
+        depth = (len(name) - len(name.lstrip())) // 2
+        name = name.strip()
+        packages.add(name.split(".")[0])
+        entries.append((depth, name, int(cumulative)))
+    # 子模块先于父模块输出：module 之前、缩进恰好多一级的条目是它的直接依赖
+    for index, (depth, name, cumulative) in enumerate(entries):
+        if name == module and depth == 0:
+            total = cumulative
+            for child_depth, child_name, child_cumulative in reversed(entries[:index]):
+                if child_depth == 0:
+                    break
+                if child_depth == 1:
+                    children.append((child_name, child_cumulative))
+            break
+    return total, sorted(children, key=lambda item: -item[1]), packages
+
+
+def bench_importtime(args):
+    import subprocess
+    import sys
+
+    logger.info("=== 模块导入耗时基准测试 (python -X importtime) ===")
+    failed = False
+    for module in args.modules:
+        best = None
+        for _ in range(args.repeat):
+            result = subprocess.run(
+                [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.PIPE,
+                text=True
+            )
+            if result.returncode != 0:
+                error = [line for line in result.stderr.splitlines() if not line.startswith("import time:")]
+                logger.error(f"{module}: 导入失败\n" + "\n".join(error[-5:]))
+                failed = True
+                break
+            parsed = parse_importtime(result.stderr, module)
+            if best is None or parsed[0] < best[0]:
+                best = parsed
+        if best is None:
+            continue
+
+        total, children, packages = best
+        heavy = [name for name in HEAVY_MODULES if name in packages]
+        logger.info(f"{module}: {total / 1000:8.1f}ms（{args.repeat} 次取最小值）")
+        for name, cumulative in children[:args.top]:
+            logger.info(f"    {name:32s} {cumulative / 1000:8.1f}ms")
+        logger.info(f"    重量级依赖: {', '.join(heavy) if heavy else '无'}")
+        if args.budget_ms and total / 1000 > args.budget_ms:
+            logger.error(f"{module}: 导入耗时超出预算 {args.budget_ms:.0f}ms")
+            failed = True
+    if failed:
+        sys.exit(1)
+
+
+def bench_encoders(args):
+    from encoder_probe import CANDIDATES, EncoderProbe
+
+    logger.info("=== 视频编码器探测 ===")
+    probe = EncoderProbe(args.cache)
+    results = probe.results(refresh=args.refresh)
+    for candidate in CANDIDATES:
+        result = results.get(candidate.key, {})
+        if result.get("ok"):
+            logger.info(f"{str(candidate):28s} 质量等级 {candidate.quality}: {result['fps']:8.1f} 帧/秒")
+        else:
+            logger.info(f"{str(candidate):28s} 不可用: {result.get('error', '未探测')}")
+    for quality in (3, 2, 1):
+        logger.info(f"质量等级 >= {quality} 时选择: {probe.choose(quality)}")
+
+
+def count_frames(video_path):
+    """视频流的帧数（framecrc 每个数据包输出一行，流复制，不解码）"""
+    from ffmpeg_utils import run_ffmpeg
+
+    result = run_ffmpeg(["-i", video_path, "-map", "0:v:0", "-c", "copy", "-f", "framecrc", "-"])
+    return sum(1 for line in result.stdout.splitlines() if line and not line.startswith(b"#"))
+
+
+def bench_render(args):
+    from encoder_probe import EncoderProbe
+    from ffmpeg_utils import render_video, run_ffmpeg
+
+    logger.info("=== 渲染后端基准测试：MoviePy 逐帧管道 vs ffmpeg 滤镜图 ===")
+    encoder = EncoderProbe(os.path.join("model_cache", "encoder_probe.json")).choose(args.quality)
+    frames = count_frames(args.video)
+    logger.info(f"编码器: {encoder}，{frames} 帧")
+    temp_dir = tempfile.mkdtemp(prefix="bench_render_")
+    try:
+        mix_path = os.path.join(temp_dir, "mix.wav")
+        run_ffmpeg(["-i", args.video, "-vn", "-ac", "2", "-ar", "44100", mix_path])
+        output_path = os.path.join(temp_dir, "output.mp4")
+        timings = {}
+
+        try:
+            from moviepy.editor import AudioFileClip, VideoFileClip
+        except ImportError:
+            logger.warning("未安装 MoviePy，跳过 MoviePy 对比")
+        else:
+            start = time.perf_counter()
+            with VideoFileClip(args.video, audio=False) as video, AudioFileClip(mix_path) as audio:
+                video.set_audio(audio).write_videofile(
+                    output_path, codec=encoder.codec, audio_codec="aac", audio_bitrate="192k",
+                    threads=8, fps=video.fps, preset=encoder.preset or "medium",
+                    ffmpeg_params=list(encoder.params), logger=None
+                )
+            timings["MoviePy 逐帧管道"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        render_video(args.video, mix_path, output_path, encoder)
+        timings["ffmpeg 滤镜图"] = time.perf_counter() - start
+
+        for name, elapsed in timings.items():
+            logger.info(f"{name}: {elapsed:7.2f}秒, {frames / elapsed:8.1f} 帧/秒")
+        if len(timings) == 2:
+            logger.info(f"加速比 {timings['MoviePy 逐帧管道'] / timings['ffmpeg 滤镜图']:.2f}x")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def bench_segmented(args):
+    import wave
+    from encoder_probe import EncoderProbe
+    from ffmpeg_utils import run_ffmpeg
+    from segmented_encode import encode_segmented
+
+    logger.info("=== 重新编码基准测试：MoviePy 单管道 vs 分段并行编码 ===")
+    encoder = EncoderProbe(os.path.join("model_cache", "encoder_probe.json")).choose(args.quality)
+    logger.info(f"编码器: {encoder}，CPU 核数: {os.cpu_count()}")
+    temp_dir = tempfile.mkdtemp(prefix="bench_segmented_")
+    try:
+        # 用原音轨代替混音结果
+        mix_path = os.path.join(temp_dir, "mix.wav")
+        run_ffmpeg(["-i", args.video, "-vn", "-ac", "2", "-ar", "44100", mix_path])
+        with wave.open(mix_path, "rb") as wav:
+            duration = wav.getnframes() / wav.getframerate()
+        output_path = os.path.join(temp_dir, "output.mp4")
+
+        baseline = None
+        if not args.skip_moviepy:
+            try:
+                from moviepy.editor import AudioFileClip, VideoFileClip
+            except ImportError:
+                logger.warning("未安装 MoviePy，跳过单管道对比")
+            else:
+                start = time.perf_counter()
+                with VideoFileClip(args.video, audio=False) as video, AudioFileClip(mix_path) as audio:
+                    video.set_audio(audio).write_videofile(
+                        output_path, codec=encoder.codec, audio_codec="aac", audio_bitrate="192k",
+                        threads=8, fps=video.fps, preset=encoder.preset or "medium",
+                        ffmpeg_params=list(encoder.params), logger=None
+                    )
+                baseline = time.perf_counter() - start
+                logger.info(f"MoviePy 单管道: {baseline:7.2f}秒 ({duration / baseline:5.2f}x 实时)")
+
+        for workers in args.workers:
+            start = time.perf_counter()
+            segments = encode_segmented(args.video, mix_path, output_path, encoder, duration, workers)
+            elapsed = time.perf_counter() - start
+            baseline = baseline or elapsed
+            logger.info(f"{workers:3d} 个进程（{segments:3d} 段）: {elapsed:7.2f}秒 "
+                        f"({duration / elapsed:5.2f}x 实时), 加速比 {baseline / elapsed:5.2f}x")
+    finally:
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="视频配音助手性能基准测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    tts_parser = subparsers.add_parser("tts", help="TTS 并发合成（使用本地假 Communicate）")
+    tts_parser.add_argument("--cues", type=int, default=100, help="字幕条数")
+    tts_parser.add_argument("--latency", type=float, default=0.2, help="每次合成的模拟延迟（秒）")
+    tts_parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    tts_parser.set_defaults(func=bench_tts)
+
+    translate_parser = subparsers.add_parser("translate", help="批量翻译与翻译记忆（使用本地翻译桩）")
+    translate_parser.add_argument("--cues", type=int, default=900, help="字幕条数")
+    translate_parser.add_argument("--unique", type=int, default=600, help="不重复的字幕行数")
+    translate_parser.add_argument("--latency", type=float, default=0.02, help="每次请求的模拟延迟（秒）")
+    translate_parser.set_defaults(func=bench_translate)
+
+    merge_parser = subparsers.add_parser("merge", help="视频合并：视频流复制与重新编码对比")
+    merge_parser.add_argument("video", help="用于测试的视频文件")
+    merge_parser.set_defaults(func=bench_merge)
+
+    mix_parser = subparsers.add_parser("mix", help="NumPy 混音（使用合成的测试音频）")
+    mix_parser.add_argument("--cues", type=int, nargs="+", default=[100, 200, 400, 800])
+    mix_parser.set_defaults(func=bench_mix)
+
+    srt_parser = subparsers.add_parser("srt", help="SRT 解析与写出的吞吐量和往返一致性")
+    srt_parser.add_argument("--cues", type=int, default=100000, help="字幕条数")
+    srt_parser.set_defaults(func=bench_srt)
+
+    vad_parser = subparsers.add_parser("vad", help="语音活动检测预处理的速度，以及跳过静音节省的转录时间")
+    vad_parser.add_argument("video", help="用于测试的视频文件")
+    vad_parser.add_argument("--transcribe", action="store_true", help="同时对比整段转录与仅转录语音区间的耗时")
+    vad_parser.add_argument("--model", default="base", help="对比转录时使用的模型")
+    vad_parser.set_defaults(func=bench_vad)
+
+    whisper_parser = subparsers.add_parser("whisper", help="Whisper 各档位的实时率与 WER")
+    whisper_parser.add_argument("clips", help="样例目录，每个视频需有同名的参考字幕 .srt")
+    whisper_parser.add_argument("--models", nargs="+", default=["tiny", "base", "small", "medium"])
+    whisper_parser.add_argument("--decoding", nargs="+", default=["greedy", "beam"])
+    whisper_parser.set_defaults(func=bench_whisper)
+
+    batch_parser = subparsers.add_parser("whisper-batch", help="Whisper 批量解码在不同批大小下的吞吐量")
+    batch_parser.add_argument("clips", help="样例音视频目录")
+    batch_parser.add_argument("--model", default="base", help="使用的模型")
+    batch_parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    batch_parser.set_defaults(func=bench_whisper_batch)
+
+    importtime_parser = subparsers.add_parser("importtime", help="模块导入耗时（界面启动速度），超出预算时返回非零状态")
+    importtime_parser.add_argument("modules", nargs="*", default=["gui", "app"], help="要测量的模块")
+    importtime_parser.add_argument("--repeat", type=int, default=3, help="每个模块测量次数，取最小值")
+    importtime_parser.add_argument("--top", type=int, default=10, help="列出耗时最多的直接依赖个数")
+    importtime_parser.add_argument("--budget-ms", type=float, default=None, help="导入耗时预算（毫秒）")
+    importtime_parser.set_defaults(func=bench_importtime)
+
+    render_parser = subparsers.add_parser("render", help="重新编码的渲染后端：MoviePy 逐帧管道与 ffmpeg 滤镜图的帧率")
+    render_parser.add_argument("video", help="用于测试的视频文件")
+    render_parser.add_argument("--quality", type=int, default=3, help="编码器最低质量等级")
+    render_parser.set_defaults(func=bench_render)
+
+    segmented_parser = subparsers.add_parser("segmented", help="重新编码：MoviePy 单管道与分段并行编码在不同进程数下的耗时")
+    segmented_parser.add_argument("video", help="用于测试的视频文件")
+    segmented_parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, 8, 16],
+                                  help="并行编码的 ffmpeg 进程数")
+    segmented_parser.add_argument("--quality", type=int, default=3, help="编码器最低质量等级")
+    segmented_parser.add_argument("--skip-moviepy", action="store_true", help="不测试 MoviePy 单管道")
+    segmented_parser.set_defaults(func=bench_segmented)
+
+    encoders_parser = subparsers.add_parser("encoders", help="本机 ffmpeg 可用的视频编码器及其速度")
+    encoders_parser.add_argument("--cache", default=os.path.join("model_cache", "encoder_probe.json"),
+                                 help="探测结果缓存文件")
+    encoders_parser.add_argument("--refresh", action="store_true", help="忽略缓存重新探测")
+    encoders_parser.set_defaults(func=bench_encoders)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,115 @@
+import asyncio
+import contextlib
+import os
+import threading
+
+POLL_INTERVAL = 0.1  # 异步任务和暂停状态检查取消的间隔（秒）
+
+
+class Cancelled(Exception):
+    """任务被用户取消"""
+
+    def __init__(self, message="任务已取消"):
+        super().__init__(message)
+
+
+class CancelToken:
+    """
+    协作式取消和暂停
+    工作线程在检查点（每条字幕、每个音频块、每个解码窗口、每帧）调用 check()：
+    暂停时在检查点阻塞，取消后抛出 Cancelled；cancel() 可以在任意线程调用，
+    同时终止通过 attach_process 登记的 ffmpeg 子进程，不必等它自然结束
+    """
+
+    def __init__(self):
+        self._cancelled = threading.Event()
+        self._running = threading.Event()
+        self._running.set()
+        self._processes = set()
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    @property
+    def paused(self):
+        return not self._running.is_set()
+
+    def cancel(self):
+        self._cancelled.set()
+        self._running.set()  # 唤醒暂停中的检查点，让它抛出 Cancelled
+        with self._lock:
+            processes = list(self._processes)
+        for process in processes:
+            _terminate(process)
+
+    def pause(self):
+        if not self.cancelled:
+            self._running.clear()
+
+    def resume(self):
+        self._running.set()
+
+    def check(self):
+        """检查点：暂停时阻塞直到继续或取消，已取消时抛出 Cancelled"""
+        self._running.wait()
+        if self._cancelled.is_set():
+            raise Cancelled()
+
+    async def check_async(self):
+        """协程中的检查点，暂停时不阻塞事件循环"""
+        while not self._running.is_set():
+            await asyncio.sleep(POLL_INTERVAL)
+        if self._cancelled.is_set():
+            raise Cancelled()
+
+    @contextlib.contextmanager
+    def attach_process(self, process):
+        """登记子进程，取消时将其终止"""
+        with self._lock:
+            self._processes.add(process)
+        if self.cancelled:
+            _terminate(process)
+        try:
+            yield process
+        finally:
+            with self._lock:
+                self._processes.discard(process)
+
+
+def _terminate(process):
+    if process.poll() is None:
+        try:
+            process.kill()
+        except OSError:
+            pass
+
+
+async def run_cancellable(awaitable, cancel_token):
+    """
+    运行协程，令牌取消后在 POLL_INTERVAL 内取消它（包括正在进行的网络请求）并抛出 Cancelled
+    """
+    task = asyncio.ensure_future(awaitable)
+    while not task.done():
+        await asyncio.wait({task}, timeout=POLL_INTERVAL)
+        if cancel_token.cancelled and not task.done():
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+            raise Cancelled()
+    return task.result()
+
+
+@contextlib.contextmanager
+def removing_on_cancel(*paths):
+    """取消时删除尚未完成的输出文件"""
+    try:
+        yield
+    except Cancelled:
+        for path in paths:
+            if path and os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+        raise
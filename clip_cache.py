@@ -0,0 +1,117 @@
+import hashlib
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+
+
+class ClipCache:
+    """
+    按内容寻址的 TTS 语音片段缓存
+    键为 (文本, voice_id, rate 字符串) 的哈希，总大小超过 max_bytes 时按最近最少使用 (LRU) 淘汰
+    """
+
+    def __init__(self, root, max_bytes=1024 * 1024 * 1024, extension=".mp3"):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.extension = extension
+        self.lock = threading.Lock()
+        self.entries = None  # OrderedDict: path -> size，按访问时间从旧到新排列
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(text, voice_id, rate_str):
+        payload = json.dumps([text, voice_id, rate_str or ""], ensure_ascii=False)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def path_for(self, key):
+        return os.path.join(self.root, key[:2], key + self.extension)
+
+    def contains(self, path):
+        """判断文件是否位于缓存目录中（缓存文件不能被当作临时文件删除）"""
+        root = os.path.abspath(self.root)
+        path = os.path.abspath(path)
+        return path.endswith(self.extension) and os.path.commonpath([root, path]) == root
+
+    def _load(self):
+        # 首次使用时扫描缓存目录，按修改时间建立 LRU 顺序
+        if self.entries is not None:
+            return
+        files = []
+        if os.path.isdir(self.root):
+            for dirpath, _, filenames in os.walk(self.root):
+                for name in filenames:
+                    if not name.endswith(self.extension):
+                        continue
+                    path = os.path.join(dirpath, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    files.append((stat.st_mtime, path, stat.st_size))
+        files.sort()
+        self.entries = OrderedDict((path, size) for _, path, size in files)
+        self.total_bytes = sum(self.entries.values())
+
+    def get(self, text, voice_id, rate_str):
+        """命中时返回缓存文件路径并刷新其访问时间，否则返回 None"""
+        path = self.path_for(self.make_key(text, voice_id, rate_str))
+        with self.lock:
+            self._load()
+            if path in self.entries and os.path.exists(path):
+                self.entries.move_to_end(path)
+                try:
+                    os.utime(path, None)
+                except OSError:
+                    pass
+                self.hits += 1
+                return path
+            self.entries.pop(path, None)
+            self.misses += 1
+            return None
+
+    def temp_path(self, text, voice_id, rate_str):
+        """合成时使用的临时文件路径，写完后通过 put 原子地移入缓存"""
+        path = self.path_for(self.make_key(text, voice_id, rate_str))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        return f"{path}.{uuid.uuid4().hex}.part"
+
+    def put(self, text, voice_id, rate_str, source_path):
+        """把已合成的文件移入缓存，返回缓存文件路径"""
+        path = self.path_for(self.make_key(text, voice_id, rate_str))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.replace(source_path, path)
+        with self.lock:
+            self._load()
+            self.total_bytes -= self.entries.pop(path, 0)
+            size = os.path.getsize(path)
+            self.entries[path] = size
+            self.total_bytes += size
+            self._evict(keep=path)
+        return path
+
+    def _evict(self, keep=None):
+        while self.total_bytes > self.max_bytes and len(self.entries) > 1:
+            path, size = next(iter(self.entries.items()))
+            if path == keep:
+                self.entries.move_to_end(path)
+                continue
+            del self.entries[path]
+            self.total_bytes -= size
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    def stats(self):
+        with self.lock:
+            self._load()
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "files": len(self.entries),
+                "bytes": self.total_bytes
+            }
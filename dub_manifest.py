@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+
+MANIFEST_VERSION = 1
+
+
+def manifest_path_for(cn_srt):
+    """工程清单保存在中文字幕旁边：subtitles/{base}_cn.manifest.json"""
+    return os.path.splitext(cn_srt)[0] + ".manifest.json"
+
+
+def mix_path_for(base_name, root):
+    """上次的混音保存在缓存目录中：{root}/{base}_mix.wav"""
+    return os.path.join(root, f"{base_name}_mix.wav")
+
+
+def prune_mixes(root, max_bytes, keep=None):
+    """混音目录超过 max_bytes 时删除最久未使用的混音，被删除混音的视频下次处理时重新完整混音"""
+    entries = []
+    for name in os.listdir(root):
+        path = os.path.join(root, name)
+        if not name.endswith("_mix.wav") or path == keep:
+            continue
+        try:
+            stat = os.stat(path)
+        except OSError:
+            continue
+        entries.append((stat.st_mtime, path, stat.st_size))
+    entries.sort()
+    total = sum(size for _, _, size in entries)
+    if keep and os.path.exists(keep):
+        total += os.path.getsize(keep)
+    for _, path, size in entries:
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except OSError:
+            continue
+        total -= size
+
+
+def file_digest(path):
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def cue_hash(start, clip_digest):
+    """字幕条目的哈希：起始时间 + 语音片段内容，任意一项变化都视为改动"""
+    return hashlib.sha256(f"{start:.3f}|{clip_digest}".encode("utf-8")).hexdigest()
+
+
+def merge_ranges(ranges, gap=0.0):
+    """合并重叠（或间隔小于 gap）的时间区间"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1] + gap:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+class DubManifest:
+    """
+    增量配音的工程清单
+    记录上次配音时每条字幕的哈希、语音片段路径和时长，以及上次的混音文件和输出文件，
+    再次处理时只需重新混音发生变化的时间区间
+    """
+
+    def __init__(self, path, settings=None, cues=None, mix_path=None, output_path=None, subtitles=None):
+        self.path = path
+        self.settings = settings or {}
+        self.cues = cues or []  # [{"hash", "clip", "start", "duration"}, ...]
+        self.mix_path = mix_path
+        self.output_path = output_path
+        self.subtitles = subtitles  # 输出视频中的字幕（方式、字幕文件哈希、样式），只影响输出能否直接复用
+
+    @classmethod
+    def load(cls, path):
+        """读取工程清单，不存在或格式不兼容时返回 None"""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != MANIFEST_VERSION:
+            return None
+        return cls(path, data.get("settings"), data.get("cues"), data.get("mix_path"), data.get("output_path"),
+                   data.get("subtitles"))
+
+    def save(self):
+        data = {
+            "version": MANIFEST_VERSION,
+            "settings": self.settings,
+            "cues": self.cues,
+            "mix_path": self.mix_path,
+            "output_path": self.output_path,
+            "subtitles": self.subtitles
+        }
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=1)
+        os.replace(temp_path, self.path)
+
+    def durations(self):
+        """上次记录的 {哈希: 片段时长}，未改动的字幕不必重新读取语音文件"""
+        return {cue["hash"]: cue["duration"] for cue in self.cues}
+
+    def can_reuse(self, settings):
+        """视频、原音量等全局设置未变且上次的混音仍在时才能增量处理"""
+        return (
+            self.settings == settings
+            and bool(self.mix_path) and os.path.exists(self.mix_path)
+        )
+
+    def changed_ranges(self, cues, duration):
+        """
+        与上次的字幕对比，返回需要重新混音的时间区间列表
+        :param cues: 本次的字幕条目，格式同 self.cues
+        :param duration: 视频时长，区间会被裁剪到 [0, duration]
+        """
+        old_hashes = {cue["hash"] for cue in self.cues}
+        new_hashes = {cue["hash"] for cue in cues}
+        ranges = [
+            (cue["start"], cue["start"] + cue["duration"])
+            for cue in self.cues if cue["hash"] not in new_hashes
+        ] + [
+            (cue["start"], cue["start"] + cue["duration"])
+            for cue in cues if cue["hash"] not in old_hashes
+        ]
+        ranges = merge_ranges(ranges)
+
+        # 扩展区间，使与之相交的语音片段完整落在区间内
+        while True:
+            expanded = merge_ranges(ranges + [
+                (cue["start"], cue["start"] + cue["duration"])
+                for cue in cues
+                if any(cue["start"] < end and cue["start"] + cue["duration"] > start for start, end in ranges)
+            ])
+            if expanded == ranges:
+                break
+            ranges = expanded
+
+        return [
+            (max(0.0, start), min(duration, end))
+            for start, end in ranges if start < duration
+        ]
@@ -0,0 +1,219 @@
+"""
+视频编码器能力探测：检查本机 ffmpeg 实际可用的 H.264 编码器，并在一小段合成视频上测量各自的速度
+结果按 ffmpeg 可执行文件缓存，编码时从实测可用的编码器中按质量等级选出最快的一个
+"""
+import json
+import os
+import subprocess
+import threading
+import time
+
+from ffmpeg_utils import get_ffmpeg_binary
+
+PROBE_VERSION = 1
+PROBE_SECONDS = 2  # 合成测试视频的时长（秒）
+PROBE_FPS = 30
+PROBE_SIZE = "1280x720"
+PROBE_TIMEOUT = 30  # 单个编码器测试的超时（秒），防止硬件编码器卡死
+DEFAULT_MIN_QUALITY = 3  # 默认要求的质量等级，与原来的 libx264 medium / CRF 18 相当
+
+
+class EncoderCandidate:
+    """
+    一种编码器配置
+    :param preset: 编码器预设，None 表示该编码器没有 -preset 选项
+    :param params: 码率控制等额外参数
+    :param quality: 粗略的质量等级（1-3），数值越大画质越好
+    """
+    __slots__ = ("codec", "preset", "params", "quality")
+
+    def __init__(self, codec, preset, params, quality):
+        self.codec = codec
+        self.preset = preset
+        self.params = params
+        self.quality = quality
+
+    @property
+    def key(self):
+        return f"{self.codec}/{self.preset or '-'}"
+
+    def ffmpeg_args(self):
+        """ffmpeg 命令行中的视频编码参数"""
+        args = ["-c:v", self.codec]
+        if self.preset:
+            args += ["-preset", self.preset]
+        return args + list(self.params)
+
+    def __str__(self):
+        return f"{self.codec} ({self.preset})" if self.preset else self.codec
+
+
+NVENC_PARAMS = [
+    "-rc:v", "vbr",  # 可变比特率
+    "-cq", "19",
+    "-profile:v", "high",
+    "-spatial-aq", "1",  # 空间自适应量化
+    "-temporal-aq", "1",  # 时间自适应量化
+    "-rc-lookahead", "32"  # 前向预测帧数
+]
+
+# 按优先顺序排列：速度相同时排在前面的优先
+CANDIDATES = [
+    EncoderCandidate("h264_nvenc", "p5", NVENC_PARAMS, 3),
+    EncoderCandidate("h264_nvenc", "hq", NVENC_PARAMS, 3),  # 旧版 ffmpeg 的预设名
+    EncoderCandidate("h264_qsv", "medium", ["-global_quality", "20"], 2),
+    EncoderCandidate("h264_amf", None, ["-quality", "quality", "-rc", "cqp", "-qp_i", "20", "-qp_p", "22"], 2),
+    EncoderCandidate("h264_videotoolbox", None, ["-q:v", "65"], 2),
+    EncoderCandidate("libx264", "medium", ["-crf", "18"], 3),
+    EncoderCandidate("libx264", "fast", ["-crf", "18"], 2),
+    EncoderCandidate("libx264", "veryfast", ["-crf", "20"], 1),
+]
+BASELINE = CANDIDATES[-3]  # libx264 medium：所有 ffmpeg 构建都有，作为最后的选择
+
+
+def list_encoders(ffmpeg):
+    """ffmpeg 构建时启用的编码器名称（不代表硬件可用）"""
+    result = subprocess.run(
+        [ffmpeg, "-hide_banner", "-encoders"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.DEVNULL,
+        creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0)
+    )
+    names = set()
+    for line in result.stdout.decode("utf-8", errors="replace").splitlines():
+        parts = line.split()
+        # 形如 " V....D libx264   libx264 H.264 / AVC ..."
+        if len(parts) >= 2 and len(parts[0]) == 6 and parts[0][0] == "V":
+            names.add(parts[1])
+    return names
+
+
+def probe_candidate(ffmpeg, candidate):
+    """
+    用合成视频实际编码一次
+    :return: {"ok": bool, "fps": 每秒编码帧数, "error": 失败原因}
+    """
+    command = [
+        ffmpeg, "-hide_banner", "-nostdin", "-loglevel", "error",
+        "-f", "lavfi", "-i", f"testsrc2=size={PROBE_SIZE}:rate={PROBE_FPS}",
+        "-t", str(PROBE_SECONDS), "-pix_fmt", "yuv420p"
+    ] + candidate.ffmpeg_args() + ["-f", "null", "-"]
+    started = time.perf_counter()
+    try:
+        result = subprocess.run(
+            command,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            timeout=PROBE_TIMEOUT,
+            creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0)
+        )
+    except subprocess.TimeoutExpired:
+        return {"ok": False, "fps": 0.0, "error": f"超过 {PROBE_TIMEOUT} 秒未完成"}
+    elapsed = time.perf_counter() - started
+    if result.returncode != 0:
+        lines = result.stderr.decode("utf-8", errors="replace").strip().splitlines()
+        return {"ok": False, "fps": 0.0, "error": lines[-1] if lines else f"退出码 {result.returncode}"}
+    return {"ok": True, "fps": round(PROBE_SECONDS * PROBE_FPS / elapsed, 1), "error": ""}
+
+
+class EncoderProbe:
+    """
+    缓存的编码器探测结果，ffmpeg 可执行文件变化（升级、换用其他构建）后自动重新探测
+    多个线程同时请求时只探测一次
+    """
+
+    def __init__(self, cache_path):
+        self.cache_path = cache_path
+        self.lock = threading.Lock()
+        self.data = None
+
+    def _fingerprint(self, ffmpeg):
+        try:
+            stat = os.stat(ffmpeg)
+            return {"ffmpeg": ffmpeg, "size": stat.st_size, "mtime": stat.st_mtime}
+        except OSError:
+            # PATH 中的 ffmpeg 只记录名称
+            return {"ffmpeg": ffmpeg, "size": None, "mtime": None}
+
+    def _load(self, fingerprint):
+        try:
+            with open(self.cache_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get("version") != PROBE_VERSION or data.get("fingerprint") != fingerprint:
+            return None
+        return data
+
+    def _save(self):
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        temp_path = self.cache_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.cache_path)
+
+    def results(self, refresh=False, logger=None):
+        """
+        返回 {候选 key: {"ok", "fps", "error"}}，没有可用的缓存时运行探测
+        :param refresh: 忽略缓存重新探测
+        """
+        with self.lock:
+            ffmpeg = get_ffmpeg_binary()
+            fingerprint = self._fingerprint(ffmpeg)
+            if self.data is None or refresh or self.data.get("fingerprint") != fingerprint:
+                self.data = None if refresh else self._load(fingerprint)
+            if self.data is None:
+                if logger:
+                    logger.info("正在检测可用的视频编码器（仅首次运行）...")
+                available = list_encoders(ffmpeg)
+                results = {}
+                for candidate in CANDIDATES:
+                    if candidate.codec not in available:
+                        results[candidate.key] = {"ok": False, "fps": 0.0, "error": "ffmpeg 未包含该编码器"}
+                        continue
+                    results[candidate.key] = probe_candidate(ffmpeg, candidate)
+                    if logger and results[candidate.key]["ok"]:
+                        logger.info(f"编码器 {candidate}: {results[candidate.key]['fps']:.0f} 帧/秒")
+                self.data = {
+                    "version": PROBE_VERSION,
+                    "fingerprint": fingerprint,
+                    "probed": time.time(),
+                    "results": results
+                }
+                self._save()
+            return self.data["results"]
+
+    def choose(self, min_quality=DEFAULT_MIN_QUALITY, exclude=(), logger=None):
+        """
+        从实测可用的编码器中选出质量等级不低于 min_quality 的最快者
+        没有满足条件的编码器时放宽质量要求，最后回退到 libx264
+        :param exclude: 不参与选择的候选 key
+        """
+        results = self.results(logger=logger)
+        usable = [
+            candidate for candidate in CANDIDATES
+            if candidate.key not in exclude and results.get(candidate.key, {}).get("ok")
+        ]
+        for quality in range(min_quality, 0, -1):
+            matching = [candidate for candidate in usable if candidate.quality >= quality]
+            if matching:
+                # max 在速度相同时保留排在前面的候选
+                return max(matching, key=lambda candidate: results[candidate.key]["fps"])
+        return BASELINE
+
+    def fps(self, candidate):
+        return self.results().get(candidate.key, {}).get("fps", 0.0)
+
+    def recheck(self, candidate):
+        """
+        编码失败后重新测试该编码器：测试仍能通过说明失败与编码器无关，返回 True
+        测试失败时把它记为不可用（保存到缓存），返回 False
+        """
+        result = probe_candidate(get_ffmpeg_binary(), candidate)
+        if result["ok"]:
+            return True
+        with self.lock:
+            if self.data is not None:
+                self.data["results"][candidate.key] = result
+                self._save()
+        return False
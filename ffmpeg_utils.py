@@ -0,0 +1,194 @@
+import contextlib
+import os
+import subprocess
+import tempfile
+
+from cancellation import Cancelled
+from presets import DEFAULT_SUBTITLE_STYLE
+
+
+def get_ffmpeg_binary():
+    """使用与 MoviePy 相同的 ffmpeg（便携版内置），找不到时回退到 PATH 中的 ffmpeg"""
+    try:
+        from moviepy.config import get_setting
+        return get_setting("FFMPEG_BINARY")
+    except Exception:
+        pass
+    try:
+        import imageio_ffmpeg
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return "ffmpeg"
+
+
+def run_ffmpeg(args, on_progress=None, cancel_token=None):
+    """
+    运行 ffmpeg，失败时抛出包含 stderr 末尾内容的 RuntimeError
+    :param args: 不含可执行文件本身的参数列表
+    :param on_progress: 通过 ffmpeg 的 -progress 输出接收进度，回调参数为已处理的输出时长（秒）
+    :param cancel_token: CancelToken，取消时立即终止 ffmpeg 并抛出 Cancelled
+    """
+    command = [get_ffmpeg_binary(), "-hide_banner", "-nostdin", "-y"]
+    if on_progress is None and cancel_token is None:
+        result = subprocess.run(
+            command + list(args),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            # 打包后的 GUI 程序运行 ffmpeg 时不弹出控制台窗口
+            creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0)
+        )
+        returncode, stderr = result.returncode, result.stderr
+    else:
+        # stderr 写入临时文件，避免管道写满后阻塞 ffmpeg
+        with tempfile.TemporaryFile() as stderr_file:
+            process = subprocess.Popen(
+                command + ["-progress", "pipe:1", "-nostats"] + list(args),
+                stdout=subprocess.PIPE,
+                stderr=stderr_file,
+                creationflags=getattr(subprocess, "CREATE_NO_WINDOW", 0)
+            )
+            with cancel_token.attach_process(process) if cancel_token else contextlib.nullcontext():
+                for line in process.stdout:
+                    key, _, value = line.decode("utf-8", errors="replace").strip().partition("=")
+                    # out_time_ms 实际上是微秒
+                    if on_progress and key in ("out_time_us", "out_time_ms") and value.isdigit():
+                        on_progress(int(value) / 1000000)
+                returncode = process.wait()
+            if cancel_token and cancel_token.cancelled:
+                raise Cancelled()
+            stderr_file.seek(0)
+            stderr = stderr_file.read()
+        result = subprocess.CompletedProcess(process.args, returncode, b"", stderr)
+    if returncode != 0:
+        stderr = stderr.decode("utf-8", errors="replace").strip().splitlines()
+        raise RuntimeError("ffmpeg 执行失败: " + "\n".join(stderr[-10:]))
+    return result
+
+
+def subtitle_track_args(tracks, first_input):
+    """
+    软字幕轨道的输入参数和输出参数（SRT 转为 mov_text，不影响视频编码）
+    :param tracks: [(srt_path, 语言代码, 标题), ...]，语言代码为 ISO 639-2（chi、eng）
+    :param first_input: 第一个字幕文件的输入序号
+    :return: (inputs, outputs)
+    """
+    inputs, outputs = [], []
+    for index, (path, language, title) in enumerate(tracks):
+        inputs += ["-i", path]
+        outputs += ["-map", f"{first_input + index}:0"]
+    if tracks:
+        outputs += ["-c:s", "mov_text"]
+    for index, (path, language, title) in enumerate(tracks):
+        outputs += [f"-metadata:s:s:{index}", f"language={language}", f"-metadata:s:s:{index}", f"title={title}",
+                    # MP4 播放器显示的轨道名来自 handler_name
+                    f"-metadata:s:s:{index}", f"handler_name={title}"]
+    return inputs, outputs
+
+
+def _escape_filter_value(value):
+    """滤镜图中选项值的两层转义：先转义选项值中的 \\ ' :，再转义滤镜图中的 \\ ' [ ] , ;"""
+    for char in "\\':":
+        value = value.replace(char, "\\" + char)
+    for char in "\\'[],;":
+        value = value.replace(char, "\\" + char)
+    return value
+
+
+def _ass_colour(color):
+    """#RRGGBB -> libass 使用的 &H00BBGGRR"""
+    color = color.lstrip("#")
+    return f"&H00{color[4:6]}{color[2:4]}{color[0:2]}".upper()
+
+
+def ass_force_style(style):
+    """把字幕样式（见 presets.DEFAULT_SUBTITLE_STYLE）转换为 subtitles 滤镜的 force_style"""
+    style = dict(DEFAULT_SUBTITLE_STYLE, **(style or {}))
+    fields = {
+        "FontName": style["font"],
+        "FontSize": style["size"],
+        "PrimaryColour": _ass_colour(style["color"]),
+        "OutlineColour": _ass_colour(style["outline_color"]),
+        "BorderStyle": 1,
+        "Outline": style["outline"],
+        "Shadow": style["shadow"],
+        "MarginV": style["margin_v"],
+        "Bold": -1 if style["bold"] else 0
+    }
+    return ",".join(f"{name}={value}" for name, value in fields.items())
+
+
+def subtitles_filter(srt_path, style=None):
+    """把 SRT 烧录到画面的 subtitles 滤镜（libass）"""
+    path = os.path.abspath(srt_path).replace("\\", "/")
+    return (f"subtitles=filename={_escape_filter_value(path)}:charenc=UTF-8"
+            f":force_style={_escape_filter_value(ass_force_style(style))}")
+
+
+def mux_audio(video_path, audio_path, output_path, audio_codec="aac", audio_bitrate="192k", on_progress=None,
+              cancel_token=None, subtitle_tracks=()):
+    """
+    把新音轨与原视频流封装在一起，视频流直接复制（-c:v copy），不解码也不重新编码
+    先写入临时文件，成功后再替换输出文件，失败或取消时不会留下不完整的输出
+    :param on_progress: 见 run_ffmpeg
+    :param cancel_token: 见 run_ffmpeg
+    :param subtitle_tracks: 同时封装的软字幕轨道，见 subtitle_track_args
+    """
+    temp_path = output_path + ".part" + os.path.splitext(output_path)[1]
+    subtitle_inputs, subtitle_outputs = subtitle_track_args(subtitle_tracks, 2)
+    try:
+        run_ffmpeg([
+            "-i", video_path,
+            "-i", audio_path
+        ] + subtitle_inputs + [
+            "-map", "0:v:0",
+            "-map", "1:a:0",
+            "-c:v", "copy",
+            "-c:a", audio_codec,
+            "-b:a", audio_bitrate
+        ] + subtitle_outputs + [
+            "-movflags", "+faststart",
+            temp_path
+        ], on_progress, cancel_token)
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return output_path
+
+
+def render_video(video_path, audio_path, output_path, encoder, video_filters=(), threads=None, on_progress=None,
+                 cancel_token=None, subtitle_tracks=()):
+    """
+    在单个 ffmpeg 进程中完成解码、滤镜、编码和封装，视频帧不经过 Python
+    滤镜图：[0:v:0] -> video_filters -> format=yuv420p -> 编码器；音轨（已混音）编码为 AAC
+    先写入临时文件，成功后再替换输出文件
+    :param audio_path: 混音后的音轨，None 表示只输出视频流
+    :param encoder: encoder_probe.EncoderCandidate
+    :param video_filters: 附加在视频流上的 ffmpeg 滤镜（如 subtitles）
+    :param subtitle_tracks: 同时封装的软字幕轨道，见 subtitle_track_args
+    :param threads: 编码线程数，None 表示由 ffmpeg 决定
+    :param on_progress: 见 run_ffmpeg
+    :param cancel_token: 见 run_ffmpeg
+    """
+    extension = os.path.splitext(output_path)[1]
+    temp_path = output_path + ".part" + extension
+    chain = ",".join(list(video_filters) + ["format=yuv420p"])
+    args = ["-i", video_path]
+    if audio_path:
+        args += ["-i", audio_path]
+    subtitle_inputs, subtitle_outputs = subtitle_track_args(subtitle_tracks, len(args) // 2)
+    args += subtitle_inputs + ["-filter_complex", f"[0:v:0]{chain}[v]", "-map", "[v]"]
+    if audio_path:
+        args += ["-map", "1:a:0", "-c:a", "aac", "-b:a", "192k"]
+    args += subtitle_outputs + encoder.ffmpeg_args()
+    if threads:
+        args += ["-threads", str(threads)]
+    if extension.lower() in (".mp4", ".mov"):
+        args += ["-movflags", "+faststart"]
+    try:
+        run_ffmpeg(args + [temp_path], on_progress, cancel_token)
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return output_path
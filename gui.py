@@ -3,41 +3,119 @@ import os
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                            QHBoxLayout, QPushButton, QLabel, QComboBox, 
                            QFileDialog, QLineEdit, QProgressBar, QTextEdit,
-                           QMessageBox, QGroupBox, QSlider, QTabWidget)
-from PyQt5.QtCore import Qt, QThread, pyqtSignal, QUrl
+                           QMessageBox, QGroupBox, QSlider, QTabWidget,
+                           QCheckBox, QTableWidget, QTableWidgetItem, QHeaderView,
+                           QAbstractItemView)
+from PyQt5.QtCore import Qt, QObject, QThread, QTimer, pyqtSignal, QUrl
 from PyQt5.QtMultimedia import QMediaPlayer, QMediaContent, QAudio
 from PyQt5.QtGui import QIcon
 import asyncio
-import app as dubbing_app
-from edge_tts import Communicate
-import tempfile
-import uuid
+import threading
+import time
+import presets
+from presets import CHINESE_VOICES, DEFAULT_PROFILE, MODEL_SIZES, get_base_filename
+from tts_engine import build_rate_string
+from progress import ProgressEvent
+from cancellation import Cancelled, CancelToken, run_cancellable
+from tracing import Trace, activate, report_path_for
+from job_queue import JobQueue
 import traceback
 import logging
 
+# 处理模块依赖 torch、whisper、moviepy，导入需要数秒；窗口显示后在后台线程中导入
+dubbing_app = None
+
+def load_app():
+    """导入处理模块并返回，首次调用较慢（工作线程中调用不会阻塞界面）"""
+    global dubbing_app
+    if dubbing_app is None:
+        import app
+        dubbing_app = app
+    return dubbing_app
+
+def is_cached_clip(path):
+    """文件是否位于语音片段缓存中（缓存文件保留复用）；处理模块尚未加载时不可能来自缓存"""
+    return dubbing_app is not None and dubbing_app.clip_cache.contains(path)
+
+class ModelWarmupThread(QObject):
+    """
+    后台导入处理模块、预加载模型并检测视频编码器
+    运行在守护线程中：导入、模型下载和加载无法中途打断，关闭窗口时不等待它们完成；
+    各步骤之间检查 cancel_token，取消后不再开始下一步
+    """
+    progress = pyqtSignal(str)
+    app_loaded = pyqtSignal(float)  # 处理模块导入耗时（秒）
+
+    def __init__(self, profile=None):
+        super().__init__()
+        self.profile = profile
+        self.cancel_token = CancelToken()
+        self.thread = threading.Thread(target=self.run, name="warmup", daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def run(self):
+        started = time.perf_counter()
+        try:
+            load_app()
+        except Exception as e:
+            self.progress.emit(f"加载处理模块失败: {str(e)}")
+            return
+        if self.cancel_token.cancelled:
+            return
+        self.app_loaded.emit(time.perf_counter() - started)
+        try:
+            dubbing_app.warmup_model(self.progress.emit, self.profile)
+        except Exception as e:
+            self.progress.emit(f"模型预加载失败，将在生成字幕时重试: {str(e)}")
+        if self.cancel_token.cancelled:
+            return
+        try:
+            # 编码器探测结果有缓存，只有首次运行或 ffmpeg 变化后才真正测试
+            dubbing_app.encoder_probe.results(logger=dubbing_app.LoggerCallback(self.progress.emit))
+        except Exception as e:
+            self.progress.emit(f"视频编码器检测失败，将在编码时重试: {str(e)}")
+
 class SubtitleEditThread(QThread):
     progress = pyqtSignal(str)
+    stage_progress = pyqtSignal(ProgressEvent)  # 结构化进度（完成比例、吞吐量、剩余时间）
     finished = pyqtSignal(tuple)  # (en_srt, cn_srt)
     error = pyqtSignal(str)
+    cancelled = pyqtSignal()
 
-    def __init__(self, video_path):
+    def __init__(self, video_path, profile=None, cancel_token=None):
         super().__init__()
         self.video_path = video_path
+        self.profile = profile
+        self.cancel_token = cancel_token or CancelToken()
+        # 计时记录，配音阶段会继续记录到同一个 trace 中
+        self.trace = Trace(get_base_filename(video_path))
 
     def run(self):
         try:
             # 创建新的事件循环
             loop = asyncio.new_event_loop()
             asyncio.set_event_loop(loop)
+            load_app()
             
-            self.progress.emit("正在生成英文字幕...")
-            en_srt = dubbing_app.generate_subtitles(self.video_path, self.progress.emit)
-            
-            self.progress.emit("正在翻译字幕...")
-            cn_srt = dubbing_app.translate_subtitles(en_srt, self.progress.emit)
+            with activate(self.trace):
+                self.progress.emit("正在生成英文字幕...")
+                en_srt = dubbing_app.generate_subtitles(
+                    self.video_path, self.progress.emit, profile=self.profile, on_progress=self.stage_progress.emit,
+                    cancel_token=self.cancel_token
+                )
+                
+                self.cancel_token.check()
+                self.progress.emit("正在翻译字幕...")
+                cn_srt = dubbing_app.translate_subtitles(en_srt, self.progress.emit,
+                                                         on_progress=self.stage_progress.emit,
+                                                         cancel_token=self.cancel_token)
             
             self.finished.emit((en_srt, cn_srt))
             
+        except Cancelled:
+            self.cancelled.emit()
         except Exception as e:
             self.error.emit(str(e))
         finally:
@@ -55,34 +133,53 @@ class PreviewThread(QThread):
         self.preview_text = self.get_preview_text(preview_duration)
         self.temp_file = None
         self.max_retries = 3  # 最大重试次数
+        self.cancel_token = CancelToken()
 
     def get_preview_text(self, duration):
         # 根据时长生成预览文本
         return "这是一段试听音频，用于预览配音效果。" * (duration // 3)
 
     async def generate_preview(self, loop):
+        from edge_tts import Communicate
+        rate_str = build_rate_string(self.speed_rate)
+        
+        # 优先复用语音片段缓存
+        cached = dubbing_app.clip_cache.get(self.preview_text, self.voice_id, rate_str)
+        if cached:
+            self.temp_file = cached
+            return True
+        
         # 生成唯一的临时文件名
-        temp_dir = tempfile.gettempdir()
-        self.temp_file = os.path.join(temp_dir, f"preview_{uuid.uuid4().hex}.mp3")
+        self.temp_file = dubbing_app.clip_cache.temp_path(self.preview_text, self.voice_id, rate_str)
         
         # 尝试生成语音
-        rate_str = f"+{int((self.speed_rate - 1) * 100)}%" if self.speed_rate > 1 else f"{int((self.speed_rate - 1) * 100)}%"
-        communicate = Communicate(self.preview_text, self.voice_id, rate=rate_str)
+        if rate_str:
+            communicate = Communicate(self.preview_text, self.voice_id, rate=rate_str)
+        else:
+            communicate = Communicate(self.preview_text, self.voice_id)
         
-        # 设置超时时间
+        # 设置超时时间，关闭窗口时立即中止
         try:
-            await asyncio.wait_for(communicate.save(self.temp_file), timeout=10.0)
-            return True
-        except asyncio.TimeoutError:
+            await run_cancellable(asyncio.wait_for(communicate.save(self.temp_file), timeout=10.0), self.cancel_token)
+        except (asyncio.TimeoutError, Cancelled) as e:
+            if os.path.exists(self.temp_file):
+                os.remove(self.temp_file)
+            if isinstance(e, Cancelled):
+                raise
             return False
         except Exception as e:
             raise e
+        
+        if os.path.exists(self.temp_file) and os.path.getsize(self.temp_file) > 0:
+            self.temp_file = dubbing_app.clip_cache.put(self.preview_text, self.voice_id, rate_str, self.temp_file)
+        return True
 
     def run(self):
         try:
             # 创建新的事件循环
             loop = asyncio.new_event_loop()
             asyncio.set_event_loop(loop)
+            load_app()
             
             # 重试机制
             for attempt in range(self.max_retries):
@@ -97,6 +194,8 @@ class PreviewThread(QThread):
                     else:
                         if attempt == self.max_retries - 1:
                             raise Exception("生成音频超时")
+                except Cancelled:
+                    raise
                 except Exception as e:
                     if attempt == self.max_retries - 1:
                         raise e
@@ -104,53 +203,115 @@ class PreviewThread(QThread):
                     
             raise Exception("生成音频失败，请重试")
             
+        except Cancelled:
+            pass
         except Exception as e:
             self.error.emit(f"生成试听音频失败: {str(e)}\n请尝试选择其他配音声音或重试")
         finally:
             loop.close()
 
     def __del__(self):
-        # 确保临时文件被清理
-        if self.temp_file and os.path.exists(self.temp_file):
+        # 确保临时文件被清理（缓存中的试听音频保留复用）
+        if self.temp_file and os.path.exists(self.temp_file) and not is_cached_clip(self.temp_file):
             try:
                 os.remove(self.temp_file)
-            except:
+            except OSError:
                 pass
 
 class DubbingThread(QThread):
     progress = pyqtSignal(str)
+    stage_progress = pyqtSignal(ProgressEvent)
+    report = pyqtSignal(str)  # 各阶段耗时汇总表
     finished = pyqtSignal(str)
     error = pyqtSignal(str)
+    cancelled = pyqtSignal()
 
-    def __init__(self, video_path=None, voice_name=None, cn_srt=None, original_volume=0.1, speed_rate=1.5):
+    def __init__(self, video_path=None, voice_name=None, cn_srt=None, original_volume=0.1, speed_rate=1.5,
+                 reencode=False, trace=None, cancel_token=None, subtitles="none"):
         super().__init__()
         self.video_path = video_path
         self.voice_name = voice_name
         self.cn_srt = cn_srt
         self.original_volume = original_volume
         self.speed_rate = speed_rate
+        self.reencode = reencode
+        self.subtitles = subtitles
+        self.trace = trace or Trace(get_base_filename(video_path))
+        self.cancel_token = cancel_token or CancelToken()
 
     def run(self):
         try:
             # 创建新的事件循环
             loop = asyncio.new_event_loop()
             asyncio.set_event_loop(loop)
+            load_app()
             
-            # 生成语音
-            self.progress.emit("正在生成语音...")
-            audio_files = loop.run_until_complete(
-                dubbing_app.generate_speech(self.cn_srt, self.voice_name, self.progress.emit, self.speed_rate)
-            )
-            
-            # 合并视频和音频
-            self.progress.emit("正在合并视频和音频...")
-            output_path = dubbing_app.merge_video_audio(
-                self.video_path, audio_files, self.cn_srt, self.progress.emit,
-                original_volume=self.original_volume
-            )
+            with activate(self.trace):
+                # 生成语音
+                self.progress.emit("正在生成语音...")
+                audio_files = loop.run_until_complete(
+                    dubbing_app.generate_speech(self.cn_srt, self.voice_name, self.progress.emit, self.speed_rate,
+                                                on_progress=self.stage_progress.emit, cancel_token=self.cancel_token)
+                )
+                
+                # 合并视频和音频
+                self.progress.emit("正在合并视频和音频...")
+                output_path = dubbing_app.merge_video_audio(
+                    self.video_path, audio_files, self.cn_srt, self.progress.emit,
+                    original_volume=self.original_volume,
+                    reencode=self.reencode,
+                    on_progress=self.stage_progress.emit,
+                    cancel_token=self.cancel_token,
+                    subtitles=self.subtitles
+                )
             
+            report_path = self.trace.save(report_path_for(output_path))
+            self.report.emit(self.trace.summary_table())
+            self.progress.emit(f"运行报告已保存: {report_path}")
             self.finished.emit(output_path)
             
+        except Cancelled:
+            self.cancelled.emit()
+        except Exception as e:
+            self.error.emit(str(e))
+        finally:
+            loop.close()
+
+class QueueThread(QThread):
+    """在后台调度任务队列，各视频的转录、语音合成和合并相互重叠"""
+    progress = pyqtSignal(str)
+    item_changed = pyqtSignal(str)  # 任务 id
+    finished = pyqtSignal(int)  # 本次完成的任务数
+    error = pyqtSignal(str)
+
+    def __init__(self, job_queue, profile):
+        super().__init__()
+        self.job_queue = job_queue
+        self.profile = profile
+        self.cancel_token = CancelToken()
+
+    def run(self):
+        try:
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            load_app()
+            import concurrent.futures
+            import batch
+            
+            options = ["--model", self.profile["model_size"], "--decoding", self.profile["decoding"],
+                       "--journal", os.path.join("output", "queue_journal.jsonl"),
+                       "--encode-workers", "2"]
+            if self.profile["quantize"]:
+                options.append("--quantize")
+            runner = batch.QueueRunner(
+                batch.build_parser().parse_args(options), self.job_queue,
+                on_change=self.item_changed.emit,
+                on_log=self.progress.emit,
+                # 界面中用线程合并（主要是 ffmpeg 子进程），避免每个进程重新加载 torch
+                encode_executor=concurrent.futures.ThreadPoolExecutor(max_workers=2),
+                cancel_token=self.cancel_token
+            )
+            self.finished.emit(loop.run_until_complete(runner.run_queue()))
         except Exception as e:
             self.error.emit(str(e))
         finally:
@@ -165,6 +326,12 @@ class MainWindow(QMainWindow):
         self.setupMediaPlayer()
         self.current_en_srt = None
         self.current_cn_srt = None
+        self.current_trace = None  # 字幕生成阶段的计时记录，配音时继续使用
+        self.cancel_token = None  # 当前任务（字幕生成 + 配音）的暂停/取消令牌
+        self.job_queue = JobQueue()  # 上次未处理完的任务会重新载入
+        self.queue_thread = None
+        self.queue_started = None
+        self.refresh_queue_table()
         self.current_preview_file = None  # 添加当前预览文件路径
         
         self.progress_bar.setTextVisible(True)
@@ -186,6 +353,16 @@ class MainWindow(QMainWindow):
         
         self.start_time = None  # 添加计时器变量
         
+        # 窗口显示后在后台导入处理模块并预加载Whisper模型
+        self.warmup_thread = ModelWarmupThread(self.current_profile())
+        self.warmup_thread.progress.connect(self.log)
+        self.warmup_thread.app_loaded.connect(self.on_app_loaded)
+        QTimer.singleShot(0, self.warmup_thread.start)
+        
+    def on_app_loaded(self, seconds):
+        self.quantize_checkbox.setEnabled(dubbing_app.DEVICE == "cpu")
+        self.log(f"处理模块加载完成，耗时 {seconds:.1f}秒")
+        
     def setupMediaPlayer(self):
         # 直接使用旧版本的方式，避免版本兼容性问题
         self.media_player = QMediaPlayer()
@@ -247,6 +424,23 @@ class MainWindow(QMainWindow):
         
         video_layout.addLayout(button_layout)
         
+        # 识别档位：模型大小、解码方式、int8量化（仅CPU）
+        profile_layout = QHBoxLayout()
+        profile_layout.addWidget(QLabel('识别模型:'))
+        self.model_size_combo = QComboBox()
+        self.model_size_combo.addItems(MODEL_SIZES)
+        self.model_size_combo.setCurrentText(DEFAULT_PROFILE["model_size"])
+        profile_layout.addWidget(self.model_size_combo)
+        profile_layout.addWidget(QLabel('解码:'))
+        self.decoding_combo = QComboBox()
+        self.decoding_combo.addItem('束搜索（质量高）', 'beam')
+        self.decoding_combo.addItem('贪心（速度快）', 'greedy')
+        profile_layout.addWidget(self.decoding_combo)
+        self.quantize_checkbox = QCheckBox('int8量化（CPU加速）')
+        self.quantize_checkbox.setEnabled(False)  # 处理模块加载完成、确认在CPU上运行后启用
+        profile_layout.addWidget(self.quantize_checkbox)
+        video_layout.addLayout(profile_layout)
+        
         video_group.setLayout(video_layout)
         left_layout.addWidget(video_group)
         
@@ -354,6 +548,19 @@ class MainWindow(QMainWindow):
         original_volume_layout.addWidget(self.original_volume_value_label)
         voice_layout.addLayout(original_volume_layout)
         
+        # 默认只替换音轨（视频流直接复制），勾选后重新编码整个视频
+        self.reencode_checkbox = QCheckBox('重新编码视频（较慢，仅在输出视频无法播放时使用）')
+        voice_layout.addWidget(self.reencode_checkbox)
+        
+        # 输出视频中的字幕：软字幕轨道或烧录到画面（烧录会重新编码）
+        subtitle_mode_layout = QHBoxLayout()
+        subtitle_mode_layout.addWidget(QLabel('输出字幕:'))
+        self.subtitle_mode_combo = QComboBox()
+        for mode, label in presets.SUBTITLE_MODES.items():
+            self.subtitle_mode_combo.addItem(label, mode)
+        subtitle_mode_layout.addWidget(self.subtitle_mode_combo)
+        voice_layout.addLayout(subtitle_mode_layout)
+        
         voice_group.setLayout(voice_layout)
         left_layout.addWidget(voice_group)
         
@@ -363,15 +570,63 @@ class MainWindow(QMainWindow):
         self.progress_bar.setFormat("%p%")
         left_layout.addWidget(self.progress_bar)
         
+        control_layout = QHBoxLayout()
         self.start_button = QPushButton('开始处理')
         self.start_button.clicked.connect(self.start_processing)
-        left_layout.addWidget(self.start_button)
+        control_layout.addWidget(self.start_button, 1)
+        
+        self.pause_button = QPushButton('暂停')
+        self.pause_button.setEnabled(False)
+        self.pause_button.clicked.connect(self.toggle_pause)
+        control_layout.addWidget(self.pause_button)
+        
+        self.cancel_button = QPushButton('取消')
+        self.cancel_button.setEnabled(False)
+        self.cancel_button.clicked.connect(self.cancel_processing)
+        control_layout.addWidget(self.cancel_button)
+        left_layout.addLayout(control_layout)
         
         # 右侧日志面板
         right_panel = QWidget()
         right_layout = QVBoxLayout(right_panel)
         right_layout.setContentsMargins(10, 0, 0, 0)  # 添加左边距
         
+        # 任务队列：多个视频按各自的设置依次处理，各阶段相互重叠
+        queue_group = QGroupBox("任务队列")
+        queue_layout = QVBoxLayout()
+        self.queue_table = QTableWidget(0, 4)
+        self.queue_table.setHorizontalHeaderLabels(['视频', '配音', '语速/原音量', '状态'])
+        self.queue_table.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.queue_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.queue_table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.queue_table.verticalHeader().setVisible(False)
+        queue_layout.addWidget(self.queue_table)
+        
+        queue_button_layout = QHBoxLayout()
+        add_queue_button = QPushButton('添加视频')
+        add_queue_button.setToolTip('使用当前的配音、语速和原音量设置')
+        add_queue_button.clicked.connect(self.add_to_queue)
+        queue_button_layout.addWidget(add_queue_button)
+        remove_queue_button = QPushButton('移除')
+        remove_queue_button.clicked.connect(self.remove_from_queue)
+        queue_button_layout.addWidget(remove_queue_button)
+        retry_queue_button = QPushButton('重试')
+        retry_queue_button.clicked.connect(self.retry_queue_item)
+        queue_button_layout.addWidget(retry_queue_button)
+        self.queue_start_button = QPushButton('开始队列')
+        self.queue_start_button.clicked.connect(self.start_queue)
+        queue_button_layout.addWidget(self.queue_start_button)
+        self.queue_stop_button = QPushButton('停止队列')
+        self.queue_stop_button.setEnabled(False)
+        self.queue_stop_button.clicked.connect(self.stop_queue)
+        queue_button_layout.addWidget(self.queue_stop_button)
+        queue_layout.addLayout(queue_button_layout)
+        
+        self.queue_status_label = QLabel()
+        queue_layout.addWidget(self.queue_status_label)
+        queue_group.setLayout(queue_layout)
+        right_layout.addWidget(queue_group)
+        
         # 日志显示
         log_group = QGroupBox("处理日志")
         log_layout = QVBoxLayout()
@@ -422,6 +677,8 @@ class MainWindow(QMainWindow):
         """
         
         self.start_button.setStyleSheet(button_style)
+        self.pause_button.setStyleSheet(button_style)
+        self.cancel_button.setStyleSheet(button_style)
         self.preview_button.setStyleSheet(button_style)
         
         # 设置分组框样式
@@ -440,7 +697,7 @@ class MainWindow(QMainWindow):
             }
         """
         
-        for group in [video_group, subtitle_group, voice_group, log_group]:
+        for group in [video_group, subtitle_group, voice_group, queue_group, log_group]:
             group.setStyleSheet(group_style)
         
         # 初始化台湾区域的声音列表
@@ -448,6 +705,13 @@ class MainWindow(QMainWindow):
         
         self.show()
     
+    def current_profile(self):
+        return presets.make_profile(
+            self.model_size_combo.currentText(),
+            self.decoding_combo.currentData(),
+            self.quantize_checkbox.isChecked()
+        )
+    
     def generate_subtitles(self):
         video_path = self.video_path_edit.text()
         if not video_path:
@@ -459,13 +723,16 @@ class MainWindow(QMainWindow):
         self.cn_subtitle_edit.clear()
         
         # 创建字幕生成线程
-        self.subtitle_thread = SubtitleEditThread(video_path)
+        self.cancel_token = CancelToken()
+        self.subtitle_thread = SubtitleEditThread(video_path, self.current_profile(), self.cancel_token)
         self.subtitle_thread.progress.connect(self.log)
+        self.subtitle_thread.stage_progress.connect(self.on_stage_progress)
         self.subtitle_thread.finished.connect(self.on_subtitles_generated)
         self.subtitle_thread.error.connect(self.on_subtitle_error)
+        self.subtitle_thread.cancelled.connect(self.on_cancelled)
         
         # 禁用按钮
-        self.start_button.setEnabled(False)
+        self.set_running(True)
         self.progress_bar.setMaximum(0)
         
         # 开始处理
@@ -475,6 +742,7 @@ class MainWindow(QMainWindow):
         en_srt, cn_srt = srt_files
         self.current_en_srt = en_srt
         self.current_cn_srt = cn_srt
+        self.current_trace = self.subtitle_thread.trace
         
         # 显示字幕内容
         with open(en_srt, 'r', encoding='utf-8') as f:
@@ -483,16 +751,14 @@ class MainWindow(QMainWindow):
             self.cn_subtitle_edit.setText(f.read())
             
         # 恢复按钮状态
-        self.start_button.setEnabled(True)
-        self.progress_bar.setMaximum(100)
-        self.progress_bar.setValue(0)
+        self.set_running(False)
+        self.reset_progress(0)
         
         self.log("字幕生成完成，您可以编辑中文字幕后开始处理")
     
     def on_subtitle_error(self, error_message):
-        self.start_button.setEnabled(True)
-        self.progress_bar.setMaximum(100)
-        self.progress_bar.setValue(0)
+        self.set_running(False)
+        self.reset_progress(0)
         QMessageBox.critical(self, '错误', f'生成字幕失败：{error_message}')
     
     def save_subtitles(self):
@@ -520,7 +786,7 @@ class MainWindow(QMainWindow):
     
     def update_voice_list(self, region):
         self.voice_combo.clear()
-        for voice_id, voice_name in dubbing_app.CHINESE_VOICES.items():
+        for voice_id, voice_name in CHINESE_VOICES.items():
             if region == '中国大陆' and voice_id.startswith('zh-CN-'):
                 self.voice_combo.addItem(voice_name, voice_id)
             elif region == '中国香港' and voice_id.startswith('zh-HK-'):
@@ -545,6 +811,137 @@ class MainWindow(QMainWindow):
         else:
             QMessageBox.warning(self, '错误', '请选择有效的视频文件')
         
+    def refresh_queue_table(self):
+        self.queue_table.setRowCount(len(self.job_queue.items))
+        for row in range(len(self.job_queue.items)):
+            self.update_queue_row(row)
+        self.update_queue_status()
+    
+    def update_queue_row(self, row):
+        item = self.job_queue.items[row]
+        cells = [
+            os.path.basename(item.video_path),
+            CHINESE_VOICES.get(item.voice, item.voice).split(' - ')[0],
+            f"{item.speed}x / {item.original_volume * 100:.0f}%",
+            item.status_text
+        ]
+        for column, text in enumerate(cells):
+            cell = QTableWidgetItem(text)
+            cell.setToolTip(item.error or item.output or item.video_path)
+            self.queue_table.setItem(row, column, cell)
+    
+    def update_queue_status(self):
+        counts = self.job_queue.counts()
+        text = (f"共 {len(self.job_queue.items)} 个：等待 {counts['pending']}，处理中 {counts['running']}，"
+                f"完成 {counts['done']}，失败 {counts['failed']}")
+        if self.queue_thread and self.queue_started:
+            # 吞吐量只统计本次开始后完成的任务
+            elapsed = time.time() - self.queue_started
+            completed = sum(1 for item in self.job_queue.items
+                            if item.status == "done" and (item.finished or 0) >= self.queue_started)
+            if elapsed > 0:
+                text += f"，吞吐 {completed / elapsed * 3600:.1f} 个/小时"
+        self.queue_status_label.setText(text)
+    
+    def selected_queue_ids(self):
+        rows = sorted({index.row() for index in self.queue_table.selectedIndexes()})
+        return [self.job_queue.items[row].id for row in rows if row < len(self.job_queue.items)]
+    
+    def add_to_queue(self):
+        file_names, _ = QFileDialog.getOpenFileNames(
+            self,
+            "添加视频到队列",
+            "",
+            "视频文件 (*.mp4 *.avi *.mkv *.mov);;所有文件 (*.*)"
+        )
+        for file_name in file_names:
+            self.job_queue.add(
+                file_name,
+                self.voice_combo.currentData(),
+                self.speed_slider.value() / 100.0,
+                self.original_volume_slider.value() / 100.0,
+                self.reencode_checkbox.isChecked(),
+                self.subtitle_mode_combo.currentData()
+            )
+        if file_names:
+            self.log(f"已添加 {len(file_names)} 个视频到队列")
+            self.refresh_queue_table()
+    
+    def remove_from_queue(self):
+        for item_id in self.selected_queue_ids():
+            if not self.job_queue.remove(item_id):
+                self.log("处理中的任务不能移除", "WARNING")
+        self.refresh_queue_table()
+    
+    def retry_queue_item(self):
+        for item_id in self.selected_queue_ids():
+            self.job_queue.retry(item_id)
+        self.refresh_queue_table()
+    
+    def start_queue(self):
+        if not self.job_queue.pending():
+            QMessageBox.information(self, '提示', '队列中没有等待处理的视频')
+            return
+        self.queue_thread = QueueThread(self.job_queue, self.current_profile())
+        self.queue_thread.progress.connect(self.log)
+        self.queue_thread.item_changed.connect(self.on_queue_item_changed)
+        self.queue_thread.finished.connect(self.on_queue_finished)
+        self.queue_thread.error.connect(self.on_queue_error)
+        self.queue_started = time.time()
+        self.queue_start_button.setEnabled(False)
+        self.queue_stop_button.setEnabled(True)
+        self.log(f"开始处理队列，共 {len(self.job_queue.pending())} 个视频等待处理")
+        self.queue_thread.start()
+    
+    def stop_queue(self):
+        if self.queue_thread:
+            self.queue_thread.cancel_token.cancel()
+            self.queue_stop_button.setEnabled(False)
+            self.log("正在停止队列，未完成的任务下次从已完成的阶段继续...")
+    
+    def on_queue_item_changed(self, item_id):
+        row = self.job_queue.index(item_id)
+        if row >= 0 and row < self.queue_table.rowCount():
+            self.update_queue_row(row)
+        self.update_queue_status()
+    
+    def on_queue_finished(self, completed):
+        self.log(f"队列处理结束，本次完成 {completed} 个视频")
+        self.on_queue_stopped()
+    
+    def on_queue_error(self, error_message):
+        self.log(f"队列处理失败: {error_message}", "ERROR")
+        self.on_queue_stopped()
+    
+    def on_queue_stopped(self):
+        self.update_queue_status()
+        self.queue_thread = None
+        self.queue_started = None
+        self.queue_start_button.setEnabled(True)
+        self.queue_stop_button.setEnabled(False)
+        self.refresh_queue_table()
+    
+    def on_stage_progress(self, event):
+        """显示当前阶段的完成比例、吞吐量和剩余时间"""
+        if self.progress_bar.maximum() != 1000:
+            self.progress_bar.setRange(0, 1000)
+        self.progress_bar.setValue(int(event.fraction * 1000))
+        self.progress_bar.setFormat(str(event))
+
+    def reset_progress(self, value=0):
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setValue(value)
+        self.progress_bar.setFormat("%p%")
+
+    def log_table(self, table):
+        """以等宽字体输出多行表格（如各阶段耗时汇总）"""
+        import html
+        self.log("各阶段耗时统计:")
+        self.log_text.append(f'<pre style="color: #a9b7c6">{html.escape(table)}</pre>')
+        self.log_text.verticalScrollBar().setValue(
+            self.log_text.verticalScrollBar().maximum()
+        )
+    
     def log(self, message, level="INFO"):
         """
         格式化输出日志
@@ -578,20 +975,17 @@ class MainWindow(QMainWindow):
         
     def cleanup_preview(self):
         """清理预览相关资源"""
-        try:
-            if self.media_player.state() == QMediaPlayer.PlayingState:
-                self.media_player.stop()
-            self.media_player.setMedia(None)
-            
-            if hasattr(self, 'current_preview_file') and self.current_preview_file:
-                if os.path.exists(self.current_preview_file):
-                    try:
-                        os.remove(self.current_preview_file)
-                    except:
-                        pass
-                self.current_preview_file = None
-        except:
-            pass
+        if self.media_player.state() == QMediaPlayer.PlayingState:
+            self.media_player.stop()
+        self.media_player.setMedia(None)
+        
+        if hasattr(self, 'current_preview_file') and self.current_preview_file:
+            if os.path.exists(self.current_preview_file) and not is_cached_clip(self.current_preview_file):
+                try:
+                    os.remove(self.current_preview_file)
+                except OSError:
+                    pass
+            self.current_preview_file = None
 
     def preview_voice(self):
         # 如果正在播放，则停止
@@ -646,7 +1040,8 @@ class MainWindow(QMainWindow):
             return
             
         # 禁用界面元素
-        self.start_button.setEnabled(False)
+        self.cancel_token = CancelToken()
+        self.set_running(True)
         self.progress_bar.setMaximum(0)
         self.log_text.clear()
         
@@ -656,10 +1051,12 @@ class MainWindow(QMainWindow):
             self.process_with_subtitles()
         else:
             # 创建字幕生成线程
-            self.subtitle_thread = SubtitleEditThread(video_path)
+            self.subtitle_thread = SubtitleEditThread(video_path, self.current_profile(), self.cancel_token)
             self.subtitle_thread.progress.connect(self.log)
+            self.subtitle_thread.stage_progress.connect(self.on_stage_progress)
             self.subtitle_thread.finished.connect(self.on_auto_subtitles_generated)
             self.subtitle_thread.error.connect(self.on_subtitle_error)
+            self.subtitle_thread.cancelled.connect(self.on_cancelled)
             self.subtitle_thread.start()
             
         # 开始计时
@@ -674,6 +1071,7 @@ class MainWindow(QMainWindow):
         en_srt, cn_srt = srt_files
         self.current_en_srt = en_srt
         self.current_cn_srt = cn_srt
+        self.current_trace = self.subtitle_thread.trace
         
         # 显示字幕内容
         with open(en_srt, 'r', encoding='utf-8') as f:
@@ -693,6 +1091,8 @@ class MainWindow(QMainWindow):
         self.log(f"选择的配音: {self.voice_combo.currentText()}", "INFO")
         self.log(f"配音速度: {self.speed_slider.value() / 100.0}x", "INFO")
         self.log(f"原音量: {self.original_volume_slider.value()}%", "INFO")
+        self.log(f"视频编码: {'重新编码' if self.reencode_checkbox.isChecked() else '直接复制视频流'}", "INFO")
+        self.log(f"输出字幕: {self.subtitle_mode_combo.currentText()}", "INFO")
         
         # 创建处理线程
         self.dubbing_thread = DubbingThread(
@@ -700,13 +1100,23 @@ class MainWindow(QMainWindow):
             voice_name=self.voice_combo.currentData(),
             cn_srt=self.current_cn_srt,
             original_volume=self.original_volume_slider.value() / 100.0,  # 转换为0-1的值
-            speed_rate=self.speed_slider.value() / 100.0  # 转换为倍速值
+            speed_rate=self.speed_slider.value() / 100.0,  # 转换为倍速值
+            reencode=self.reencode_checkbox.isChecked(),
+            subtitles=self.subtitle_mode_combo.currentData(),
+            # 字幕阶段的记录属于同一个视频时才继续使用
+            trace=self.current_trace if self.current_trace and
+            self.current_trace.name == get_base_filename(video_path) else None,
+            cancel_token=self.cancel_token
         )
+        self.current_trace = None
         
         # 连接信号
         self.dubbing_thread.progress.connect(self.log)
+        self.dubbing_thread.stage_progress.connect(self.on_stage_progress)
+        self.dubbing_thread.report.connect(self.log_table)
         self.dubbing_thread.finished.connect(self.on_processing_finished)
         self.dubbing_thread.error.connect(self.on_processing_error)
+        self.dubbing_thread.cancelled.connect(self.on_cancelled)
         
         # 开始处理
         self.dubbing_thread.start()
@@ -728,9 +1138,8 @@ class MainWindow(QMainWindow):
             time_str.append(f"{minutes}分钟")
         time_str.append(f"{seconds}秒")
         
-        self.progress_bar.setMaximum(100)
-        self.progress_bar.setValue(100)
-        self.start_button.setEnabled(True)
+        self.reset_progress(100)
+        self.set_running(False)
         
         # 添加详细的完成信息，使用完整路径
         self.log("处理完成!", "INFO")
@@ -760,9 +1169,8 @@ class MainWindow(QMainWindow):
         else:
             self.log("处理失败!", "ERROR")
         
-        self.progress_bar.setMaximum(100)
-        self.progress_bar.setValue(0)
-        self.start_button.setEnabled(True)
+        self.reset_progress(0)
+        self.set_running(False)
         
         # 记录详细错误信息
         error_details = traceback.format_exc()
@@ -776,10 +1184,52 @@ class MainWindow(QMainWindow):
         error_dialog.setDetailedText(error_details)
         error_dialog.exec_()
         
+    def set_running(self, running):
+        """任务运行期间禁用开始按钮，启用暂停和取消"""
+        self.start_button.setEnabled(not running)
+        self.pause_button.setEnabled(running)
+        self.pause_button.setText('暂停')
+        self.cancel_button.setEnabled(running)
+    
+    def toggle_pause(self):
+        if not self.cancel_token:
+            return
+        if self.cancel_token.paused:
+            self.cancel_token.resume()
+            self.pause_button.setText('暂停')
+            self.log("继续处理")
+        else:
+            self.cancel_token.pause()
+            self.pause_button.setText('继续')
+            self.log("已暂停，当前步骤（一条字幕、一个音频块或一个解码窗口）完成后停止")
+    
+    def cancel_processing(self):
+        if not self.cancel_token:
+            return
+        self.cancel_token.cancel()
+        self.pause_button.setEnabled(False)
+        self.cancel_button.setEnabled(False)
+        self.log("正在取消...")
+    
+    def on_cancelled(self):
+        self.reset_progress(0)
+        self.set_running(False)
+        self.log("处理已取消，未完成的文件已删除", "WARNING")
+    
     def closeEvent(self, event):
         # 关闭窗口时清理所有资源
         self.cleanup_preview()
         
+        # 取消正在进行的任务，不必等它们自然结束
+        if self.cancel_token:
+            self.cancel_token.cancel()
+        if hasattr(self, 'preview_thread') and self.preview_thread:
+            self.preview_thread.cancel_token.cancel()
+        if self.queue_thread:
+            self.queue_thread.cancel_token.cancel()
+        # 预加载线程是守护线程，不等待它完成
+        self.warmup_thread.cancel_token.cancel()
+        
         # 等待所有线程完成
         if hasattr(self, 'preview_thread') and self.preview_thread:
             self.preview_thread.wait()
@@ -787,6 +1237,8 @@ class MainWindow(QMainWindow):
             self.subtitle_thread.wait()
         if hasattr(self, 'dubbing_thread') and self.dubbing_thread:
             self.dubbing_thread.wait()
+        if self.queue_thread:
+            self.queue_thread.wait()
             
         event.accept()
 
@@ -813,7 +1265,7 @@ class MainWindow(QMainWindow):
                     return
                 
                 # 使用视频文件名保存字幕文件
-                base_name = dubbing_app.get_base_filename(video_path)
+                base_name = get_base_filename(video_path)
                 os.makedirs("subtitles", exist_ok=True)
                 self.current_cn_srt = os.path.join("subtitles", f"{base_name}_cn.srt")
                 
@@ -842,6 +1294,7 @@ class MainWindow(QMainWindow):
             # 清空字幕文件路径
             self.current_en_srt = None
             self.current_cn_srt = None
+            self.current_trace = None
             
             self.log("字幕已清空")
 
@@ -0,0 +1,162 @@
+import json
+import os
+import threading
+import time
+import uuid
+
+QUEUE_PATH = os.path.join("output", "queue.json")
+STATUS_NAMES = {
+    "pending": "等待中",
+    "running": "处理中",
+    "done": "已完成",
+    "failed": "失败"
+}
+STAGE_NAMES = {
+    "transcribe": "转录",
+    "translate": "翻译",
+    "tts": "语音合成",
+    "merge": "合并"
+}
+
+
+class QueueItem:
+    """队列中的一个视频及其配音设置"""
+    __slots__ = ("id", "video_path", "voice", "speed", "original_volume", "reencode",
+                 "subtitles", "status", "stage", "output", "error", "added", "finished")
+
+    def __init__(self, video_path, voice, speed=1.5, original_volume=0.1, reencode=False, subtitles="none",
+                 id=None, status="pending", stage="", output="", error="", added=None, finished=None):
+        self.id = id or uuid.uuid4().hex
+        self.video_path = video_path
+        self.voice = voice
+        self.speed = speed
+        self.original_volume = original_volume
+        self.reencode = reencode
+        self.subtitles = subtitles
+        self.status = status
+        self.stage = stage
+        self.output = output
+        self.error = error
+        self.added = added or time.time()
+        self.finished = finished
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{name: data[name] for name in cls.__slots__ if name in data})
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def settings(self):
+        """BatchRunner.process 使用的配音设置"""
+        return {
+            "voice": self.voice,
+            "speed": self.speed,
+            "original_volume": self.original_volume,
+            "reencode": self.reencode,
+            "subtitles": self.subtitles
+        }
+
+    @property
+    def status_text(self):
+        if self.status == "running" and self.stage in STAGE_NAMES:
+            return STAGE_NAMES[self.stage]
+        return STATUS_NAMES.get(self.status, self.status)
+
+
+class JobQueue:
+    """
+    持久化的任务队列，每次修改后整体写回 JSON 文件（先写临时文件再替换，崩溃时不会损坏）
+    界面线程添加/移除任务，调度线程更新状态，所有操作都加锁
+    上次退出时仍在处理中的任务重新载入后回到等待状态，已完成的阶段由 BatchRunner 的任务日志恢复
+    """
+
+    def __init__(self, path=QUEUE_PATH):
+        self.path = path
+        self.items = []
+        self.lock = threading.RLock()
+        if os.path.exists(path):
+            try:
+                with open(path, "r", encoding="utf-8") as f:
+                    records = json.load(f)
+            except (OSError, ValueError):
+                records = []
+            for record in records:
+                try:
+                    item = QueueItem.from_dict(record)
+                except TypeError:
+                    continue
+                if item.status == "running":
+                    item.status, item.stage = "pending", ""
+                self.items.append(item)
+
+    def save(self):
+        with self.lock:
+            records = [item.as_dict() for item in self.items]
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(records, f, ensure_ascii=False, indent=2)
+        os.replace(temp_path, self.path)
+
+    def add(self, video_path, voice, speed=1.5, original_volume=0.1, reencode=False, subtitles="none"):
+        item = QueueItem(os.path.abspath(video_path), voice, speed, original_volume, reencode, subtitles)
+        with self.lock:
+            self.items.append(item)
+        self.save()
+        return item
+
+    def get(self, item_id):
+        with self.lock:
+            for item in self.items:
+                if item.id == item_id:
+                    return item
+        return None
+
+    def index(self, item_id):
+        with self.lock:
+            for index, item in enumerate(self.items):
+                if item.id == item_id:
+                    return index
+        return -1
+
+    def remove(self, item_id):
+        """移除任务，处理中的任务不能移除"""
+        with self.lock:
+            item = self.get(item_id)
+            if item is None or item.status == "running":
+                return False
+            self.items.remove(item)
+        self.save()
+        return True
+
+    def update(self, item_id, **fields):
+        with self.lock:
+            item = self.get(item_id)
+            if item is None:
+                return None
+            for name, value in fields.items():
+                setattr(item, name, value)
+        self.save()
+        return item
+
+    def retry(self, item_id):
+        """失败的任务重新排队"""
+        with self.lock:
+            item = self.get(item_id)
+            if item is None or item.status != "failed":
+                return False
+            item.status, item.stage, item.error = "pending", "", ""
+        self.save()
+        return True
+
+    def pending(self):
+        with self.lock:
+            return [item for item in self.items if item.status == "pending"]
+
+    def counts(self):
+        with self.lock:
+            counts = dict.fromkeys(STATUS_NAMES, 0)
+            for item in self.items:
+                counts[item.status] = counts.get(item.status, 0) + 1
+        return counts
@@ -0,0 +1,142 @@
+import os
+import threading
+import time
+import weakref
+
+import torch
+import whisper
+from whisper.model import Linear as WhisperLinear
+from whisper.model import ModelDimensions, Whisper
+
+
+_inference_locks = weakref.WeakKeyDictionary()
+_inference_locks_guard = threading.Lock()
+
+
+def inference_lock(model):
+    """
+    模型的推理锁：Whisper 每次解码都在模型上安装、移除 kv-cache 钩子，同一个模型不能被两个线程同时解码
+    （任务队列和手动开始的任务共用注册表中的同一个模型）；每个解码窗口单独加锁，两个任务交替解码
+    """
+    with _inference_locks_guard:
+        lock = _inference_locks.get(model)
+        if lock is None:
+            lock = _inference_locks[model] = threading.RLock()
+        return lock
+
+
+def quantize_int8(model):
+    """
+    CPU 动态量化：把所有 Linear 层的权重量化为 int8，激活在运行时量化
+    Whisper 自定义的 Linear 子类无法直接被 quantize_dynamic 识别，先替换为共享权重的 nn.Linear
+    """
+    for module in list(model.modules()):
+        for name, child in list(module.named_children()):
+            if isinstance(child, WhisperLinear):
+                linear = torch.nn.Linear(child.in_features, child.out_features, bias=child.bias is not None)
+                linear.weight = child.weight
+                linear.bias = child.bias
+                setattr(module, name, linear)
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class ModelRegistry:
+    """
+    Whisper 模型注册表
+    按 (模型大小, 设备, 精度) 缓存已加载的模型；冷启动时直接读取官方检查点中的 state_dict
+    （支持时使用 mmap，避免把整个文件读入内存），不再 pickle 整个模块
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        self.models = {}
+        self.lock = threading.Lock()
+        self.key_locks = {}
+
+    def _key_lock(self, key):
+        with self.lock:
+            return self.key_locks.setdefault(key, threading.Lock())
+
+    def checkpoint_path(self, size):
+        """返回官方检查点文件路径，不存在时下载（下载后会校验 SHA256）"""
+        if size not in whisper._MODELS:
+            raise ValueError(f"未知的Whisper模型: {size}，可选: {', '.join(whisper.available_models())}")
+        return whisper._download(whisper._MODELS[size], self.cache_dir, False)
+
+    def _load_checkpoint(self, path):
+        try:
+            return torch.load(path, map_location="cpu", mmap=True, weights_only=True)
+        except Exception:
+            # 旧格式的检查点不支持 mmap
+            return torch.load(path, map_location="cpu")
+
+    def _build(self, size, device, dtype, logger):
+        checkpoint = self._load_checkpoint(self.checkpoint_path(size))
+        model = Whisper(ModelDimensions(**checkpoint["dims"]))
+        try:
+            model.load_state_dict(checkpoint["model_state_dict"], assign=True)
+        except TypeError:
+            model.load_state_dict(checkpoint["model_state_dict"])
+        if size in whisper._ALIGNMENT_HEADS:
+            model.set_alignment_heads(whisper._ALIGNMENT_HEADS[size])
+        model.eval()
+
+        if dtype == "int8":
+            # 量化模型只能在CPU上运行
+            if logger:
+                logger.info("正在对模型进行int8动态量化...")
+            return quantize_int8(model), "cpu"
+
+        if device == "cuda":
+            try:
+                model = model.to(device)
+                if logger:
+                    logger.info(f"模型已加载到GPU，当前显存使用: {torch.cuda.memory_allocated()/1024**2:.1f}MB")
+            except Exception as e:
+                # 权重已经在内存中，回退到CPU时不必重新加载
+                if logger:
+                    logger.error(f"GPU加载失败，回退到CPU: {str(e)}")
+                model = model.to("cpu")
+                device = "cpu"
+        return model, device
+
+    def get(self, size="base", device="cpu", dtype="float32", logger=None):
+        """
+        获取模型，已加载时直接返回（热启动）
+        :param dtype: float16 / float32 为推理精度；int8 表示CPU上的动态量化模型（device 会被强制为 cpu）
+        """
+        if dtype == "int8":
+            device = "cpu"
+        key = (size, device, dtype)
+        start = time.perf_counter()
+        with self._key_lock(key):
+            model = self.models.get(key)
+            if model is not None:
+                if logger:
+                    logger.info(f"Whisper模型已就绪（热启动，{(time.perf_counter() - start) * 1000:.0f}毫秒）")
+                return model
+            if logger:
+                logger.info(f"正在加载Whisper模型 ({size}, {device}, {dtype})...")
+            model, actual_device = self._build(size, device, dtype, logger)
+            self.models[key] = model
+            if actual_device != device:
+                self.models[(size, actual_device, dtype)] = model
+        if logger:
+            logger.info(f"Whisper模型加载完成（冷启动，{time.perf_counter() - start:.1f}秒）")
+        return model
+
+    def is_loaded(self, size="base", device="cpu", dtype="float32"):
+        if dtype == "int8":
+            device = "cpu"
+        return (size, device, dtype) in self.models
+
+    def remove_legacy_cache(self, logger=None):
+        """删除旧版本 pickle 整个模块生成的缓存文件"""
+        legacy = os.path.join(self.cache_dir, "whisper_model.pt")
+        if os.path.exists(legacy):
+            try:
+                os.remove(legacy)
+                if logger:
+                    logger.info("已删除旧的模型缓存文件 whisper_model.pt")
+            except OSError:
+                pass
@@ -0,0 +1,286 @@
+import asyncio
+import concurrent.futures
+import os
+import threading
+import time
+
+import app as dubbing_app
+from cancellation import Cancelled, CancelToken, run_cancellable
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+from progress import ProgressReporter
+from srt_model import Cue, SrtWriter, save_subtitle_style
+from time_fit import TimeFitter, slot_lengths
+from tracing import run_in_context, span, traced
+from transcribe_stream import transcribe_spans, transcribe_windowed
+from tts_engine import SpeechSynthesizer, build_rate_string
+
+_END = object()  # 队列结束标记
+
+
+class StageMetrics:
+    """单个流水线阶段的统计：处理条数、忙碌时间、输入队列最大深度和吞吐量"""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self.max_queue_depth = 0
+        self.started = None
+        self.finished = None
+
+    def observe_queue(self, queue):
+        self.max_queue_depth = max(self.max_queue_depth, queue.qsize())
+
+    def record(self, seconds, items=1):
+        now = time.perf_counter()
+        if self.started is None:
+            self.started = now - seconds
+        self.finished = now
+        self.busy += seconds
+        self.items += items
+
+    @property
+    def throughput(self):
+        if not self.items or self.finished is None or self.finished <= self.started:
+            return 0.0
+        return self.items / (self.finished - self.started)
+
+    def as_dict(self):
+        return {
+            "stage": self.name,
+            "items": self.items,
+            "busy_seconds": round(self.busy, 3),
+            "max_queue_depth": self.max_queue_depth,
+            "throughput": round(self.throughput, 3)
+        }
+
+    def __str__(self):
+        return (f"{self.name}: {self.items} 条, 忙碌 {self.busy:.1f}秒, "
+                f"最大队列深度 {self.max_queue_depth}, 吞吐 {self.throughput:.2f} 条/秒")
+
+
+class DubbingPipeline:
+    """
+    流水线配音：转录、翻译、语音合成（含时长适配）三个阶段通过有界 asyncio 队列连接，
+    Whisper 每输出一批字幕就立即进入翻译和 TTS，总耗时接近最慢的阶段而不是各阶段之和；
+    所有语音片段完成后用与顺序模式相同的 merge_video_audio 混音并封装（增量混音、软字幕/烧录字幕、
+    复制失败时改为重新编码）
+    :param queue_size: 阶段之间队列的容量，下游跟不上时上游会被阻塞（背压）
+    :param window_seconds: 转录窗口长度，越短首批字幕到达下游越快
+    :param profile: 转录档位，见 app.make_profile
+    :param vad: 只转录语音活动检测得到的语音区间
+    :param fit_mode: 见 app.generate_speech
+    :param subtitles: 见 app.merge_video_audio
+    :param subtitle_style: 见 app.generate_subtitles
+    :param on_progress: 接收各阶段 ProgressEvent 的回调
+    :param cancel_token: CancelToken，取消时终止所有阶段并删除未完成的文件
+    """
+
+    def __init__(self, video_path, voice_id, callback=None, speed_rate=1.5, original_volume=0.1,
+                 queue_size=32, tts_concurrency=4, translate_batch=16, window_seconds=60, profile=None, vad=True,
+                 fit_mode="rate", subtitles="none", subtitle_style=None, on_progress=None, cancel_token=None):
+        self.video_path = video_path
+        self.voice_id = voice_id
+        self.callback = callback
+        self.logger = dubbing_app.LoggerCallback(callback)
+        self.speed_rate = speed_rate
+        self.original_volume = original_volume
+        self.queue_size = queue_size
+        self.tts_concurrency = tts_concurrency
+        self.translate_batch = translate_batch
+        self.window_seconds = window_seconds
+        self.profile = profile
+        self.vad = vad
+        self.fit_mode = fit_mode
+        self.subtitles = subtitles
+        self.subtitle_style = subtitle_style
+        self.on_progress = on_progress
+        self.cancel_token = cancel_token or CancelToken()
+        self.metrics = {name: StageMetrics(name) for name in ("transcribe", "translate", "tts")}
+        self.reporters = {
+            "translate": ProgressReporter(on_progress, "translate", 0, "条"),
+            "tts": ProgressReporter(on_progress, "tts", 0, "条")
+        }
+        self.stopped = threading.Event()
+        self.written = []  # 本次合成的语音片段路径，取消时删除
+        self.audio = None  # 解码缓存中的音轨（AudioArtifact），视频没有音轨时为 None
+
+        base_name = dubbing_app.get_base_filename(video_path)
+        os.makedirs("subtitles", exist_ok=True)
+        os.makedirs("audio", exist_ok=True)
+        self.base_name = base_name
+        self.en_srt = os.path.join("subtitles", f"{base_name}_en.srt")
+        self.cn_srt = os.path.join("subtitles", f"{base_name}_cn.srt")
+
+    def _put_from_thread(self, loop, queue, item):
+        # 在线程中向事件循环的队列放入数据，队列满时阻塞；流水线已停止时放弃
+        while not self.stopped.is_set():
+            future = asyncio.run_coroutine_threadsafe(asyncio.wait_for(queue.put(item), 0.5), loop)
+            try:
+                future.result()
+                return
+            except (asyncio.TimeoutError, concurrent.futures.TimeoutError):
+                continue
+        raise asyncio.CancelledError()
+
+    def _advance(self, stage):
+        # 转录完成前总条数未知，以已转录的条数作为总数
+        reporter = self.reporters[stage]
+        reporter.total = self.metrics["transcribe"].items
+        reporter.advance()
+
+    @traced("generate_subtitles")
+    def _transcribe(self, loop, out_queue, duration):
+        model = dubbing_app.get_model(self.callback, self.profile)
+        metrics = self.metrics["transcribe"]
+        reporter = ProgressReporter(self.on_progress, "transcribe", duration, "秒音频")
+        with SrtWriter(self.en_srt, flush=True) as writer:
+            started = time.perf_counter()
+            options = dubbing_app.transcribe_options(self.profile)
+            source = self.audio.speech if self.audio else self.video_path
+            spans = dubbing_app.speech_spans(source, self.logger) if self.vad else None
+            on_window = lambda position: reporter.update(min(position, duration))
+            if spans is not None:
+                segments = transcribe_spans(model, source, options, spans, self.window_seconds, on_group=on_window)
+            else:
+                segments = transcribe_windowed(model, source, options, self.window_seconds, on_window=on_window)
+            for index, seg in enumerate(dubbing_app.cancellable_segments(segments, self.cancel_token), 1):
+                metrics.record(time.perf_counter() - started)
+                # 时间按 SRT 精度取整，与 merge_video_audio 读取字幕时的结果一致
+                cue = Cue.from_seconds(seg["start"], seg["end"], seg["text"])
+                writer.write(cue)
+                self._put_from_thread(loop, out_queue, {"index": index, "cue": cue, "start": cue.start})
+                started = time.perf_counter()
+        reporter.finish()
+        self._put_from_thread(loop, out_queue, _END)
+
+    async def _translate(self, in_queue, out_queue):
+        loop = asyncio.get_event_loop()
+        metrics = self.metrics["translate"]
+        finished = False
+        # 时长适配需要下一条字幕的起始时间（结束时间可能与之重叠）：每条有译文的字幕等下一条到达后再交给语音合成
+        pending = None
+        with SrtWriter(self.cn_srt, flush=True) as writer:
+            while not finished:
+                metrics.observe_queue(in_queue)
+                # 取出当前已到达的字幕（至少一条），凑成一批再翻译
+                batch = [await in_queue.get()]
+                while len(batch) < self.translate_batch and not in_queue.empty():
+                    batch.append(in_queue.get_nowait())
+                if batch[-1] is _END:
+                    batch.pop()
+                    finished = True
+                if not batch:
+                    continue
+                await self.cancel_token.check_async()
+                started = time.perf_counter()
+                with span("translate_batch", items=len(batch)):
+                    translated = await loop.run_in_executor(
+                        None, dubbing_app.translator.translate_many, [seg["cue"].plain_text for seg in batch]
+                    )
+                metrics.record(time.perf_counter() - started, len(batch))
+                for seg, text in zip(batch, translated):
+                    cue = seg["cue"].replace(text)
+                    writer.write(cue)
+                    self._advance("translate")
+                    if not text:
+                        continue
+                    if pending is not None:
+                        pending["slot"] = slot_lengths([pending["cue"], cue])[0]
+                        await out_queue.put(pending)
+                    pending = dict(seg, cue=cue, text=text)
+        if pending is not None:
+            pending["slot"] = slot_lengths([pending["cue"]])[0]
+            await out_queue.put(pending)
+        await out_queue.put(_END)
+
+    async def _synthesize(self, in_queue, results, synthesizer, fitter):
+        metrics = self.metrics["tts"]
+        while True:
+            metrics.observe_queue(in_queue)
+            seg = await in_queue.get()
+            if seg is _END:
+                # 放回结束标记，让其余工作协程也能退出
+                await in_queue.put(_END)
+                return
+            started = time.perf_counter()
+            audio_file = os.path.join("audio", f"{self.base_name}_speech_{seg['index']}.mp3")
+            self.written.append(audio_file)
+            clip = await synthesizer.synthesize_one(seg["text"], audio_file)
+            if fitter:
+                clip = await fitter.fit_one(seg["text"], clip, seg["slot"], audio_file)
+            results[seg["index"]] = (clip, seg["cue"])
+            metrics.record(time.perf_counter() - started)
+            self._advance("tts")
+
+    def _remove_partial(self):
+        """取消时删除本次写出的字幕和语音片段（缓存中的片段不在 audio 目录下，不受影响）"""
+        paths = [self.en_srt, self.cn_srt]
+        for audio_file in self.written:
+            stem = os.path.splitext(audio_file)[0]
+            paths += [audio_file, stem + "_fit.mp3", stem + "_fit.wav"]
+        for path in paths:
+            if os.path.exists(path):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    async def run(self):
+        loop = asyncio.get_event_loop()
+        infos = ffmpeg_parse_infos(self.video_path)
+        if self.subtitle_style:
+            save_subtitle_style(self.en_srt, self.subtitle_style)
+        if infos.get("audio_found"):
+            # 先解码一次音轨，转录和最后的混音都读取这份缓存
+            self.audio = await loop.run_in_executor(
+                None, run_in_context(dubbing_app.load_audio, self.video_path, self.logger, self.on_progress,
+                                     self.cancel_token)
+            )
+        synthesizer = SpeechSynthesizer(
+            self.voice_id,
+            build_rate_string(self.speed_rate),
+            concurrency=self.tts_concurrency,
+            logger=self.logger,
+            cache=dubbing_app.clip_cache,
+            cancel_token=self.cancel_token
+        )
+        fitter = TimeFitter(synthesizer, self.speed_rate, self.fit_mode, logger=self.logger) if self.fit_mode else None
+        segments = asyncio.Queue(self.queue_size)
+        translated = asyncio.Queue(self.queue_size)
+        results = {}  # 字幕序号 -> (语音片段, 中文字幕条目)
+
+        self.logger.info("流水线模式：转录、翻译和语音合成同时进行...")
+        transcribing = loop.run_in_executor(None, run_in_context(self._transcribe, loop, segments, infos["duration"]))
+        tasks = [asyncio.ensure_future(self._translate(segments, translated))] + [
+            asyncio.ensure_future(self._synthesize(translated, results, synthesizer, fitter))
+            for _ in range(self.tts_concurrency)
+        ]
+        try:
+            # 转录线程无法被强行取消，shield 使它在出错或取消时仍能被等待到退出
+            await run_cancellable(asyncio.gather(asyncio.shield(transcribing), *tasks), self.cancel_token)
+        except BaseException as e:
+            self.stopped.set()
+            for task in tasks:
+                task.cancel()
+            # 转录线程在下一个解码窗口或向队列放入数据时退出，之后才能删除它正在写的字幕
+            await asyncio.gather(transcribing, *tasks, return_exceptions=True)
+            if isinstance(e, Cancelled):
+                self._remove_partial()
+            raise
+        finally:
+            # 转录已经结束，释放音轨的内存映射；混音时 merge_video_audio 重新从缓存取得
+            if self.audio:
+                self.audio.close()
+        if fitter:
+            fitter.log_summary()
+        for metrics in self.metrics.values():
+            self.logger.info(str(metrics))
+
+        # 所有片段到齐后与顺序模式相同地混音并封装
+        audio_files = [results[index] for index in sorted(results)]
+        return await loop.run_in_executor(None, run_in_context(
+            dubbing_app.merge_video_audio, self.video_path, audio_files, self.cn_srt, self.callback,
+            original_volume=self.original_volume, on_progress=self.on_progress, cancel_token=self.cancel_token,
+            subtitles=self.subtitles
+        ))
@@ -0,0 +1,73 @@
+"""
+静态配置：配音声音列表、转录档位和文件命名
+只依赖标准库，GUI 启动时导入它来构建界面，不必等待 torch、whisper、moviepy 加载完成
+"""
+import os
+
+# Edge TTS 支持的中文语音列表
+CHINESE_VOICES = {
+    # 中国大陆
+    "zh-CN-XiaoyiNeural": "晓伊 - 女声 (大陆标准普通话)",
+    "zh-CN-YunxiNeural": "云希 - 男声 (大陆标准普通话)",
+    "zh-CN-YunjianNeural": "云健 - 男声 (大陆标准普通话)",
+    "zh-CN-YunyangNeural": "云扬 - 男声 (大陆新闻播报)",
+    "zh-CN-XiaochenNeural": "晓辰 - 女声 (大陆标准普通话)",
+    "zh-CN-XiaohanNeural": "晓涵 - 女声 (大陆标准普通话)",
+    "zh-CN-XiaomengNeural": "晓梦 - 女声 (大陆标准普通话)",
+    "zh-CN-XiaomoNeural": "晓墨 - 女声 (大陆标准普通话)",
+    "zh-CN-XiaoxuanNeural": "晓萱 - 女声 (大陆标准普通话)",
+    "zh-CN-XiaoyanNeural": "晓颜 - 女声 (大陆标准普通话)",
+    "zh-CN-XiaoyouNeural": "晓悠 - 女声 (大陆标准普通话)",
+
+    # 中国香港
+    "zh-HK-HiuGaaiNeural": "晓薇 - 女声 (香港粤语)",
+    "zh-HK-HiuMaanNeural": "晓曼 - 女声 (香港粤语)",
+    "zh-HK-WanLungNeural": "云龙 - 男声 (香港粤语)",
+
+    # 中国台湾
+    "zh-TW-HsiaoChenNeural": "晓臻 - 女声 (台湾国语)",
+    "zh-TW-YunJheNeural": "云哲 - 男声 (台湾国语)",
+    "zh-TW-HsiaoYuNeural": "晓雨 - 女声 (台湾国语)",
+}
+
+# 转录速度/质量档位
+MODEL_SIZES = ["tiny", "base", "small", "medium"]
+DECODING_MODES = {
+    "beam": {"beam_size": 5, "best_of": 5},      # 束搜索：质量高，速度慢
+    "greedy": {"beam_size": None, "best_of": None}  # 贪心解码：速度快
+}
+DEFAULT_PROFILE = {"model_size": "base", "decoding": "beam", "quantize": False}
+
+
+# 输出视频中的字幕：软字幕轨道（mov_text，不重新编码）或烧录到画面（需要重新编码）
+SUBTITLE_MODES = {
+    "none": "不添加字幕",
+    "soft": "软字幕（中英文字幕轨道，可在播放器中开关）",
+    "burn": "烧录中文字幕（需要重新编码）"
+}
+DEFAULT_SUBTITLE_STYLE = {
+    "font": "Microsoft YaHei",
+    "size": 20,
+    "color": "#FFFFFF",
+    "outline_color": "#000000",
+    "outline": 2,  # 描边宽度
+    "shadow": 0,
+    "margin_v": 20,  # 距画面底部的距离
+    "bold": False
+}
+
+def make_profile(model_size="base", decoding="beam", quantize=False):
+    """
+    生成转录档位（不检查设备，int8 量化是否生效由 app.model_dtype 按设备决定）
+    :param quantize: 是否使用int8动态量化模型，仅在CPU上生效
+    """
+    if model_size not in MODEL_SIZES:
+        raise ValueError(f"不支持的模型大小: {model_size}")
+    if decoding not in DECODING_MODES:
+        raise ValueError(f"不支持的解码方式: {decoding}")
+    return {"model_size": model_size, "decoding": decoding, "quantize": bool(quantize)}
+
+
+def get_base_filename(video_path):
+    """获取不带扩展名的基础文件名"""
+    return os.path.splitext(os.path.basename(video_path))[0]
@@ -0,0 +1,166 @@
+import contextlib
+import importlib
+import threading
+import time
+
+STAGE_NAMES = {
+    "extract": "解码音轨",
+    "transcribe": "转录",
+    "translate": "翻译",
+    "tts": "语音合成",
+    "mix": "混音",
+    "mux": "封装",
+    "encode": "编码"
+}
+
+
+class ProgressEvent:
+    """
+    一次进度更新
+    :param fraction: 当前阶段的完成比例 (0-1)
+    :param rate: 吞吐量（unit/秒）
+    :param eta: 预计剩余秒数，未知时为 None
+    """
+    __slots__ = ("stage", "done", "total", "unit", "rate", "eta")
+
+    def __init__(self, stage, done, total, unit="", rate=0.0, eta=None):
+        self.stage = stage
+        self.done = done
+        self.total = total
+        self.unit = unit
+        self.rate = rate
+        self.eta = eta
+
+    @property
+    def fraction(self):
+        return min(1.0, self.done / self.total) if self.total else 0.0
+
+    @property
+    def stage_name(self):
+        return STAGE_NAMES.get(self.stage, self.stage)
+
+    def __str__(self):
+        text = f"{self.stage_name} {self.fraction * 100:.0f}%"
+        if self.rate:
+            text += f"，{self.rate:.1f} {self.unit}/秒"
+        if self.eta is not None:
+            text += f"，剩余 {format_eta(self.eta)}"
+        return text
+
+
+def format_eta(seconds):
+    seconds = int(round(seconds))
+    hours, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    return f"{hours}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:02d}:{seconds:02d}"
+
+
+class ProgressReporter:
+    """
+    计算某个阶段的完成比例、吞吐量和剩余时间，并限制发送频率
+    :param on_progress: 接收 ProgressEvent 的回调，None 表示不报告
+    :param min_interval: 两次发送之间的最短间隔（秒），避免进度事件塞满 Qt 事件队列
+    """
+
+    def __init__(self, on_progress, stage, total, unit="", min_interval=0.25):
+        self.on_progress = on_progress
+        self.stage = stage
+        self.total = total
+        self.unit = unit
+        self.min_interval = min_interval
+        self.done = 0
+        self.started = time.monotonic()
+        self.last_emit = 0.0
+        self.lock = threading.Lock()
+
+    def update(self, done, force=False):
+        if self.on_progress is None:
+            return
+        with self.lock:
+            self.done = done
+            now = time.monotonic()
+            finished = self.total and done >= self.total
+            if not (force or finished) and now - self.last_emit < self.min_interval:
+                return
+            self.last_emit = now
+            elapsed = now - self.started
+            rate = done / elapsed if elapsed > 0 else 0.0
+            eta = (self.total - done) / rate if rate > 0 and self.total else None
+            event = ProgressEvent(self.stage, done, self.total, self.unit, rate, eta)
+        self.on_progress(event)
+
+    def advance(self, count=1):
+        self.update(self.done + count)
+
+    def finish(self):
+        self.update(self.total, force=True)
+
+
+class _WhisperProgressBar:
+    """替换 whisper.transcribe 中的 tqdm 进度条，把逐窗口的进度转发给 ProgressReporter，并在每个窗口处检查取消"""
+
+    def __init__(self, reporter, cancel_token=None, total=None, **kwargs):
+        self.reporter = reporter
+        self.cancel_token = cancel_token
+        self.total = total or 0
+        self.done = 0
+
+    def update(self, count):
+        self.done += count
+        if self.cancel_token:
+            self.cancel_token.check()
+        if self.total and self.reporter:
+            # Whisper 以梅尔帧计数，每秒 100 帧
+            self.reporter.update(min(self.reporter.total, self.reporter.total * self.done / self.total))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+class _WhisperTqdm:
+    """安装在 whisper.transcribe 模块中代替 tqdm：当前线程登记了监听时转发进度，否则使用原来的进度条"""
+
+    def __init__(self, original):
+        self.original = original
+
+    def tqdm(self, *args, **kwargs):
+        listener = getattr(_whisper_state, "listener", None)
+        if listener is None:
+            return self.original.tqdm(*args, **kwargs)
+        return _WhisperProgressBar(*listener, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.original, name)
+
+
+_whisper_state = threading.local()
+_install_lock = threading.Lock()
+
+
+def _install_whisper_hook():
+    module = importlib.import_module("whisper.transcribe")
+    with _install_lock:
+        if not isinstance(module.tqdm, _WhisperTqdm):
+            module.tqdm = _WhisperTqdm(module.tqdm)
+
+
+@contextlib.contextmanager
+def whisper_progress(reporter, cancel_token=None):
+    """
+    在 model.transcribe 运行期间接收 Whisper 的逐窗口（30 秒）进度，并在每个窗口处检查暂停和取消
+    只对当前线程生效，多个线程可以同时转录
+    :param reporter: ProgressReporter，None 表示只检查取消
+    """
+    if (reporter is None or reporter.on_progress is None) and cancel_token is None:
+        yield
+        return
+    _install_whisper_hook()
+    previous = getattr(_whisper_state, "listener", None)
+    _whisper_state.listener = (reporter if reporter and reporter.on_progress else None, cancel_token)
+    try:
+        yield
+    finally:
+        _whisper_state.listener = previous
@@ -0,0 +1,158 @@
+"""
+分段并行编码：视频流按关键帧切成若干段（流复制，不解码），多个 ffmpeg 进程同时编码，
+再用 concat 分离器无损拼接并与混音后的音轨一起封装
+每段都从关键帧开始，各自独立解码，拼接处不会丢帧或重复
+"""
+import concurrent.futures
+import os
+import shutil
+import tempfile
+import threading
+
+from cancellation import POLL_INTERVAL, Cancelled, CancelToken
+from ffmpeg_utils import render_video, run_ffmpeg, subtitle_track_args
+
+SEGMENT_MIN_SECONDS = 20  # 每段的最短时长，更短的视频直接整段编码
+SEGMENTS_PER_WORKER = 2  # 段数多于进程数，复杂度不同的段之间负载更均衡
+HARDWARE_SESSIONS = 2  # 硬件编码器同时打开的会话数上限（消费级显卡通常只允许少量会话）
+
+
+def default_workers():
+    """默认的并行编码进程数：每个 ffmpeg 进程保留两个线程"""
+    return max(1, (os.cpu_count() or 1) // 2)
+
+
+def plan_segments(duration, workers, encoder=None):
+    """
+    计算实际使用的进程数和段数
+    :return: (workers, segments)，segments 为 1 表示不分段
+    """
+    if encoder is not None and encoder.codec != "libx264":
+        workers = min(workers, HARDWARE_SESSIONS)
+    segments = min(workers * SEGMENTS_PER_WORKER, int(duration // SEGMENT_MIN_SECONDS))
+    if workers <= 1 or segments <= 1:
+        return 1, 1
+    return min(workers, segments), segments
+
+
+def split_video(video_path, segments, duration, directory):
+    """
+    按时间平均切分视频流（流复制），切点由 segment 封装器对齐到其后的第一个关键帧
+    关键帧稀疏时实际段数可能少于 segments
+    :return: [(段文件路径, 该段在原视频中的起始秒数), ...]
+    """
+    if segments <= 1:
+        return [(video_path, 0.0)]
+    times = ",".join(f"{duration * index / segments:.3f}" for index in range(1, segments))
+    list_path = os.path.join(directory, "segments.csv")
+    run_ffmpeg([
+        "-i", video_path,
+        "-map", "0:v:0",
+        "-c", "copy",
+        "-f", "segment",
+        "-segment_times", times,
+        "-segment_format", "matroska",
+        "-segment_list", list_path,
+        "-segment_list_type", "csv",
+        "-reset_timestamps", "1",
+        os.path.join(directory, "source_%04d.mkv")
+    ])
+    sources = []
+    with open(list_path, "r", encoding="utf-8") as f:
+        # 每行为 "文件名,起始时间,结束时间"
+        for line in f:
+            name, start, _ = line.strip().rsplit(",", 2)
+            sources.append((os.path.join(directory, name), float(start)))
+    return sources
+
+
+def _concat_list(paths, list_path):
+    with open(list_path, "w", encoding="utf-8") as f:
+        for path in paths:
+            # concat 列表中的单引号需要转义
+            escaped = os.path.abspath(path).replace("'", "'\\''")
+            f.write(f"file '{escaped}'\n")
+    return list_path
+
+
+def encode_segmented(video_path, audio_path, output_path, encoder, duration, workers=None,
+                     on_progress=None, cancel_token=None, logger=None, video_filters=(), subtitle_tracks=()):
+    """
+    分段并行编码视频并封装音轨
+    音轨在最后封装时整体编码一次：AAC 每段都有编码延迟，分段编码再拼接会在段落交界处产生空隙
+    :param encoder: encoder_probe.EncoderCandidate
+    :param workers: 同时运行的 ffmpeg 进程数，None 表示 default_workers()
+    :param on_progress: 回调参数为所有段合计已编码的时长（秒）
+    :param cancel_token: CancelToken，取消时终止所有 ffmpeg 进程并抛出 Cancelled
+    :param video_filters: 见 ffmpeg_utils.render_video；滤镜看到的是原视频时间轴（烧录字幕时与字幕时间对齐）
+    :param subtitle_tracks: 拼接时封装的软字幕轨道，见 ffmpeg_utils.subtitle_track_args
+    :return: 实际的段数
+    """
+    workers, segments = plan_segments(duration, workers or default_workers(), encoder)
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    directory = tempfile.mkdtemp(prefix="segments_", dir=os.path.dirname(os.path.abspath(output_path)))
+    temp_path = output_path + ".part" + os.path.splitext(output_path)[1]
+    # 任意一段失败时用它终止其余段的 ffmpeg，不影响调用方的令牌
+    local_token = CancelToken()
+    try:
+        sources = split_video(video_path, segments, duration, directory)
+        if logger:
+            logger.info(f"分段并行编码：{len(sources)} 段，{workers} 个 ffmpeg 进程，每个 {threads} 线程")
+
+        progress = [0.0] * len(sources)
+        lock = threading.Lock()
+
+        def encode_one(index, source, start):
+            def on_segment(seconds):
+                with lock:
+                    progress[index] = seconds
+                    total = sum(progress)
+                if on_progress:
+                    on_progress(total)
+            target = os.path.join(directory, f"encoded_{index:04d}.mkv")
+            filters = list(video_filters)
+            if filters:
+                # 各段的时间戳从 0 开始，滤镜前恢复原视频时间，编码前再归零
+                filters = [f"setpts=PTS+{start:.6f}/TB"] + filters + ["setpts=PTS-STARTPTS"]
+            return render_video(source, None, target, encoder, filters, threads, on_segment, local_token)
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            # 每个线程只负责等待自己的 ffmpeg 子进程，编码本身在各个 ffmpeg 进程中并行
+            futures = [pool.submit(encode_one, index, source, start) for index, (source, start) in enumerate(sources)]
+            try:
+                pending = set(futures)
+                while pending:
+                    done, pending = concurrent.futures.wait(
+                        pending, timeout=POLL_INTERVAL, return_when=concurrent.futures.FIRST_EXCEPTION
+                    )
+                    for future in done:
+                        future.result()
+                    if cancel_token and cancel_token.cancelled:
+                        raise Cancelled()
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                local_token.cancel()
+                raise
+        encoded = [future.result() for future in futures]
+
+        subtitle_inputs, subtitle_outputs = subtitle_track_args(subtitle_tracks, 2)
+        run_ffmpeg([
+            "-f", "concat", "-safe", "0", "-i", _concat_list(encoded, os.path.join(directory, "list.txt")),
+            "-i", audio_path
+        ] + subtitle_inputs + [
+            "-map", "0:v:0",
+            "-map", "1:a:0",
+            "-c:v", "copy",
+            "-c:a", "aac",
+            "-b:a", "192k"
+        ] + subtitle_outputs + [
+            "-movflags", "+faststart",
+            temp_path
+        ], cancel_token=cancel_token)
+        os.replace(temp_path, output_path)
+        return len(sources)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        shutil.rmtree(directory, ignore_errors=True)
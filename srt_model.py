@@ -0,0 +1,226 @@
+import json
+import os
+from array import array
+
+from presets import DEFAULT_SUBTITLE_STYLE
+
+TIMING_SEPARATOR = " --> "
+
+
+def parse_ms(timestamp):
+    """解析 SRT 时间戳 (HH:MM:SS,mmm，也接受 . 作为毫秒分隔符)，返回毫秒数"""
+    timestamp = timestamp.strip()
+    clock, _, millis = timestamp.replace(".", ",").partition(",")
+    parts = clock.split(":")
+    seconds = 0
+    for part in parts:
+        seconds = seconds * 60 + int(part)
+    return seconds * 1000 + int((millis + "000")[:3] if millis else 0)
+
+
+def format_ms(ms):
+    hours, ms = divmod(int(ms), 3600000)
+    minutes, ms = divmod(ms, 60000)
+    secs, millis = divmod(ms, 1000)
+    return f"{hours:02d}:{minutes:02d}:{secs:02d},{millis:03d}"
+
+
+def parse_timestamp(timestamp):
+    """解析 SRT 时间戳，返回秒数"""
+    return parse_ms(timestamp) / 1000
+
+
+def format_timestamp(seconds):
+    """秒数格式化为 SRT 时间戳，按毫秒四舍五入"""
+    return format_ms(round(seconds * 1000))
+
+
+class Cue:
+    """一条字幕：起止时间（毫秒）和文本（多行文本以换行符分隔）"""
+    __slots__ = ("start_ms", "end_ms", "text")
+
+    def __init__(self, start_ms, end_ms, text):
+        self.start_ms = start_ms
+        self.end_ms = end_ms
+        self.text = text
+
+    @classmethod
+    def from_seconds(cls, start, end, text):
+        return cls(round(start * 1000), round(end * 1000), text)
+
+    @property
+    def start(self):
+        return self.start_ms / 1000
+
+    @property
+    def end(self):
+        return self.end_ms / 1000
+
+    @property
+    def timing(self):
+        return f"{format_ms(self.start_ms)}{TIMING_SEPARATOR}{format_ms(self.end_ms)}"
+
+    @property
+    def plain_text(self):
+        """合并为单行的文本，用于翻译和语音合成"""
+        return " ".join(line.strip() for line in self.text.splitlines() if line.strip())
+
+    def replace(self, text):
+        return Cue(self.start_ms, self.end_ms, text)
+
+    def __eq__(self, other):
+        return (isinstance(other, Cue) and self.start_ms == other.start_ms
+                and self.end_ms == other.end_ms and self.text == other.text)
+
+    def __repr__(self):
+        return f"Cue({self.timing!r}, {self.text!r})"
+
+
+def _parse_block(lines):
+    for i, line in enumerate(lines):
+        if "-->" in line:
+            start, _, end = line.partition("-->")
+            # 结束时间后面可能带有位置等附加信息
+            end = end.split()[0] if end.split() else end
+            return Cue(parse_ms(start), parse_ms(end), "\n".join(lines[i + 1:]))
+    return None
+
+
+def iter_cues(path):
+    """
+    流式解析 SRT 文件，逐条产出 Cue；不依赖固定的行号偏移，支持多行字幕、
+    CRLF 换行、BOM 以及缺失或不连续的序号
+    """
+    with open(path, "r", encoding="utf-8-sig") as f:
+        block = []
+        for line in f:
+            line = line.rstrip("\r\n")
+            if line.strip():
+                block.append(line)
+                continue
+            if block:
+                cue = _parse_block(block)
+                if cue is not None:
+                    yield cue
+                block = []
+        if block:
+            cue = _parse_block(block)
+            if cue is not None:
+                yield cue
+
+
+class SrtWriter:
+    """
+    逐条写入 SRT，序号自动递增
+    :param flush: 每条写完是否立即刷新到磁盘（边生成边写入时使用）
+    """
+
+    def __init__(self, path, flush=False):
+        self.file = open(path, "w", encoding="utf-8")
+        self.flush = flush
+        self.count = 0
+
+    def write(self, cue):
+        self.count += 1
+        self.file.write(f"{self.count}\n{cue.timing}\n{cue.text}\n\n")
+        if self.flush:
+            self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_srt(path, cues, flush=False):
+    """写出 SRT，cues 可以是生成器；返回写入的条数"""
+    with SrtWriter(path, flush) as writer:
+        for cue in cues:
+            writer.write(cue)
+        return writer.count
+
+
+def subtitle_sibling(srt_path, suffix):
+    """同一视频的其他字幕文件：xxx_cn.srt -> xxx_en.srt、xxx_style.json"""
+    base = os.path.splitext(srt_path)[0]
+    for language in ("_cn", "_en"):
+        if base.endswith(language):
+            base = base[:-len(language)]
+            break
+    return f"{base}_{suffix}"
+
+
+def save_subtitle_style(srt_path, style):
+    """把字幕样式保存在字幕文件旁边，合并视频烧录字幕时读取"""
+    path = subtitle_sibling(srt_path, "style.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(style, f, ensure_ascii=False, indent=2)
+    return path
+
+
+def load_subtitle_style(srt_path):
+    """读取字幕旁保存的样式，未保存的字段使用默认值"""
+    style = dict(DEFAULT_SUBTITLE_STYLE)
+    try:
+        with open(subtitle_sibling(srt_path, "style.json"), "r", encoding="utf-8") as f:
+            style.update(json.load(f))
+    except (OSError, ValueError):
+        pass
+    return style
+
+class SubtitleTrack:
+    """
+    一整条字幕轨：起止时间存放在紧凑的 int64 数组中，文本单独存放在列表中，
+    十万条字幕也只占用很少的内存
+    """
+
+    def __init__(self):
+        self.starts = array("q")
+        self.ends = array("q")
+        self.texts = []
+
+    @classmethod
+    def read(cls, path):
+        track = cls()
+        for cue in iter_cues(path):
+            track.append(cue)
+        return track
+
+    @classmethod
+    def from_cues(cls, cues):
+        track = cls()
+        for cue in cues:
+            track.append(cue)
+        return track
+
+    def append(self, cue):
+        self.starts.append(cue.start_ms)
+        self.ends.append(cue.end_ms)
+        self.texts.append(cue.text)
+
+    def with_texts(self, texts):
+        """返回时间轴相同、文本替换后的新字幕轨"""
+        track = SubtitleTrack()
+        track.starts = array("q", self.starts)
+        track.ends = array("q", self.ends)
+        track.texts = list(texts)
+        if len(track.texts) != len(self.texts):
+            raise ValueError(f"字幕条数不一致: {len(self.texts)} != {len(track.texts)}")
+        return track
+
+    def write(self, path, flush=False):
+        return write_srt(path, self, flush)
+
+    def __len__(self):
+        return len(self.texts)
+
+    def __getitem__(self, index):
+        return Cue(self.starts[index], self.ends[index], self.texts[index])
+
+    def __iter__(self):
+        for start, end, text in zip(self.starts, self.ends, self.texts):
+            yield Cue(start, end, text)
@@ -0,0 +1,65 @@
+import json
+import os
+
+import numpy as np
+
+from audio_cache import AudioCache, source_digest
+
+
+def add_entry(cache, tmp_path, name, frames=1000):
+    """不运行 ffmpeg，直接写出一份缓存音轨，返回对应的"视频"文件路径"""
+    video_path = str(tmp_path / f"{name}.mp4")
+    with open(video_path, "wb") as f:
+        f.write(name.encode("utf-8"))
+    meta_path = cache.meta_path(source_digest(video_path))
+    base = meta_path[:-len(".json")]
+    os.makedirs(cache.root, exist_ok=True)
+    np.zeros(frames, dtype="<f4").tofile(base + ".speech.f32")
+    np.zeros((frames, 2), dtype="<f4").tofile(base + ".mix.f32")
+    with open(meta_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "version": 1, "source": video_path, "duration": frames / 44100,
+            "speech": {"sample_rate": 16000, "channels": 1, "dtype": "<f4"},
+            "mix": {"sample_rate": 44100, "channels": 2, "dtype": "<f4"}
+        }, f)
+    return video_path
+
+
+def test_eviction_skips_artifacts_in_use(tmp_path):
+    cache = AudioCache(str(tmp_path / "cache"), max_bytes=1)
+    video = add_entry(cache, tmp_path, "a")
+    artifact = cache.get(video)
+    assert artifact is not None
+
+    with cache.lock:
+        cache._evict()
+    assert all(os.path.exists(path) for path in artifact.files)
+    assert artifact.speech.read(16000, 1).shape == (1000,)
+
+    artifact.close()
+    assert artifact.speech.frames == 0
+    with cache.lock:
+        cache._evict()
+    assert not any(os.path.exists(path) for path in artifact.files)
+
+
+def test_references_are_counted(tmp_path):
+    cache = AudioCache(str(tmp_path / "cache"))
+    video = add_entry(cache, tmp_path, "a")
+    first = cache.get(video)
+    with cache.get(video) as second:
+        assert cache.in_use == {second.meta_path: 2}
+    assert cache.in_use == {first.meta_path: 1}
+    # 重复 close 不会多次释放
+    first.close()
+    first.close()
+    assert cache.in_use == {}
+
+
+def test_forgotten_artifact_is_released_when_collected(tmp_path):
+    cache = AudioCache(str(tmp_path / "cache"))
+    video = add_entry(cache, tmp_path, "a")
+    artifact = cache.get(video)
+    assert cache.in_use
+    del artifact
+    assert cache.in_use == {}
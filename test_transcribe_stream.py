@@ -0,0 +1,63 @@
+import numpy as np
+import pytest
+
+pytest.importorskip("whisper")
+
+import transcribe_stream
+from transcribe_stream import WHISPER_SAMPLE_RATE, transcribe_windowed
+
+
+class StubModel:
+    """按调用顺序返回预设的转录结果，时间为窗口内的秒数"""
+
+    def __init__(self, results):
+        self.results = list(results)
+        self.prompts = []
+
+    def transcribe(self, samples, **options):
+        self.prompts.append(options.get("initial_prompt"))
+        return {"segments": [{"start": start, "end": end, "text": text}
+                             for start, end, text in self.results.pop(0)]}
+
+
+def fake_windows(windows):
+    """替换 iter_audio_windows，按 (起始秒数, 时长秒数) 产出静音窗口"""
+    def iter_windows(path, window_seconds, overlap_seconds):
+        for index, (offset, seconds) in enumerate(windows):
+            samples = np.zeros(int(seconds * WHISPER_SAMPLE_RATE), dtype=np.float32)
+            yield offset, samples, index == len(windows) - 1
+    return iter_windows
+
+
+def test_segment_crossing_window_end_comes_from_next_window(monkeypatch):
+    # 10 秒窗口、4 秒重叠：窗口为 [0, 10)、[6, 16)、[12, 16)
+    monkeypatch.setattr(transcribe_stream, "iter_audio_windows", fake_windows([(0, 10), (6, 10), (12, 4)]))
+    model = StubModel([
+        # 第三句从 7.8 秒开始，被第一个窗口的末尾截断
+        [(0, 3, "第一句"), (3, 7.5, "第二句"), (7.8, 10, "第三句被截断")],
+        # 第二个窗口重新听到第二句的尾巴和完整的第三句，第四句又被截断
+        [(0, 1.5, "第二句尾巴"), (1.8, 5, "第三句完整"), (6.5, 10, "第四句被截断")],
+        [(0.5, 3.5, "第四句完整")],
+    ])
+    progress = []
+    segments = list(transcribe_windowed(model, "video.mp4", {}, window_seconds=10, overlap_seconds=4,
+                                        on_window=progress.append))
+    assert [(seg["start"], seg["end"], seg["text"]) for seg in segments] == [
+        (0, 3, "第一句"),
+        (3, 7.5, "第二句"),
+        (7.8, 11, "第三句完整"),
+        (12.5, 15.5, "第四句完整"),
+    ]
+    assert progress == [7.5, 11, 16]
+    assert model.prompts == [None, "第二句", "第三句完整"]
+
+
+def test_segment_starting_before_next_window_is_kept(monkeypatch):
+    # 第二个窗口从 6 秒开始，听不到 5 秒开始的句子的前半段，只能由第一个窗口保留
+    monkeypatch.setattr(transcribe_stream, "iter_audio_windows", fake_windows([(0, 10), (6, 6)]))
+    model = StubModel([
+        [(0, 4, "第一句"), (5, 9, "第二句")],
+        [(0, 3, "第二句后半段"), (3.5, 5.5, "第三句")],
+    ])
+    segments = list(transcribe_windowed(model, "video.mp4", {}, window_seconds=10, overlap_seconds=4))
+    assert [seg["text"] for seg in segments] == ["第一句", "第二句", "第三句"]
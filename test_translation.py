@@ -0,0 +1,91 @@
+from translation import BatchTranslator, TranslationMemory
+
+
+class StubBackend:
+    """本地翻译桩：逐行加上 [译] 前缀，记录每次请求的文本"""
+    name = "stub"
+    source = "en"
+    target = "zh-CN"
+    max_chars = 4500
+
+    def __init__(self, mangle=None, empty=()):
+        self.requests = []
+        self.mangle = mangle
+        self.empty = set(empty)
+
+    def translate(self, text):
+        self.requests.append(text)
+        lines = text.split("\n")
+        if self.mangle and len(lines) > 1:
+            return self.mangle(lines)
+        if len(lines) == 1 and text in self.empty:
+            return None
+        return "\n".join(f"[译]{line}" for line in lines)
+
+
+def test_batches_lines_into_one_numbered_request():
+    backend = StubBackend()
+    translator = BatchTranslator(backend)
+    assert translator.translate_many(["one", "two", "", "one", "three"]) == [
+        "[译]one", "[译]two", "", "[译]one", "[译]three"
+    ]
+    assert backend.requests == ["[1] one\n[2] two\n[3] three"]
+    assert translator.stats() == {"hits": 0, "misses": 3, "requests": 1}
+
+
+def test_batches_respect_char_budget():
+    backend = StubBackend()
+    translator = BatchTranslator(backend, max_chars=20)
+    texts = ["aaaa", "bbbb", "cccc"]
+    assert translator.translate_many(texts) == [f"[译]{text}" for text in texts]
+    assert all(len(request) <= 20 for request in backend.requests)
+    assert len(backend.requests) == 2
+
+
+def test_full_width_markers_are_accepted():
+    backend = StubBackend(lambda lines: "\n".join(
+        "【" + line[1:].replace("] ", "】", 1) for line in lines
+    ))
+    translator = BatchTranslator(backend)
+    assert translator.translate_many(["one", "two"]) == ["one", "two"]
+    assert translator.requests == 1
+
+
+def test_merged_and_split_lines_fall_back_to_single_requests():
+    # 合并第一、二行并把第三行拆成两行，总行数不变，但行号对不上
+    def mangle(lines):
+        third = lines[2]
+        return "\n".join([lines[0] + " " + lines[1], third[:6], third[6:]] + lines[3:])
+
+    backend = StubBackend(mangle)
+    translator = BatchTranslator(backend)
+    texts = ["first line", "second line", "third line", "fourth line"]
+    assert translator.translate_many(texts) == [f"[译]{text}" for text in texts]
+    assert backend.requests[1:] == texts
+    assert translator.requests == 5
+
+
+def test_memory_serves_second_run(tmp_path):
+    memory = TranslationMemory(str(tmp_path / "memory.db"))
+    texts = ["hello", "world", "hello"]
+    first = BatchTranslator(StubBackend(), memory)
+    assert first.translate_many(texts) == ["[译]hello", "[译]world", "[译]hello"]
+
+    backend = StubBackend()
+    second = BatchTranslator(backend, memory)
+    assert second.translate_many(texts) == ["[译]hello", "[译]world", "[译]hello"]
+    assert backend.requests == []
+    assert second.stats() == {"hits": 2, "misses": 0, "requests": 0}
+    memory.close()
+
+
+def test_empty_translation_is_not_remembered(tmp_path):
+    memory = TranslationMemory(str(tmp_path / "memory.db"))
+    first = BatchTranslator(StubBackend(empty={"hello"}), memory)
+    assert first.translate_many(["hello"]) == [""]
+
+    backend = StubBackend()
+    second = BatchTranslator(backend, memory)
+    assert second.translate_many(["hello"]) == ["[译]hello"]
+    assert backend.requests == ["hello"]
+    memory.close()
@@ -0,0 +1,94 @@
+import asyncio
+import random
+import time
+
+import pytest
+
+from tts_engine import SpeechSynthesizer
+
+
+class FakeCommunicate:
+    """本地假 Communicate，按文本记录调用次数，可指定每句的延迟和前几次失败"""
+    calls = {}
+    failures = {}
+    latency = {}
+    started = []
+
+    def __init__(self, text, voice, rate=None):
+        self.text = text
+
+    async def save(self, path):
+        FakeCommunicate.started.append(time.monotonic())
+        count = FakeCommunicate.calls.get(self.text, 0) + 1
+        FakeCommunicate.calls[self.text] = count
+        await asyncio.sleep(FakeCommunicate.latency.get(self.text, 0))
+        if count <= FakeCommunicate.failures.get(self.text, 0):
+            raise ConnectionError("模拟网络错误")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.text)
+
+
+@pytest.fixture(autouse=True)
+def reset_fake():
+    FakeCommunicate.calls, FakeCommunicate.failures, FakeCommunicate.latency = {}, {}, {}
+    FakeCommunicate.started = []
+
+
+def make_jobs(tmp_path, count):
+    return [(f"第{i}句", str(tmp_path / f"{i}.mp3")) for i in range(count)]
+
+
+def test_results_follow_job_order(tmp_path):
+    jobs = make_jobs(tmp_path, 12)
+    # 越靠前的字幕延迟越长，完成顺序与提交顺序相反
+    FakeCommunicate.latency = {text: 0.002 * (12 - i) for i, (text, _) in enumerate(jobs)}
+    progress = []
+    synthesizer = SpeechSynthesizer("zh-CN-XiaoxiaoNeural", concurrency=4,
+                                    communicate_factory=FakeCommunicate)
+    results = asyncio.run(synthesizer.synthesize(jobs, lambda done, total: progress.append((done, total))))
+    assert results == [path for _, path in jobs]
+    for text, path in jobs:
+        with open(path, encoding="utf-8") as f:
+            assert f.read() == text
+    assert progress[-1] == (12, 12)
+
+
+def test_retries_with_backoff(tmp_path):
+    jobs = make_jobs(tmp_path, 3)
+    FakeCommunicate.failures = {"第1句": 2}
+    synthesizer = SpeechSynthesizer("zh-CN-XiaoxiaoNeural", max_retries=3, backoff_base=0.001,
+                                    communicate_factory=FakeCommunicate)
+    results = asyncio.run(synthesizer.synthesize(jobs))
+    assert results == [path for _, path in jobs]
+    assert FakeCommunicate.calls == {"第0句": 1, "第1句": 3, "第2句": 1}
+
+
+def test_gives_up_after_max_retries(tmp_path):
+    jobs = make_jobs(tmp_path, 3)
+    FakeCommunicate.failures = {"第1句": 5}
+    synthesizer = SpeechSynthesizer("zh-CN-XiaoxiaoNeural", max_retries=2, backoff_base=0.001,
+                                    communicate_factory=FakeCommunicate)
+    with pytest.raises(ConnectionError):
+        asyncio.run(synthesizer.synthesize(jobs))
+    assert FakeCommunicate.calls["第1句"] == 2
+
+
+def test_backoff_delay_grows_and_is_capped():
+    random.seed(0)
+    synthesizer = SpeechSynthesizer("zh-CN-XiaoxiaoNeural", backoff_base=1.0, backoff_max=4.0,
+                                    communicate_factory=FakeCommunicate)
+    for attempt, ceiling in enumerate([1.0, 2.0, 4.0, 4.0, 4.0]):
+        delay = synthesizer._backoff_delay(attempt)
+        assert ceiling / 2 <= delay <= ceiling
+
+
+def test_rate_limit_spaces_requests(tmp_path):
+    # 令牌桶容量等于每秒请求数：前 10 个请求立即发出，其余 5 个每 0.1 秒一个
+    jobs = make_jobs(tmp_path, 15)
+    synthesizer = SpeechSynthesizer("zh-CN-XiaoxiaoNeural", concurrency=15, rate_limit=10,
+                                    communicate_factory=FakeCommunicate)
+    asyncio.run(synthesizer.synthesize(jobs))
+    started = sorted(FakeCommunicate.started)
+    assert len(started) == 15
+    assert started[9] - started[0] < 0.1
+    assert started[-1] - started[0] >= 0.45
@@ -0,0 +1,170 @@
+import asyncio
+import os
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+from audio_mixer import SAMPLE_RATE, audio_duration, decode_audio, write_wav
+from tts_engine import build_rate_string
+
+FIT_MODES = ("rate", "stretch")  # rate: 按字幕重新合成语速，必要时再压缩；stretch: 只做本地时间压缩
+MIN_SPEED = 1.0  # 放慢时不低于正常语速
+MAX_SPEED = 2.5  # Edge TTS 语速上限（+150%）
+MAX_STRETCH = 1.6  # 本地时间压缩的最大倍数，再高音质明显下降
+SLOT_GAP = 0.05  # 与下一条字幕之间保留的间隔（秒）
+
+
+def wsola_stretch(samples, ratio, sample_rate=SAMPLE_RATE, frame_ms=30, tolerance_ms=8):
+    """
+    WSOLA 时间伸缩（保持音高），ratio > 1 表示加速，输出长度约为 len(samples) / ratio
+    每一帧在容差范围内寻找与上一帧自然延续最相似的位置，候选位置的相关性用一次矩阵乘法算出
+    """
+    frame = int(sample_rate * frame_ms / 1000) // 2 * 2
+    hop = frame // 2
+    tolerance = int(sample_rate * tolerance_ms / 1000)
+    if abs(ratio - 1.0) < 1e-3 or len(samples) < frame:
+        return np.array(samples, dtype=np.float32)
+
+    output_frames = int(len(samples) / ratio)
+    count = output_frames // hop + 1
+    padded = np.concatenate([
+        np.zeros(tolerance, dtype=np.float32),
+        np.asarray(samples, dtype=np.float32),
+        np.zeros(2 * tolerance + 2 * frame + int(hop * ratio), dtype=np.float32)
+    ])
+    # (位置, frame) 的只读视图，不复制数据
+    candidates = sliding_window_view(padded, frame)
+    last_index = len(candidates) - 1
+    window = np.hanning(frame + 1)[:-1].astype(np.float32)  # 周期汉宁窗，50% 重叠相加恒为 1
+    output = np.zeros(count * hop + frame, dtype=np.float32)
+    weight = np.zeros_like(output)
+
+    position = tolerance
+    for k in range(count):
+        anchor = tolerance + int(round(k * hop * ratio))
+        if k == 0:
+            best = anchor
+        else:
+            natural = min(position + hop, last_index)
+            low = max(anchor - tolerance, 0)
+            high = min(anchor + tolerance, last_index)
+            scores = candidates[low:high + 1] @ candidates[natural]
+            best = low + int(np.argmax(scores))
+        output[k * hop:k * hop + frame] += candidates[best] * window
+        weight[k * hop:k * hop + frame] += window
+        position = best
+
+    np.divide(output, weight, out=output, where=weight > 1e-3)
+    return output[:output_frames]
+
+
+def slot_lengths(cues, gap=SLOT_GAP):
+    """
+    每条字幕可用的时长：字幕自己的时间段（起始到结束时间），结束时间晚于下一条字幕时截止到下一条开始前 gap 秒
+    :param cues: 按时间排序的 srt_model.Cue
+    """
+    slots = []
+    for i, cue in enumerate(cues):
+        end = cue.end if i + 1 == len(cues) else min(cue.end, cues[i + 1].start - gap)
+        slots.append(max(0.1, end - cue.start))
+    return slots
+
+
+class TimeFitter:
+    """
+    把语音片段适配到各自的字幕时长内
+    rate 模式下按实际时长与可用时长之比为每条字幕选择语速并重新合成（过短的片段也会放慢，
+    但不低于正常语速），重新合成后仍超出时再用 WSOLA 压缩；stretch 模式只做本地压缩，不请求网络
+    :param synthesizer: SpeechSynthesizer，rate 模式下用于重新合成
+    :param tolerance: 时长偏差在该比例内的片段不做调整
+    """
+
+    def __init__(self, synthesizer, speed_rate=1.5, mode="rate", tolerance=0.1, logger=None):
+        if mode not in FIT_MODES:
+            raise ValueError(f"未知的时长适配模式: {mode}，可选: {', '.join(FIT_MODES)}")
+        self.synthesizer = synthesizer
+        self.speed_rate = speed_rate
+        self.mode = mode
+        self.tolerance = tolerance
+        self.logger = logger
+        self.fitted = 0
+        self.adjusted = 0
+        self.resynthesized = 0
+        self.stretched = 0
+        self.overflow = 0
+        self.semaphore = None  # 限制重新合成的并发数，在事件循环内创建
+
+    async def fit_one(self, text, clip, slot, output_path):
+        """
+        适配单条语音（流水线模式下每条语音合成后立即调用）
+        :param slot: 可用时长（秒），None 表示不受限制
+        :param output_path: 用于生成适配后片段的文件名
+        :return: 适配后的片段路径，未调整时为原路径
+        """
+        if self.semaphore is None:
+            self.semaphore = asyncio.Semaphore(self.synthesizer.concurrency)
+        fitted = await self._fit_one(text, clip, slot, output_path)
+        self.fitted += 1
+        if fitted != clip:
+            self.adjusted += 1
+        return fitted
+
+    async def _fit_one(self, text, clip, slot, output_path):
+        if slot is None:
+            return clip
+        loop = asyncio.get_event_loop()
+        # 先只读文件头取得时长，需要时间压缩时才解码
+        duration = await loop.run_in_executor(None, audio_duration, clip)
+        if not duration:
+            return clip
+
+        ratio = duration / slot
+        superseded = []
+        if self.mode == "rate":
+            min_speed = min(MIN_SPEED, self.speed_rate)
+            speed = min(MAX_SPEED, max(min_speed, self.speed_rate * ratio))
+            if abs(speed / self.speed_rate - 1.0) > self.tolerance:
+                superseded.append(clip)
+                async with self.semaphore:
+                    clip = await self.synthesizer.synthesize_one(
+                        text, os.path.splitext(output_path)[0] + "_fit.mp3", build_rate_string(round(speed, 2))
+                    )
+                ratio = await loop.run_in_executor(None, audio_duration, clip) / slot
+                self.resynthesized += 1
+
+        if ratio > 1.0 + self.tolerance / 2:
+            samples = await loop.run_in_executor(None, decode_audio, clip, SAMPLE_RATE, 1)
+            stretch = min(ratio, MAX_STRETCH)
+            if stretch < ratio:
+                self.overflow += 1
+            stretched = await loop.run_in_executor(None, wsola_stretch, samples, stretch)
+            fitted = os.path.splitext(output_path)[0] + "_fit.wav"
+            await loop.run_in_executor(None, write_wav, fitted, stretched)
+            self.stretched += 1
+            superseded.append(clip)
+            clip = fitted
+
+        # 被替换且不在缓存中的片段不再需要
+        cache = self.synthesizer.cache
+        for path in superseded:
+            if path != clip and not (cache and cache.contains(path)) and os.path.exists(path):
+                os.remove(path)
+        return clip
+
+    async def fit(self, jobs):
+        """
+        :param jobs: [(text, clip_path, slot, output_path), ...]，output_path 用于生成适配后片段的文件名
+        :return: 与 jobs 顺序一致的片段路径列表
+        """
+        results = await asyncio.gather(*[
+            self.fit_one(text, clip, slot, output_path) for text, clip, slot, output_path in jobs
+        ])
+        self.log_summary()
+        return results
+
+    def log_summary(self):
+        if self.logger:
+            self.logger.info(
+                f"时长适配: {self.adjusted}/{self.fitted} 条字幕做了调整（重新合成 {self.resynthesized} 条，"
+                f"时间压缩 {self.stretched} 条，仍超出时长 {self.overflow} 条）"
+            )
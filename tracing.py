@@ -0,0 +1,231 @@
+import contextlib
+import contextvars
+import functools
+import inspect
+import json
+import os
+import sys
+import threading
+import time
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+def peak_rss():
+    """进程的峰值常驻内存（字节），无法获取时返回 None"""
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux 上单位是 KB，macOS 上是字节
+        return peak if sys.platform == "darwin" else peak * 1024
+    except ImportError:
+        pass
+    try:
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [("cb", wintypes.DWORD), ("PageFaultCount", wintypes.DWORD),
+                        ("PeakWorkingSetSize", ctypes.c_size_t), ("WorkingSetSize", ctypes.c_size_t),
+                        ("QuotaPeakPagedPoolUsage", ctypes.c_size_t), ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                        ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                        ("PagefileUsage", ctypes.c_size_t), ("PeakPagefileUsage", ctypes.c_size_t)]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        process = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(process, ctypes.byref(counters), counters.cb):
+            return counters.PeakWorkingSetSize
+    except Exception:
+        pass
+    return None
+
+
+def _cpu_seconds():
+    # 包含已结束的子进程（ffmpeg）的 CPU 时间；Windows 上子进程部分为 0
+    times = os.times()
+    return times.user + times.system + times.children_user + times.children_system
+
+
+class Span:
+    """
+    一个计时区间：墙钟时间、CPU 时间（整个进程，并发区间会互相重叠）、
+    结束时进程的峰值内存以及写出的字节数
+    """
+    __slots__ = ("name", "parent", "attrs", "started", "wall", "cpu", "peak_rss", "bytes_written", "_cpu_start")
+
+    def __init__(self, name, parent=None, attrs=None):
+        self.name = name
+        self.parent = parent
+        self.attrs = dict(attrs or {})
+        self.started = time.time()
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak_rss = None
+        self.bytes_written = 0
+        self._cpu_start = _cpu_seconds()
+
+    def add_output(self, path):
+        """记录写出的文件（按文件大小计入写出字节数）"""
+        try:
+            self.bytes_written += os.path.getsize(path)
+        except (OSError, TypeError):
+            pass
+
+    def add_bytes(self, count):
+        self.bytes_written += int(count)
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def finish(self, wall):
+        self.wall = wall
+        self.cpu = _cpu_seconds() - self._cpu_start
+        self.peak_rss = peak_rss()
+
+    def as_dict(self):
+        return {
+            "name": self.name,
+            "parent": self.parent,
+            "started": self.started,
+            "wall_seconds": round(self.wall, 4),
+            "cpu_seconds": round(self.cpu, 4),
+            "peak_rss_bytes": self.peak_rss,
+            "bytes_written": self.bytes_written,
+            "attrs": self.attrs
+        }
+
+
+class Trace:
+    """一次运行的所有计时区间，可以跨线程记录"""
+
+    def __init__(self, name):
+        self.name = name
+        self.started = time.time()
+        self.spans = []
+        self.lock = threading.Lock()
+
+    def add(self, span):
+        with self.lock:
+            self.spans.append(span.as_dict() if isinstance(span, Span) else span)
+
+    def extend(self, spans):
+        """合并其它进程中记录的区间（as_dict 格式）"""
+        with self.lock:
+            self.spans.extend(spans)
+
+    def summary(self):
+        """按区间名汇总：次数、总墙钟时间、总 CPU 时间、最大峰值内存、写出字节数"""
+        rows = {}
+        with self.lock:
+            spans = list(self.spans)
+        for span in spans:
+            row = rows.setdefault(span["name"], {"name": span["name"], "count": 0, "wall_seconds": 0.0,
+                                                 "cpu_seconds": 0.0, "peak_rss_bytes": 0, "bytes_written": 0})
+            row["count"] += 1
+            row["wall_seconds"] += span["wall_seconds"]
+            row["cpu_seconds"] += span["cpu_seconds"]
+            row["peak_rss_bytes"] = max(row["peak_rss_bytes"], span["peak_rss_bytes"] or 0)
+            row["bytes_written"] += span["bytes_written"]
+        return sorted(rows.values(), key=lambda row: -row["wall_seconds"])
+
+    def summary_table(self):
+        lines = [f"{'阶段':<24}{'次数':>6}{'耗时(秒)':>10}{'CPU(秒)':>10}{'峰值内存(MB)':>14}{'写出(MB)':>10}"]
+        for row in self.summary():
+            lines.append(
+                f"{row['name']:<24}{row['count']:>6}{row['wall_seconds']:>10.2f}{row['cpu_seconds']:>10.2f}"
+                f"{row['peak_rss_bytes'] / 1024 ** 2:>14.0f}{row['bytes_written'] / 1024 ** 2:>10.1f}"
+            )
+        return "\n".join(lines)
+
+    def as_dict(self):
+        with self.lock:
+            spans = list(self.spans)
+        return {
+            "name": self.name,
+            "started": self.started,
+            "wall_seconds": round(time.time() - self.started, 3),
+            "summary": self.summary(),
+            "spans": spans
+        }
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.as_dict(), f, ensure_ascii=False, indent=2)
+        return path
+
+
+def report_path_for(output_path):
+    """运行报告保存在输出视频旁边：output/{base}_dubbed.trace.json"""
+    return os.path.splitext(output_path)[0] + ".trace.json"
+
+
+def current_trace():
+    return _current_trace.get()
+
+
+@contextlib.contextmanager
+def activate(trace):
+    """在当前上下文中启用 trace，之后的 span 都记录到其中（asyncio 任务会继承上下文）"""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+
+@contextlib.contextmanager
+def span(name, **attrs):
+    """
+    计时区间；没有启用 trace 时照常执行，只是不记录
+    用法: with span("mix") as s: ...; s.add_output(path)
+    """
+    trace = _current_trace.get()
+    parent = _current_span.get()
+    current = Span(name, parent.name if parent else None, attrs)
+    token = _current_span.set(current)
+    started = time.perf_counter()
+    try:
+        yield current
+    except BaseException as e:
+        current.set(error=type(e).__name__)
+        raise
+    finally:
+        _current_span.reset(token)
+        current.finish(time.perf_counter() - started)
+        if trace is not None:
+            trace.add(current)
+
+
+def traced(name):
+    """把整个函数（普通函数或协程函数）作为一个计时区间"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def record_output(path):
+    """把写出的文件计入当前区间"""
+    current = _current_span.get()
+    if current is not None:
+        current.add_output(path)
+
+
+def run_in_context(func, *args, **kwargs):
+    """返回在当前上下文中调用 func 的函数，供 run_in_executor 使用（线程池默认不继承 contextvars）"""
+    context = contextvars.copy_context()
+    return lambda: context.run(func, *args, **kwargs)
@@ -0,0 +1,177 @@
+import bisect
+
+import numpy as np
+
+from audio_mixer import iter_source
+from model_registry import inference_lock
+
+WHISPER_SAMPLE_RATE = 16000  # Whisper 要求 16kHz 单声道输入
+
+
+def iter_audio_windows(path, window_seconds=300, overlap_seconds=5):
+    """
+    流式读取音频（文件路径由 ffmpeg 解码，16kHz 单声道的 PcmTrack 直接切片），按固定长度切成带重叠的窗口
+    :return: 生成器，产出 (窗口起始秒数, float32 单声道采样, 是否为最后一个窗口)
+    """
+    window_frames = int(window_seconds * WHISPER_SAMPLE_RATE)
+    overlap_frames = int(overlap_seconds * WHISPER_SAMPLE_RATE)
+    step_frames = window_frames - overlap_frames
+    buffer = np.zeros(0, dtype=np.float32)
+    offset_frames = 0
+    for block in iter_source(path, WHISPER_SAMPLE_RATE, 1, WHISPER_SAMPLE_RATE * 10):
+        buffer = np.concatenate([buffer, block[:, 0]])
+        while len(buffer) > window_frames:
+            # 窗口之后还有数据，当前窗口不是最后一个
+            yield offset_frames / WHISPER_SAMPLE_RATE, buffer[:window_frames], False
+            buffer = buffer[step_frames:]
+            offset_frames += step_frames
+    if len(buffer):
+        yield offset_frames / WHISPER_SAMPLE_RATE, buffer, True
+
+
+def transcribe_windowed(model, path, options, window_seconds=300, overlap_seconds=5, on_window=None):
+    """
+    分窗口转录长音频，内存占用与总时长无关
+    相邻窗口重叠 overlap_seconds 秒，按片段边界拼接：重叠区中点之后才结束的片段可能被窗口末尾截断，
+    不在本窗口保留，最后一个保留片段的结束时间作为分界点；下一个窗口丢弃分界点之前结束的片段，
+    跨过分界点的片段由下一个窗口完整转录，避免窗口末尾被截断的句子丢失字幕
+    :param on_window: 每处理完一个窗口调用 on_window(已处理到的秒数)
+    :return: 生成器，逐条产出 {"start", "end", "text"}（时间为原视频时间轴上的秒数）
+    """
+    cut = 0.0
+    last_end = 0.0
+    last_text = ""
+    for offset, samples, is_last in iter_audio_windows(path, window_seconds, overlap_seconds):
+        window_end = offset + len(samples) / WHISPER_SAMPLE_RATE
+        # 下一个窗口的起点和重叠区中点
+        next_offset = window_end - overlap_seconds
+        limit = window_end - overlap_seconds / 2
+        window_options = dict(options)
+        if last_text:
+            # 用上一个窗口的结尾文本作为提示，保持跨窗口的上下文连贯
+            window_options["initial_prompt"] = last_text[-200:]
+        with inference_lock(model):
+            result = model.transcribe(samples, **window_options)
+        for seg in result["segments"]:
+            start = offset + seg["start"]
+            end = min(offset + seg["end"], window_end)
+            if end <= cut:
+                # 上一个窗口已经保留了这段语音
+                continue
+            # 结束较晚且完全落在下一个窗口内的片段交给下一个窗口；
+            # 开始于下一个窗口之前的片段下一个窗口只能听到后半段，仍在本窗口保留
+            if not is_last and end > limit and start >= next_offset:
+                break
+            cut = end
+            text = seg["text"].strip()
+            if not text:
+                continue
+            start = max(start, last_end)
+            end = max(end, start)
+            last_end = end
+            last_text = text
+            yield {"start": start, "end": end, "text": text}
+        if is_last:
+            cut = window_end
+        if on_window:
+            on_window(cut)
+
+
+SPAN_GAP_SECONDS = 0.5  # 拼接语音区间时插入的静音，帮助 Whisper 在区间之间断句
+
+
+def iter_span_groups(path, spans, group_seconds=300):
+    """
+    流式读取音频，只保留语音区间，把相邻区间（中间插入短静音）拼接成不超过 group_seconds 的组
+    :return: 生成器，产出 (float32 采样, [(组内起始秒数, 原始起始秒数, 原始结束秒数), ...])
+    """
+    sample_rate = WHISPER_SAMPLE_RATE
+    group_frames = int(group_seconds * sample_rate)
+    # 超长的区间先拆开，保证每组都不超过 group_seconds
+    bounds = []
+    for start, end in spans:
+        first, last = int(start * sample_rate), int(end * sample_rate)
+        for piece in range(first, last, group_frames):
+            bounds.append((piece, min(piece + group_frames, last)))
+    gap = np.zeros(int(SPAN_GAP_SECONDS * sample_rate), dtype=np.float32)
+
+    pieces, mapping, group_length = [], [], 0
+    current, index, position = [], 0, 0
+
+    def add_span(span, first):
+        nonlocal pieces, mapping, group_length
+        finished = None
+        if group_length and group_length + len(gap) + len(span) > group_frames:
+            finished = (np.concatenate(pieces), mapping)
+            pieces, mapping, group_length = [], [], 0
+        if pieces:
+            pieces.append(gap)
+            group_length += len(gap)
+        mapping.append((group_length / sample_rate, first / sample_rate, (first + len(span)) / sample_rate))
+        pieces.append(span)
+        group_length += len(span)
+        return finished
+
+    for block in iter_source(path, sample_rate, 1, sample_rate * 10):
+        block = block[:, 0]
+        block_end = position + len(block)
+        while index < len(bounds) and bounds[index][0] < block_end:
+            first, last = bounds[index]
+            current.append(block[max(first, position) - position:min(last, block_end) - position])
+            if last > block_end:
+                break
+            finished = add_span(np.concatenate(current), first)
+            if finished:
+                yield finished
+            current = []
+            index += 1
+        position = block_end
+        if index >= len(bounds):
+            break
+    if current:
+        # 音频在区间结束前就结束了
+        finished = add_span(np.concatenate(current), bounds[index][0])
+        if finished:
+            yield finished
+    if pieces:
+        yield np.concatenate(pieces), mapping
+
+
+def remap_time(time, mapping, is_start):
+    """把拼接后音频中的时间映射回原视频时间轴；落在插入静音中的时间归到相邻区间"""
+    i = max(0, bisect.bisect_right([packed for packed, _, _ in mapping], time) - 1)
+    packed_start, start, end = mapping[i]
+    offset = max(0.0, time - packed_start)
+    if offset > end - start:
+        if is_start and i + 1 < len(mapping):
+            return mapping[i + 1][1]
+        return end
+    return start + offset
+
+
+def transcribe_spans(model, path, options, spans, group_seconds=300, on_group=None):
+    """
+    只转录语音区间：区间按组拼接后送入 Whisper，时间戳再映射回原视频时间轴
+    :param spans: [(start, end), ...] 语音区间（秒），见 vad.detect_speech
+    :param on_group: 每处理完一组调用 on_group(已处理到的原始秒数)
+    :return: 生成器，逐条产出 {"start", "end", "text"}
+    """
+    last_end = 0.0
+    last_text = ""
+    for samples, mapping in iter_span_groups(path, spans, group_seconds):
+        group_options = dict(options)
+        if last_text:
+            group_options["initial_prompt"] = last_text[-200:]
+        with inference_lock(model):
+            result = model.transcribe(samples, **group_options)
+        for seg in result["segments"]:
+            text = seg["text"].strip()
+            if not text:
+                continue
+            start = max(remap_time(seg["start"], mapping, True), last_end)
+            end = max(remap_time(seg["end"], mapping, False), start)
+            last_end = end
+            last_text = text
+            yield {"start": start, "end": end, "text": text}
+        if on_group:
+            on_group(mapping[-1][2])
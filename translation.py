@@ -0,0 +1,185 @@
+import os
+import re
+import sqlite3
+import threading
+
+
+class GoogleBackend:
+    """基于 deep_translator 的 Google 翻译后端"""
+    name = "google"
+    max_chars = 4500  # Google 翻译单次请求上限为 5000 字符，留出余量
+
+    def __init__(self, source='en', target='zh-CN'):
+        from deep_translator import GoogleTranslator
+        self.source = source
+        self.target = target
+        self.translator = GoogleTranslator(source=source, target=target)
+
+    def translate(self, text):
+        return self.translator.translate(text) or ""
+
+
+class TranslationMemory:
+    """
+    持久化翻译记忆库 (SQLite)
+    以 (原文, 源语言, 目标语言, 翻译后端) 为键，重复的字幕行和重复处理都不再请求网络
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.conn = None
+        self.lock = threading.Lock()
+
+    def _connect(self):
+        if self.conn is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS memory ("
+                "source_text TEXT NOT NULL, source_lang TEXT NOT NULL, "
+                "target_lang TEXT NOT NULL, backend TEXT NOT NULL, "
+                "translated TEXT NOT NULL, "
+                "PRIMARY KEY (source_text, source_lang, target_lang, backend))"
+            )
+            self.conn.commit()
+        return self.conn
+
+    def get_many(self, texts, source_lang, target_lang, backend):
+        """返回 {原文: 译文}，只包含记忆库中已有的非空条目（旧版本写入的空译文视为未命中，重新翻译）"""
+        found = {}
+        texts = list(texts)
+        with self.lock:
+            conn = self._connect()
+            # SQLite 默认最多 999 个绑定参数，分块查询
+            for start in range(0, len(texts), 500):
+                chunk = texts[start:start + 500]
+                placeholders = ",".join("?" * len(chunk))
+                rows = conn.execute(
+                    f"SELECT source_text, translated FROM memory WHERE source_lang = ? "
+                    f"AND target_lang = ? AND backend = ? AND translated != '' AND source_text IN ({placeholders})",
+                    [source_lang, target_lang, backend] + chunk
+                )
+                found.update(rows.fetchall())
+        return found
+
+    def put_many(self, pairs, source_lang, target_lang, backend):
+        """写入翻译结果；空译文（后端返回 None 或空字符串）不写入，下次运行重新请求"""
+        pairs = [(source, translated) for source, translated in pairs if translated]
+        if not pairs:
+            return
+        with self.lock:
+            conn = self._connect()
+            conn.executemany(
+                "INSERT OR REPLACE INTO memory VALUES (?, ?, ?, ?, ?)",
+                [(source, source_lang, target_lang, backend, translated) for source, translated in pairs]
+            )
+            conn.commit()
+
+    def close(self):
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
+
+class BatchTranslator:
+    """
+    批量翻译层：先查翻译记忆库，未命中的字幕按字符预算打包成一次请求，再拆分回每一行
+    :param backend: 需提供 name、source、target 属性和 translate(text) 方法，测试时可换成本地桩
+    :param memory: TranslationMemory，None 表示不使用翻译记忆
+    :param max_chars: 单次请求的字符预算，默认取后端的 max_chars
+    """
+    separator = "\n"
+    marker = "[{}] "
+    # 译文中的行号标记，兼容后端把方括号换成全角括号或在括号内加空格
+    marker_pattern = re.compile(r"[\[【［]\s*(\d+)\s*[\]】］]\s*")
+
+    def __init__(self, backend, memory=None, max_chars=None):
+        self.backend = backend
+        self.memory = memory
+        self.max_chars = max_chars or getattr(backend, "max_chars", 4500)
+        self.hits = 0
+        self.misses = 0
+        self.requests = 0
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses, "requests": self.requests}
+
+    def _batches(self, texts):
+        batch, size = [], 0
+        for text in texts:
+            extra = len(self.marker.format(len(batch) + 1)) + len(text) + len(self.separator)
+            if batch and size + extra > self.max_chars:
+                yield batch
+                batch, size = [], 0
+                extra = len(self.marker.format(1)) + len(text) + len(self.separator)
+            batch.append(text)
+            size += extra
+        if batch:
+            yield batch
+
+    def _translate_one(self, text):
+        self.requests += 1
+        return (self.backend.translate(text) or "").strip()
+
+    def _split_numbered(self, translated, count):
+        """
+        按行号标记拆分译文，标记缺失、重复或乱序时返回 None
+        :param translated: 后端返回的整段译文
+        :param count: 请求中的行数
+        """
+        lines = [line for line in translated.split(self.separator) if line.strip()]
+        if len(lines) != count:
+            return None
+        parts = []
+        for index, line in enumerate(lines, 1):
+            match = self.marker_pattern.search(line)
+            if match is None or int(match.group(1)) != index:
+                return None
+            part = (line[:match.start()] + line[match.end():]).strip()
+            if not part:
+                return None
+            parts.append(part)
+        return parts
+
+    def _translate_batch(self, batch):
+        # 含换行的文本无法按行拆分，单独翻译
+        if len(batch) == 1 or any(self.separator in text for text in batch):
+            return [self._translate_one(text) for text in batch]
+        self.requests += 1
+        # 每行加上行号标记，后端合并或拆分了某些行时即使总行数不变也能发现错位
+        request = self.separator.join(self.marker.format(index) + text for index, text in enumerate(batch, 1))
+        parts = self._split_numbered(self.backend.translate(request) or "", len(batch))
+        if parts is None:
+            # 行号对不上，无法对齐时逐行翻译
+            return [self._translate_one(text) for text in batch]
+        return parts
+
+    def translate_many(self, texts, cancel_token=None):
+        """
+        翻译文本列表，返回顺序一致的译文列表
+        :param cancel_token: CancelToken，每批请求之前检查暂停和取消（已翻译的批次已写入翻译记忆）
+        """
+        source_lang, target_lang, backend_name = self.backend.source, self.backend.target, self.backend.name
+        unique = list(dict.fromkeys(text for text in texts if text))
+        known = self.memory.get_many(unique, source_lang, target_lang, backend_name) if self.memory else {}
+        missing = [text for text in unique if text not in known]
+        # 命中和未命中都按不重复的原文计数
+        self.hits += len(unique) - len(missing)
+        self.misses += len(missing)
+
+        for batch in self._batches(missing):
+            if cancel_token:
+                cancel_token.check()
+            translated = self._translate_batch(batch)
+            pairs = list(zip(batch, translated))
+            known.update(pairs)
+            if self.memory:
+                self.memory.put_many(pairs, source_lang, target_lang, backend_name)
+
+        return [known[text] if text else "" for text in texts]
+
+    def translate(self, text):
+        return self.translate_many([text])[0]
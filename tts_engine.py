@@ -0,0 +1,187 @@
+import asyncio
+import os
+import random
+import time
+
+from tracing import span
+
+
+def build_rate_string(speed_rate):
+    """把倍速转换为 Edge TTS 的 rate 参数，1.0 倍速返回空字符串"""
+    if speed_rate == 1.0:
+        return ""
+    percentage = int(round((speed_rate - 1.0) * 100))
+    return f"+{percentage}%" if percentage > 0 else f"{percentage}%"
+
+
+class TokenBucket:
+    """令牌桶限速器，rate 为每秒允许发起的请求数"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity else max(1.0, self.rate))
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        # 注意：锁必须在事件循环内创建（Python 3.8 会在构造时绑定事件循环）
+        self.lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class SpeechSynthesizer:
+    """
+    有界并发的语音合成器
+    :param concurrency: 同时进行的合成请求数
+    :param rate_limit: 每秒最多发起的请求数，None 表示不限速
+    :param max_retries: 每条字幕的最大尝试次数
+    :param backoff_base: 指数退避的初始等待时间（秒）
+    :param communicate_factory: 创建 Communicate 对象的工厂，测试时可替换为本地假实现
+    :param cache: ClipCache，命中缓存的字幕不再请求网络
+    :param cancel_token: CancelToken，每条字幕开始合成前检查暂停和取消
+    """
+
+    def __init__(self, voice_id, rate_str="", concurrency=4, rate_limit=None,
+                 max_retries=3, backoff_base=1.0, backoff_max=30.0,
+                 communicate_factory=None, logger=None, cache=None, cancel_token=None):
+        self.voice_id = voice_id
+        self.rate_str = rate_str
+        self.concurrency = max(1, int(concurrency))
+        self.rate_limit = rate_limit
+        self.max_retries = max(1, int(max_retries))
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        if communicate_factory is None:
+            # edge_tts 依赖 aiohttp，导入较慢，只在真正合成时加载
+            from edge_tts import Communicate
+            communicate_factory = Communicate
+        self.communicate_factory = communicate_factory
+        self.logger = logger
+        self.cache = cache
+        self.cancel_token = cancel_token
+        self.bucket = None
+
+    def _info(self, message):
+        if self.logger:
+            self.logger.info(message)
+
+    def _error(self, message):
+        if self.logger:
+            self.logger.error(message)
+
+    def _backoff_delay(self, attempt):
+        # 指数退避加随机抖动，避免所有失败请求同时重试
+        delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+        return delay * (0.5 + random.random() / 2)
+
+    def _get_bucket(self):
+        # 令牌桶在事件循环内首次使用时创建，多个 synthesize 调用共享同一个限速
+        if self.rate_limit and self.bucket is None:
+            self.bucket = TokenBucket(self.rate_limit)
+        return self.bucket
+
+    async def synthesize_one(self, text, output_path, rate_str=None):
+        """
+        合成单条字幕（带缓存、限速和重试），返回输出文件路径
+        :param rate_str: 覆盖本条字幕的语速，None 表示使用合成器的默认语速
+        """
+        return await self._synthesize_one(text, output_path, self._get_bucket(), rate_str)
+
+    async def _synthesize_one(self, text, output_path, bucket, rate_str=None):
+        if self.cancel_token:
+            await self.cancel_token.check_async()
+        rate_str = self.rate_str if rate_str is None else rate_str
+        with span("tts", chars=len(text), rate=rate_str) as tts_span:
+            if self.cache:
+                cached = self.cache.get(text, self.voice_id, rate_str)
+                if cached:
+                    tts_span.set(cached=True)
+                    return cached
+                temp_path = self.cache.temp_path(text, self.voice_id, rate_str)
+                try:
+                    await self._request(text, temp_path, bucket, rate_str)
+                    tts_span.add_output(temp_path)
+                    return self.cache.put(text, self.voice_id, rate_str, temp_path)
+                finally:
+                    if os.path.exists(temp_path):
+                        os.remove(temp_path)
+            await self._request(text, output_path, bucket, rate_str)
+            tts_span.add_output(output_path)
+            return output_path
+
+    async def _request(self, text, output_path, bucket, rate_str):
+        for attempt in range(self.max_retries):
+            try:
+                if bucket:
+                    await bucket.acquire()
+                # 只有当速率不是1.0时才设置rate参数
+                if rate_str:
+                    communicate = self.communicate_factory(text, self.voice_id, rate=rate_str)
+                else:
+                    communicate = self.communicate_factory(text, self.voice_id)
+                await communicate.save(output_path)
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if attempt < self.max_retries - 1:
+                    delay = self._backoff_delay(attempt)
+                    self._info(f"语音生成失败，{delay:.1f}秒后进行第 {attempt + 1}/{self.max_retries - 1} 次重试...")
+                    await asyncio.sleep(delay)
+                else:
+                    self._error(f"语音生成失败: {str(e)}")
+                    self._error(f"Rate字符串: {rate_str or 'None'}")
+                    self._error(f"Voice ID: {self.voice_id}")
+                    self._error(f"文本内容: {text}")
+                    raise
+
+    async def synthesize(self, jobs, on_progress=None):
+        """
+        并发合成语音
+        :param jobs: [(text, output_path), ...]
+        :param on_progress: 每完成一条调用 on_progress(已完成条数, 总条数)
+        :return: 与 jobs 顺序一致的输出文件路径列表，启用缓存时为缓存文件路径
+        """
+        results = [None] * len(jobs)
+        if not jobs:
+            return results
+
+        bucket = self._get_bucket()
+        queue = asyncio.Queue()
+        for index, job in enumerate(jobs):
+            queue.put_nowait((index, job))
+
+        total = len(jobs)
+        done = 0
+
+        async def worker():
+            nonlocal done
+            while True:
+                try:
+                    index, (text, output_path) = queue.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                results[index] = await self._synthesize_one(text, output_path, bucket)
+                done += 1
+                self._info(f"已生成 {done}/{total} 个语音片段...")
+                if on_progress:
+                    on_progress(done, total)
+
+        workers = [asyncio.ensure_future(worker()) for _ in range(min(self.concurrency, total))]
+        try:
+            await asyncio.gather(*workers)
+        except BaseException:
+            # 任意一条字幕最终失败时取消其余任务
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+            raise
+        return results
@@ -0,0 +1,67 @@
+import numpy as np
+
+from audio_mixer import iter_source
+
+VAD_SAMPLE_RATE = 16000
+FRAME_SECONDS = 0.03  # 能量帧长度
+
+
+def frame_energy_db(samples, frame):
+    """按帧计算 RMS 能量（dBFS），末尾不足一帧的采样被忽略"""
+    count = len(samples) // frame
+    frames = samples[:count * frame].reshape(count, frame)
+    rms = np.sqrt(np.mean(frames * frames, axis=1, dtype=np.float64))
+    return 20 * np.log10(rms + 1e-10)
+
+
+def speech_mask(energy_db, margin_db=12.0, floor_db=-50.0):
+    """
+    自适应阈值：以较安静帧的能量（第 10 百分位）作为底噪，高出 margin_db 的帧视为语音
+    阈值不低于 floor_db，避免整段极安静的音频被全部判为语音
+    """
+    if not len(energy_db):
+        return np.zeros(0, dtype=bool)
+    noise = np.percentile(energy_db, 10)
+    return energy_db > max(noise + margin_db, floor_db)
+
+
+def mask_to_spans(mask, frame_seconds=FRAME_SECONDS, duration=None, pad=0.2, min_silence=0.6, min_speech=0.3):
+    """
+    把逐帧的语音标记转换为语音区间
+    :param pad: 区间前后各扩展的秒数，避免切掉词首词尾
+    :param min_silence: 短于该时长的静音不拆分区间
+    :param min_speech: 短于该时长的区间视为噪声丢弃
+    :return: [(start, end), ...]（秒）
+    """
+    edges = np.flatnonzero(np.diff(np.concatenate([[0], mask.astype(np.int8), [0]])))
+    starts = edges[0::2] * frame_seconds - pad
+    ends = edges[1::2] * frame_seconds + pad
+    if not len(starts):
+        return []
+    # 合并间隔过短的相邻区间
+    keep = (starts[1:] - ends[:-1]) >= min_silence
+    starts = starts[np.concatenate([[True], keep])]
+    ends = ends[np.concatenate([keep, [True]])]
+    long_enough = (ends - starts) >= min_speech + 2 * pad
+    starts, ends = starts[long_enough], ends[long_enough]
+    limit = duration if duration is not None else len(mask) * frame_seconds
+    return [(max(0.0, float(start)), min(limit, float(end))) for start, end in zip(starts, ends)]
+
+
+def detect_speech(path, margin_db=12.0, floor_db=-50.0, **span_options):
+    """
+    语音活动检测：流式解码 16kHz 单声道音频并逐块计算帧能量，内存只保留能量序列
+    基于能量，能去掉静音和很安静的片头片尾；响亮的背景音乐仍会被当作语音
+    :param path: 文件路径，或 16kHz 单声道的 audio_cache.PcmTrack
+    :return: (语音区间列表, 音频总时长)
+    """
+    frame = int(VAD_SAMPLE_RATE * FRAME_SECONDS)
+    energies = []
+    total = 0
+    for block in iter_source(path, VAD_SAMPLE_RATE, 1, frame * 1000):
+        energies.append(frame_energy_db(block[:, 0], frame))
+        total += len(block)
+    energy_db = np.concatenate(energies) if energies else np.zeros(0)
+    duration = total / VAD_SAMPLE_RATE
+    mask = speech_mask(energy_db, margin_db, floor_db)
+    return mask_to_spans(mask, FRAME_SECONDS, duration, **span_options), duration